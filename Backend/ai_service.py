@@ -1,54 +1,114 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+import asyncio
 import json
 import re
 from datetime import datetime, timedelta
 import os
+from batch_categorizer import BatchCategorizer
+from rule_classifier import RuleClassifier
+from ml_categorizer import load_default
+from chat_stream import aiter_completion, iter_completion
+from http_transport import guarded_async_http_client, guarded_http_client, loop_local
+from prompt_builder import PromptBuilder, compact_json, compact_text
+
+TRANSACTION_CATEGORIES = {
+    "Food & Dining": "restaurants, cafes, food delivery",
+    "Groceries & Supermarkets": "grocery stores, markets",
+    "Shopping & Retail": "clothing, electronics, general shopping",
+    "Transportation": "gas, uber, parking, public transport",
+    "Entertainment": "movies, games, streaming services",
+    "Bills & Utilities": "electricity, water, internet, phone",
+    "Healthcare & Medical": "hospitals, clinics, pharmacy",
+    "Education": "schools, courses, books",
+    "Travel & Hotels": "flights, hotels, travel agencies",
+    "Banking & Finance": "bank fees, transfers, ATM",
+    "Government & Services": "government fees, official services",
+    "Other": ""
+}
+
+# Bump when either alternatives prompt (here or in app.py) changes, so cached content is regenerated
+ALTERNATIVES_TEMPLATE_VERSION = 'alternatives-v2'
+
+UNCATEGORIZED = {
+    "category": "Other",
+    "merchant": "Unknown",
+    "transaction_type": "unknown",
+    "confidence": 0.0
+}
+# Upper bound on waiting for an OpenAI response (the SDK default is 10 minutes);
+# repeated failures open the 'openai' circuit breaker and calls fail fast
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '30'))
+
+CHAT_ERROR_REPLY = "عذراً، حدث خطأ في النظام. حاول مرة أخرى.\nSorry, there was a system error. Please try again."
 
 class AIFinancialAdvisor:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.client = OpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            timeout=OPENAI_TIMEOUT,
+            http_client=guarded_http_client('openai')
+        )
+        self.batch_categorizer = BatchCategorizer(self.client, TRANSACTION_CATEGORIES)
+        self.rule_classifier = RuleClassifier()
+        self.ml_categorizer = load_default()
+        self.prompt_builder = PromptBuilder()
+        
+    def _categorize_locally(self, description):
+        """Rule or local model result when either is confident, else None"""
+        local = self.rule_classifier.classify(description)
+        if local and local['confidence'] >= self.rule_classifier.min_confidence:
+            return local
+        
+        if self.ml_categorizer:
+            predicted = self.ml_categorizer.classify(description)
+            if predicted['confidence'] >= self.ml_categorizer.min_confidence:
+                return predicted
+        
+        return None
+    
+    def _categorization_request(self, description, amount, currency):
+        category_lines = "\n        ".join(
+            f"- {name} ({hint})" if hint else f"- {name}"
+            for name, hint in TRANSACTION_CATEGORIES.items()
+        )
+        prompt = f"""
+        Categorize this Saudi Arabian transaction and extract merchant information:
+        
+        Description: {description}
+        Amount: {amount} {currency}
+        
+        Categories to choose from:
+        {category_lines}
+        
+        Also extract:
+        - Merchant name (if identifiable)
+        - Transaction type (purchase, withdrawal, transfer, etc.)
         
+        Respond in JSON format:
+        {{
+            "category": "category_name",
+            "merchant": "merchant_name",
+            "transaction_type": "type",
+            "confidence": 0.95
+        }}
+        """
+        
+        return {
+            "model": "gpt-4o-mini",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.2,
+            "max_tokens": 200
+        }
+    
     def categorize_transaction(self, description, amount, currency='SAR'):
-        """Categorize a single transaction using AI"""
+        """Categorize a single transaction, using AI only when no local rule or model is confident"""
+        local = self._categorize_locally(description)
+        if local:
+            return local
+        
         try:
-            prompt = f"""
-            Categorize this Saudi Arabian transaction and extract merchant information:
-            
-            Description: {description}
-            Amount: {amount} {currency}
-            
-            Categories to choose from:
-            - Food & Dining (restaurants, cafes, food delivery)
-            - Groceries & Supermarkets (grocery stores, markets)
-            - Shopping & Retail (clothing, electronics, general shopping)
-            - Transportation (gas, uber, parking, public transport)
-            - Entertainment (movies, games, streaming services)
-            - Bills & Utilities (electricity, water, internet, phone)
-            - Healthcare & Medical (hospitals, clinics, pharmacy)
-            - Education (schools, courses, books)
-            - Travel & Hotels (flights, hotels, travel agencies)
-            - Banking & Finance (bank fees, transfers, ATM)
-            - Government & Services (government fees, official services)
-            - Other
-            
-            Also extract:
-            - Merchant name (if identifiable)
-            - Transaction type (purchase, withdrawal, transfer, etc.)
-            
-            Respond in JSON format:
-            {{
-                "category": "category_name",
-                "merchant": "merchant_name",
-                "transaction_type": "type",
-                "confidence": 0.95
-            }}
-            """
-            
             response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-                max_tokens=200
+                **self._categorization_request(description, amount, currency)
             )
             
             result = json.loads(response.choices[0].message.content)
@@ -56,116 +116,169 @@ class AIFinancialAdvisor:
             
         except Exception as e:
             print(f"Categorization error: {e}")
-            return {
-                "category": "Other",
-                "merchant": "Unknown",
-                "transaction_type": "unknown",
-                "confidence": 0.0
-            }
+            return dict(UNCATEGORIZED)
+    
+    def categorize_transactions(self, transactions):
+        """Categorize many transactions with as few AI calls as possible.
+        
+        ``transactions`` is a list of dicts with id, description, amount and
+        currency. Returns results keyed by transaction id.
+        """
+        return self.batch_categorizer.categorize(transactions)
+    
+    def build_advice_messages(self, user_profile, message_history, current_message, summary=None):
+        """Build the chat messages for a financial advice request within the prompt token budget.
+        
+        Returns ``(messages, first_seq)``; see ``PromptBuilder.build``.
+        """
+        # Prepare user context
+        context = f"""
+        User Financial Profile:
+        - Total Balance: {user_profile.get('total_balance', 0)} SAR
+        - Monthly Income: {user_profile.get('monthly_income', 0)} SAR
+        - Monthly Spending: {user_profile.get('monthly_spending', 0)} SAR
+        - Top Spending Categories: {compact_json(user_profile.get('top_categories', []))}
+        - Recent Transactions: {compact_json(user_profile.get('recent_transactions', []))}
+        - Number of Accounts: {user_profile.get('accounts_count', 0)}
+        - Savings Rate: {user_profile.get('savings_rate', 0)}%
+        """
+        
+        system_prompt = f"""
+        You are Nama'aAI (نماء), an intelligent bilingual (Arabic/English) financial advisor specializing in Saudi Arabian personal finance.
+        
+        Your capabilities:
+        - Provide personalized budgeting advice
+        - Suggest investment opportunities (Saudi market focus)
+        - Analyze spending patterns
+        - Recommend savings strategies
+        - Offer Islamic finance-compliant solutions
+        - Support both Arabic and English languages
+        
+        User Context:
+        {context}
+        
+        Guidelines:
+        - Be conversational and supportive
+        - Provide actionable advice
+        - Consider Saudi cultural context
+        - Include Islamic finance principles when relevant
+        - Be concise but comprehensive
+        - Use emojis appropriately
+        - Respond in the language the user prefers
+        """
+        
+        # Recent history as far as the token budget allows; older turns are in the summary
+        return self.prompt_builder.build(system_prompt, message_history, current_message, summary=summary)
     
-    def generate_financial_advice(self, user_profile, message_history, current_message):
+    def generate_financial_advice(self, user_profile, message_history, current_message, summary=None):
         """Generate personalized financial advice"""
+        messages, _ = self.build_advice_messages(user_profile, message_history, current_message, summary)
+        return self.complete_chat(messages)
+    
+    @staticmethod
+    def _chat_request(messages):
+        return {
+            "model": "gpt-4o-mini",
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": 500
+        }
+    
+    def complete_chat(self, messages):
+        """Run prepared advice messages and return the reply"""
         try:
-            # Prepare user context
-            context = f"""
-            User Financial Profile:
-            - Total Balance: {user_profile.get('total_balance', 0)} SAR
-            - Monthly Income: {user_profile.get('monthly_income', 0)} SAR
-            - Monthly Spending: {user_profile.get('monthly_spending', 0)} SAR
-            - Top Spending Categories: {json.dumps(user_profile.get('top_categories', []), indent=2)}
-            - Recent Transactions: {json.dumps(user_profile.get('recent_transactions', []), indent=2)}
-            - Number of Accounts: {user_profile.get('accounts_count', 0)}
-            - Savings Rate: {user_profile.get('savings_rate', 0)}%
-            """
-            
-            system_prompt = f"""
-            You are Nama'aAI (نماء), an intelligent bilingual (Arabic/English) financial advisor specializing in Saudi Arabian personal finance.
-            
-            Your capabilities:
-            - Provide personalized budgeting advice
-            - Suggest investment opportunities (Saudi market focus)
-            - Analyze spending patterns
-            - Recommend savings strategies
-            - Offer Islamic finance-compliant solutions
-            - Support both Arabic and English languages
-            
-            User Context:
-            {context}
+            response = self.client.chat.completions.create(**self._chat_request(messages))
             
-            Guidelines:
-            - Be conversational and supportive
-            - Provide actionable advice
-            - Consider Saudi cultural context
-            - Include Islamic finance principles when relevant
-            - Be concise but comprehensive
-            - Use emojis appropriately
-            - Respond in the language the user prefers
-            """
-            
-            # Build conversation history
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            # Add recent message history (last 5 exchanges)
-            for msg in message_history[-10:]:
-                messages.append(msg)
-            
-            # Add current message
-            messages.append({"role": "user", "content": current_message})
+            return response.choices[0].message.content
             
+        except Exception as e:
+            print(f"AI advice error: {e}")
+            return CHAT_ERROR_REPLY
+    
+    def stream_chat(self, messages):
+        """Stream the reply to prepared advice messages as text deltas (see chat_stream.iter_completion)"""
+        return iter_completion(self.client, messages)
+    
+    def _summary_request(self, previous_summary, messages):
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        prompt = f"""
+        Update the summary of this financial advice conversation.
+        Keep the user's goals, figures, decisions and open questions; drop pleasantries.
+        Write at most 120 words, in the language of the conversation.
+        
+        Current summary:
+        {previous_summary or "(none)"}
+        
+        New messages:
+        {transcript}
+        """
+        
+        return {
+            "model": "gpt-4o-mini",
+            "messages": [{"role": "user", "content": compact_text(prompt)}],
+            "temperature": 0.2,
+            "max_tokens": 250
+        }
+    
+    def summarize_conversation(self, previous_summary, messages):
+        """Fold ``messages`` into the running conversation summary; returns None on failure"""
+        try:
             response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500
+                **self._summary_request(previous_summary, messages)
             )
             
-            return response.choices[0].message.content
+            return response.choices[0].message.content.strip()
             
         except Exception as e:
-            print(f"AI advice error: {e}")
-            return "عذراً، حدث خطأ في النظام. حاول مرة أخرى.\nSorry, there was a system error. Please try again."
+            print(f"Conversation summary error: {e}")
+            return None
+    
+    def _investment_request(self, user_profile, investment_amount, risk_tolerance):
+        prompt = f"""
+        Create comprehensive investment advice for a Saudi investor:
+        
+        User Profile:
+        - Total Balance: {user_profile.get('total_balance', 0)} SAR
+        - Monthly Income: {user_profile.get('monthly_income', 0)} SAR
+        - Monthly Spending: {user_profile.get('monthly_spending', 0)} SAR
+        - Investment Amount: {investment_amount} SAR
+        - Risk Tolerance: {risk_tolerance}
+        - Age Group: {user_profile.get('age_group', 'adult')}
+        
+        Provide detailed advice including:
+        1. Asset Allocation Recommendations (percentages)
+        2. Specific Investment Options (Saudi-focused):
+           - Tadawul stocks (mention specific sectors)
+           - Islamic funds and sukuk
+           - Real estate investment trusts (REITs)
+           - International diversification options
+        3. Risk Assessment and Mitigation
+        4. Timeline Recommendations
+        5. Expected Returns (realistic estimates)
+        6. Action Steps
+        
+        Consider:
+        - Islamic finance compliance (Sharia-compliant investments)
+        - Saudi Vision 2030 opportunities
+        - Local market conditions
+        - Diversification principles
+        
+        Format as structured advice with clear sections.
+        Use both Arabic and English for key terms.
+        """
+        
+        return {
+            "model": "gpt-4o-mini",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.3,
+            "max_tokens": 800
+        }
     
     def generate_investment_advice(self, user_profile, investment_amount, risk_tolerance):
         """Generate personalized investment advice"""
         try:
-            prompt = f"""
-            Create comprehensive investment advice for a Saudi investor:
-            
-            User Profile:
-            - Total Balance: {user_profile.get('total_balance', 0)} SAR
-            - Monthly Income: {user_profile.get('monthly_income', 0)} SAR
-            - Monthly Spending: {user_profile.get('monthly_spending', 0)} SAR
-            - Investment Amount: {investment_amount} SAR
-            - Risk Tolerance: {risk_tolerance}
-            - Age Group: {user_profile.get('age_group', 'adult')}
-            
-            Provide detailed advice including:
-            1. Asset Allocation Recommendations (percentages)
-            2. Specific Investment Options (Saudi-focused):
-               - Tadawul stocks (mention specific sectors)
-               - Islamic funds and sukuk
-               - Real estate investment trusts (REITs)
-               - International diversification options
-            3. Risk Assessment and Mitigation
-            4. Timeline Recommendations
-            5. Expected Returns (realistic estimates)
-            6. Action Steps
-            
-            Consider:
-            - Islamic finance compliance (Sharia-compliant investments)
-            - Saudi Vision 2030 opportunities
-            - Local market conditions
-            - Diversification principles
-            
-            Format as structured advice with clear sections.
-            Use both Arabic and English for key terms.
-            """
-            
             response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=800
+                **self._investment_request(user_profile, investment_amount, risk_tolerance)
             )
             
             return response.choices[0].message.content
@@ -174,48 +287,58 @@ class AIFinancialAdvisor:
             print(f"Investment advice error: {e}")
             return "Unable to generate investment advice. Please try again."
     
-    def suggest_spending_alternatives(self, category, spending_amount, location="Saudi Arabia"):
-        """Suggest cheaper alternatives for spending categories"""
+    def _alternatives_request(self, category, spending_amount, location, language):
+        prompt = f"""
+        Suggest 5 cost-effective alternatives for the spending category "{category}" in {location}:
+        
+        Current monthly spending: {spending_amount} SAR
+        Preferred language for names: {'Arabic' if language == 'ar' else 'English'}
+        
+        For each alternative, provide:
+        - Name/Service
+        - Description (Arabic and English)
+        - Estimated monthly savings (SAR and percentage)
+        - Type (app, service, store, strategy)
+        - Ease of implementation (1-5 scale)
+        - Availability in Saudi Arabia
+        
+        Focus on:
+        - Local Saudi options
+        - Digital solutions and apps
+        - Practical and realistic alternatives
+        - Cultural appropriateness
+        
+        Format as JSON array:
+        [
+            {{
+                "name": "Alternative Name",
+                "description_en": "English description",
+                "description_ar": "الوصف بالعربية",
+                "estimated_savings_sar": 100,
+                "estimated_savings_percent": 15,
+                "type": "app/service/store/strategy",
+                "ease_score": 4,
+                "availability": "Available nationwide"
+            }}
+        ]
+        """
+        
+        return {
+            "model": "gpt-4o-mini",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.4,
+            "max_tokens": 600
+        }
+    
+    def suggest_spending_alternatives(self, category, spending_amount, location="Saudi Arabia", language='en'):
+        """Suggest cheaper alternatives for spending categories.
+        
+        ``spending_amount`` may be a band such as "500-1000", so the result can
+        be shared by every user in that band (see ALTERNATIVES_TEMPLATE_VERSION).
+        """
         try:
-            prompt = f"""
-            Suggest 5 cost-effective alternatives for the spending category "{category}" in {location}:
-            
-            Current monthly spending: {spending_amount} SAR
-            
-            For each alternative, provide:
-            - Name/Service
-            - Description (Arabic and English)
-            - Estimated monthly savings (SAR and percentage)
-            - Type (app, service, store, strategy)
-            - Ease of implementation (1-5 scale)
-            - Availability in Saudi Arabia
-            
-            Focus on:
-            - Local Saudi options
-            - Digital solutions and apps
-            - Practical and realistic alternatives
-            - Cultural appropriateness
-            
-            Format as JSON array:
-            [
-                {{
-                    "name": "Alternative Name",
-                    "description_en": "English description",
-                    "description_ar": "الوصف بالعربية",
-                    "estimated_savings_sar": 100,
-                    "estimated_savings_percent": 15,
-                    "type": "app/service/store/strategy",
-                    "ease_score": 4,
-                    "availability": "Available nationwide"
-                }}
-            ]
-            """
-            
             response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.4,
-                max_tokens=600
+                **self._alternatives_request(category, spending_amount, location, language)
             )
             
             alternatives = json.loads(response.choices[0].message.content)
@@ -225,70 +348,248 @@ class AIFinancialAdvisor:
             print(f"Alternatives suggestion error: {e}")
             return []
     
+    def _spending_analysis_request(self, transactions, timeframe_days):
+        """Return ``(analysis_data, request)`` for a spending analysis"""
+        # Group transactions by category and merchant
+        category_analysis = {}
+        merchant_analysis = {}
+        daily_spending = {}
+        
+        for trans in transactions:
+            category = trans.get('category', 'Other')
+            merchant = trans.get('merchant', 'Unknown')
+            amount = abs(float(trans.get('amount', 0)))
+            date = trans.get('transaction_date', '')
+            
+            # Category analysis
+            if category not in category_analysis:
+                category_analysis[category] = {'total': 0, 'count': 0, 'transactions': []}
+            category_analysis[category]['total'] += amount
+            category_analysis[category]['count'] += 1
+            category_analysis[category]['transactions'].append(trans)
+            
+            # Merchant analysis
+            if merchant not in merchant_analysis:
+                merchant_analysis[merchant] = {'total': 0, 'count': 0}
+            merchant_analysis[merchant]['total'] += amount
+            merchant_analysis[merchant]['count'] += 1
+            
+            # Daily spending
+            day = date.split('T')[0] if date else 'unknown'
+            if day not in daily_spending:
+                daily_spending[day] = 0
+            daily_spending[day] += amount
+        
+        analysis_data = {
+            'categories': category_analysis,
+            'merchants': merchant_analysis,
+            'daily_spending': daily_spending,
+            'total_transactions': len(transactions),
+            'timeframe_days': timeframe_days
+        }
+        
+        prompt = f"""
+        Analyze this spending data and provide actionable insights:
+        
+        {json.dumps(analysis_data, indent=2)}
+        
+        Provide insights in Arabic and English covering:
+        1. Spending patterns and trends
+        2. Areas for potential savings
+        3. Unusual or concerning patterns
+        4. Recommendations for better financial management
+        5. Budget allocation suggestions
+        
+        Be specific and actionable. Format as structured text with clear sections.
+        """
+        
+        return analysis_data, {
+            "model": "gpt-4o-mini",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.6,
+            "max_tokens": 700
+        }
+    
     def analyze_spending_patterns(self, transactions, timeframe_days=30):
         """Analyze spending patterns and provide insights"""
         try:
-            # Group transactions by category and merchant
-            category_analysis = {}
-            merchant_analysis = {}
-            daily_spending = {}
+            analysis_data, insights_request = self._spending_analysis_request(transactions, timeframe_days)
+            response = self.client.chat.completions.create(**insights_request)
             
-            for trans in transactions:
-                category = trans.get('category', 'Other')
-                merchant = trans.get('merchant', 'Unknown')
-                amount = abs(float(trans.get('amount', 0)))
-                date = trans.get('transaction_date', '')
-                
-                # Category analysis
-                if category not in category_analysis:
-                    category_analysis[category] = {'total': 0, 'count': 0, 'transactions': []}
-                category_analysis[category]['total'] += amount
-                category_analysis[category]['count'] += 1
-                category_analysis[category]['transactions'].append(trans)
-                
-                # Merchant analysis
-                if merchant not in merchant_analysis:
-                    merchant_analysis[merchant] = {'total': 0, 'count': 0}
-                merchant_analysis[merchant]['total'] += amount
-                merchant_analysis[merchant]['count'] += 1
-                
-                # Daily spending
-                day = date.split('T')[0] if date else 'unknown'
-                if day not in daily_spending:
-                    daily_spending[day] = 0
-                daily_spending[day] += amount
+            return {
+                'insights': response.choices[0].message.content,
+                'raw_analysis': analysis_data
+            }
             
-            # Generate insights using AI
-            analysis_data = {
-                'categories': category_analysis,
-                'merchants': merchant_analysis,
-                'daily_spending': daily_spending,
-                'total_transactions': len(transactions),
-                'timeframe_days': timeframe_days
+        except Exception as e:
+            print(f"Spending analysis error: {e}")
+            return {
+                'insights': 'Unable to analyze spending patterns.',
+                'raw_analysis': {}
             }
+    
+    def _budget_request(self, income, current_spending, financial_goals):
+        prompt = f"""
+        Create a comprehensive monthly budget plan for a Saudi resident:
+        
+        Financial Information:
+        - Monthly Income: {income} SAR
+        - Current Monthly Spending: {current_spending} SAR
+        - Financial Goals: {json.dumps(financial_goals, indent=2)}
+        
+        Create a budget following these principles:
+        - 50/30/20 rule adaptation for Saudi context
+        - Islamic finance principles
+        - Emergency fund priority
+        - Practical and achievable targets
+        
+        Provide:
+        1. Detailed budget breakdown by category (SAR and percentages)
+        2. Savings targets and timeline
+        3. Emergency fund recommendations
+        4. Investment allocation suggestions
+        5. Monthly monitoring plan
+        6. Tips for staying on budget
+        
+        Format as structured plan with clear action items.
+        Include both Arabic and English for key terms.
+        """
+        
+        return {
+            "model": "gpt-4o-mini",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.4,
+            "max_tokens": 800
+        }
+    
+    def generate_budget_plan(self, income, current_spending, financial_goals):
+        """Generate a personalized budget plan"""
+        try:
+            response = self.client.chat.completions.create(
+                **self._budget_request(income, current_spending, financial_goals)
+            )
             
-            prompt = f"""
-            Analyze this spending data and provide actionable insights:
+            return response.choices[0].message.content
             
-            {json.dumps(analysis_data, indent=2)}
+        except Exception as e:
+            print(f"Budget planning error: {e}")
+            return "Unable to generate budget plan. Please try again."
+
+
+class AsyncAIFinancialAdvisor(AIFinancialAdvisor):
+    """AIFinancialAdvisor with coroutine methods on ``AsyncOpenAI``.
+
+    Same method names, arguments, prompts and fallbacks, awaited instead of
+    called. Prompt building and the local categorizers are shared with the
+    sync advisor; batch categorization still runs on the sync client, in a
+    thread.
+    """
+    
+    def __init__(self, shared=None):
+        """Reuse the client, categorizers and prompt builder of the sync advisor ``shared``, if given"""
+        if shared is None:
+            super().__init__()
+            return
+        self.client = shared.client
+        self.batch_categorizer = shared.batch_categorizer
+        self.rule_classifier = shared.rule_classifier
+        self.ml_categorizer = shared.ml_categorizer
+        self.prompt_builder = shared.prompt_builder
+    
+    @property
+    def async_client(self):
+        return loop_local('openai', lambda: AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            timeout=OPENAI_TIMEOUT,
+            http_client=guarded_async_http_client('openai')
+        ))
+    
+    async def categorize_transaction(self, description, amount, currency='SAR'):
+        """Categorize a single transaction, using AI only when no local rule or model is confident"""
+        local = self._categorize_locally(description)
+        if local:
+            return local
+        
+        try:
+            response = await self.async_client.chat.completions.create(
+                **self._categorization_request(description, amount, currency)
+            )
             
-            Provide insights in Arabic and English covering:
-            1. Spending patterns and trends
-            2. Areas for potential savings
-            3. Unusual or concerning patterns
-            4. Recommendations for better financial management
-            5. Budget allocation suggestions
+            return json.loads(response.choices[0].message.content)
             
-            Be specific and actionable. Format as structured text with clear sections.
-            """
+        except Exception as e:
+            print(f"Categorization error: {e}")
+            return dict(UNCATEGORIZED)
+    
+    async def categorize_transactions(self, transactions):
+        """Categorize many transactions with as few AI calls as possible (see AIFinancialAdvisor)"""
+        return await asyncio.to_thread(self.batch_categorizer.categorize, transactions)
+    
+    async def generate_financial_advice(self, user_profile, message_history, current_message, summary=None):
+        """Generate personalized financial advice"""
+        messages, _ = self.build_advice_messages(user_profile, message_history, current_message, summary)
+        return await self.complete_chat(messages)
+    
+    async def complete_chat(self, messages):
+        """Run prepared advice messages and return the reply"""
+        try:
+            response = await self.async_client.chat.completions.create(**self._chat_request(messages))
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.6,
-                max_tokens=700
+            return response.choices[0].message.content
+            
+        except Exception as e:
+            print(f"AI advice error: {e}")
+            return CHAT_ERROR_REPLY
+    
+    def stream_chat(self, messages):
+        """Async iterator over the reply's text deltas (see chat_stream.aiter_completion)"""
+        return aiter_completion(self.async_client, messages)
+    
+    async def summarize_conversation(self, previous_summary, messages):
+        """Fold ``messages`` into the running conversation summary; returns None on failure"""
+        try:
+            response = await self.async_client.chat.completions.create(
+                **self._summary_request(previous_summary, messages)
             )
             
+            return response.choices[0].message.content.strip()
+            
+        except Exception as e:
+            print(f"Conversation summary error: {e}")
+            return None
+    
+    async def generate_investment_advice(self, user_profile, investment_amount, risk_tolerance):
+        """Generate personalized investment advice"""
+        try:
+            response = await self.async_client.chat.completions.create(
+                **self._investment_request(user_profile, investment_amount, risk_tolerance)
+            )
+            
+            return response.choices[0].message.content
+            
+        except Exception as e:
+            print(f"Investment advice error: {e}")
+            return "Unable to generate investment advice. Please try again."
+    
+    async def suggest_spending_alternatives(self, category, spending_amount, location="Saudi Arabia", language='en'):
+        """Suggest cheaper alternatives for spending categories"""
+        try:
+            response = await self.async_client.chat.completions.create(
+                **self._alternatives_request(category, spending_amount, location, language)
+            )
+            
+            return json.loads(response.choices[0].message.content)
+            
+        except Exception as e:
+            print(f"Alternatives suggestion error: {e}")
+            return []
+    
+    async def analyze_spending_patterns(self, transactions, timeframe_days=30):
+        """Analyze spending patterns and provide insights"""
+        try:
+            analysis_data, insights_request = self._spending_analysis_request(transactions, timeframe_days)
+            response = await self.async_client.chat.completions.create(**insights_request)
+            
             return {
                 'insights': response.choices[0].message.content,
                 'raw_analysis': analysis_data
@@ -301,44 +602,15 @@ class AIFinancialAdvisor:
                 'raw_analysis': {}
             }
     
-    def generate_budget_plan(self, income, current_spending, financial_goals):
+    async def generate_budget_plan(self, income, current_spending, financial_goals):
         """Generate a personalized budget plan"""
         try:
-            prompt = f"""
-            Create a comprehensive monthly budget plan for a Saudi resident:
-            
-            Financial Information:
-            - Monthly Income: {income} SAR
-            - Current Monthly Spending: {current_spending} SAR
-            - Financial Goals: {json.dumps(financial_goals, indent=2)}
-            
-            Create a budget following these principles:
-            - 50/30/20 rule adaptation for Saudi context
-            - Islamic finance principles
-            - Emergency fund priority
-            - Practical and achievable targets
-            
-            Provide:
-            1. Detailed budget breakdown by category (SAR and percentages)
-            2. Savings targets and timeline
-            3. Emergency fund recommendations
-            4. Investment allocation suggestions
-            5. Monthly monitoring plan
-            6. Tips for staying on budget
-            
-            Format as structured plan with clear action items.
-            Include both Arabic and English for key terms.
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.4,
-                max_tokens=800
+            response = await self.async_client.chat.completions.create(
+                **self._budget_request(income, current_spending, financial_goals)
             )
             
             return response.choices[0].message.content
             
         except Exception as e:
             print(f"Budget planning error: {e}")
-            return "Unable to generate budget plan. Please try again."
\ No newline at end of file
+            return "Unable to generate budget plan. Please try again."
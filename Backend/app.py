@@ -1,13 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
-import requests
 import re
 from openai import OpenAI
 import json
+import asyncio
+import threading
+import time
+import metrics
+from batch_categorizer import BatchCategorizer
+from categorization_cache import CategorizationCache
+from fanout import async_fan_out
+from rule_classifier import RuleClassifier
+from ml_categorizer import load_default
+from pagination import iter_items
+from transaction_ingest import (
+    FULL_SYNC_DAYS, SYNC_OVERLAP, ensure_indexes, ensure_unique_index, ensure_user_column, ingest_stream,
+    remove_duplicate_transactions
+)
+from job_queue import JobQueue, PRIORITY_USER
+from spending_rollups import SpendingRollups
+from chat_stream import SSE_HEADERS, iter_completion, stream_reply
+from financial_context import FinancialContextCache, build_snapshot, recent_transactions_query
+from dashboard import DASHBOARD_HEADERS, build_dashboard, dashboard_etag, dashboard_since
+from prompt_builder import PromptBuilder, compact_json
+from content_cache import ContentCache, content_key, normalize_language
+from ai_service import ALTERNATIVES_TEMPLATE_VERSION
+from semantic_cache import SemanticCache, answer_template
+from http_transport import get_async_transport, get_transport, guarded_http_client, run_async
+from money import Money, ensure_minor_units, money_sum, require_minor_units
+from serialization import STREAM_BATCH_ROWS, json_response, stream_json
+from token_manager import get_token_manager
 
 load_dotenv()
 
@@ -18,8 +45,32 @@ CORS(app)
 
 db = SQLAlchemy(app)
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Initialize OpenAI client; repeated failures open the 'openai' circuit breaker
+# and calls fail fast into the fallbacks instead of waiting on the timeout
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '30'))
+openai_client = OpenAI(
+    api_key=os.getenv('OPENAI_API_KEY'),
+    timeout=OPENAI_TIMEOUT,
+    http_client=guarded_http_client('openai')
+)
+
+TRANSACTION_CATEGORIES = {
+    name: '' for name in [
+        'Food & Dining', 'Shopping', 'Transportation', 'Entertainment',
+        'Bills & Utilities', 'Healthcare', 'Education', 'Travel',
+        'Groceries', 'Gas & Fuel', 'Banking & Finance', 'Other'
+    ]
+}
+transaction_categorizer = BatchCategorizer(openai_client, TRANSACTION_CATEGORIES)
+CATEGORY_ALIASES = {
+    'Groceries & Supermarkets': 'Groceries',
+    'Shopping & Retail': 'Shopping',
+    'Healthcare & Medical': 'Healthcare',
+    'Travel & Hotels': 'Travel',
+    'Government & Services': 'Other'
+}
+rule_classifier = RuleClassifier(category_aliases=CATEGORY_ALIASES)
+ml_categorizer = load_default(category_aliases=CATEGORY_ALIASES)
 
 # Tarabut API configuration
 TARABUT_BASE_URL = "https://api.sau.sandbox.tarabutgateway.io"
@@ -37,22 +88,31 @@ class User(db.Model):
 
 class Account(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     account_id = db.Column(db.String(100), nullable=False)
     account_name = db.Column(db.String(100))
     account_type = db.Column(db.String(50))
     bank_name = db.Column(db.String(100))
     provider_id = db.Column(db.String(10))
-    balance = db.Column(db.Float, default=0.0)
+    balance = db.Column(Money, default=0.0)
     currency = db.Column(db.String(10), default='SAR')
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Transaction(db.Model):
+    __table_args__ = (
+        db.Index('uq_transaction_account_transaction', 'account_id', 'transaction_id', unique=True),
+        # Dashboard and per-account reads, newest first
+        db.Index('ix_transaction_user_date', 'user_id', 'transaction_date'),
+        db.Index('ix_transaction_account_date', 'account_id', 'transaction_date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    # Copied from the account so per-user reads need no join
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     transaction_id = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     currency = db.Column(db.String(10), default='SAR')
     credit_debit = db.Column(db.String(10))
     transaction_date = db.Column(db.DateTime)
@@ -60,171 +120,305 @@ class Transaction(db.Model):
     merchant = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class CategorizationCacheEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(200), unique=True, nullable=False, index=True)
+    category = db.Column(db.String(50))
+    merchant = db.Column(db.String(100))
+    confidence = db.Column(db.Float)
+    hits = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ContentCacheEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    value = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    fresh_until = db.Column(db.DateTime, nullable=False)
+    stale_until = db.Column(db.DateTime, nullable=False, index=True)
+
+class SpendingRollup(db.Model):
+    __tablename__ = 'spending_rollups'
+    __table_args__ = (
+        db.Index('uq_spending_rollups_key', 'user_id', 'account_id', 'day', 'category', 'credit_debit', unique=True),
+        db.Index('ix_spending_rollups_user_day', 'user_id', 'day'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    credit_debit = db.Column(db.String(10), nullable=False)
+    total = db.Column(Money, default=0.0)
+    count = db.Column(db.Integer, default=0)
+    min_amount = db.Column(Money)
+    max_amount = db.Column(Money)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FinancialContextVersion(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SyncJob(db.Model):
+    __table_args__ = (
+        db.Index('ix_sync_job_claim', 'status', 'priority', 'run_at'),
+        # At most one queued or running job per dedup key
+        db.Index(
+            'uq_sync_job_active_dedup', 'dedup_key', unique=True,
+            sqlite_where=db.text("status IN ('queued', 'running')"),
+            postgresql_where=db.text("status IN ('queued', 'running')")
+        ),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    dedup_key = db.Column(db.String(200))
+    user_id = db.Column(db.Integer, index=True)
+    payload = db.Column(db.Text)  # JSON string with handler kwargs
+    priority = db.Column(db.Integer, default=0)
+    status = db.Column(db.String(20), default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow)
+    leased_by = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    result = db.Column(db.Text)  # JSON string
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
 class ChatSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     session_id = db.Column(db.String(100), nullable=False)
-    messages = db.Column(db.Text)  # JSON string
+    messages = db.Column(db.Text)  # Legacy JSON string, moved to chat_message on the next turn
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChatMessage(db.Model):
+    __table_args__ = (
+        db.Index('uq_chat_message_session_seq', 'session_id', 'seq', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    role = db.Column(db.String(20), nullable=False)
+    content = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+tarabut_http = get_transport('tarabut')
+tarabut_tokens = get_token_manager(
+    os.getenv('TARABUT_CLIENT_ID'),
+    os.getenv('TARABUT_CLIENT_SECRET'),
+    TARABUT_TOKEN_URL,
+    customer_user_id='namaai-user'
+)
+
+category_cache = CategorizationCache(db, CategorizationCacheEntry)
+content_cache = ContentCache(db, ContentCacheEntry)
+job_queue = JobQueue(db, SyncJob)
+spending_rollups = SpendingRollups(db, SpendingRollup, Transaction, Account)
+prompt_builder = PromptBuilder()
+semantic_cache = SemanticCache()
+financial_context = FinancialContextCache(
+    db, FinancialContextVersion,
+    lambda user_id: build_snapshot(db, Account, Transaction, spending_rollups, user_id),
+    account_model=Account
+)
+SYNC_STALE_HOURS = float(os.getenv('SYNC_STALE_HOURS', '6'))
+
 def get_tarabut_token():
-    """Get access token from Tarabut API"""
-    try:
-        # Check if environment variables are set
-        client_id = os.getenv('TARABUT_CLIENT_ID')
-        client_secret = os.getenv('TARABUT_CLIENT_SECRET')
-        
-        if not client_id or not client_secret:
-            print("Missing Tarabut credentials in environment variables")
-            return None
-        
-        payload = {
-            "clientId": client_id,
-            "clientSecret": client_secret,
-            "grantType": "client_credentials"
-        }
-        
-        headers = {
-            'Content-Type': 'application/json',
-            'X-TG-CustomerUserId': 'namaai-user'
-        }
-        
-        print(f"Requesting token from: {TARABUT_TOKEN_URL}")
-        print(f"Payload: {json.dumps(payload, indent=2)}")
-        
-        response = requests.post(TARABUT_TOKEN_URL, json=payload, headers=headers)
-        
-        print(f"Token response status: {response.status_code}")
-        print(f"Token response: {response.text}")
-        
-        if response.status_code == 200:
-            return response.json().get('access_token')
-        else:
-            print(f"Token error: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        print(f"Error getting token: {e}")
+    """Get access token from Tarabut API (cached and refreshed ahead of expiry)"""
+    return tarabut_tokens.get_token()
+
+def tarabut_request(method, path, **kwargs):
+    """Call the Tarabut API, retrying once with a new token on 401.
+
+    Returns None when no access token could be obtained.
+    """
+    token = get_tarabut_token()
+    if not token:
         return None
+    
+    url = f"{TARABUT_BASE_URL}{path}"
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'Content-Type': 'application/json'
+    }
+    response = tarabut_http.request(method, url, headers=headers, **kwargs)
+    
+    if response.status_code == 401:
+        tarabut_tokens.invalidate(token)
+        token = get_tarabut_token()
+        if not token:
+            return response
+        headers['Authorization'] = f'Bearer {token}'
+        response = tarabut_http.request(method, url, headers=headers, **kwargs)
+    
+    return response
 
-def categorize_transaction(description, amount):
-    """Categorize transaction using AI"""
-    try:
-        prompt = f"""
-        Categorize this transaction:
-        Description: {description}
-        Amount: {amount} SAR
-        
-        Categories to choose from:
-        - Food & Dining
-        - Shopping
-        - Transportation
-        - Entertainment
-        - Bills & Utilities
-        - Healthcare
-        - Education
-        - Travel
-        - Groceries
-        - Gas & Fuel
-        - Banking & Finance
-        - Other
-        
-        Also extract the merchant name if possible.
-        
-        Respond in JSON format:
-        {{"category": "category_name", "merchant": "merchant_name"}}
-        """
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
-        
-        result = json.loads(response.choices[0].message.content)
-        return result.get('category', 'Other'), result.get('merchant', 'Unknown')
-    except Exception as e:
-        print(f"Categorization error: {e}")
-        return 'Other', 'Unknown'
+async def tarabut_request_async(method, path, **kwargs):
+    """``tarabut_request`` as a coroutine, for the service loop (only a token refresh uses a thread)"""
+    token = tarabut_tokens.peek() or await asyncio.to_thread(get_tarabut_token)
+    if not token:
+        return None
+    
+    url = f"{TARABUT_BASE_URL}{path}"
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'Content-Type': 'application/json'
+    }
+    response = await get_async_transport('tarabut').request(method, url, headers=headers, **kwargs)
+    
+    if response.status_code == 401:
+        tarabut_tokens.invalidate(token)
+        token = await asyncio.to_thread(get_tarabut_token)
+        if not token:
+            return response
+        headers['Authorization'] = f'Bearer {token}'
+        response = await get_async_transport('tarabut').request(method, url, headers=headers, **kwargs)
+    
+    return response
+
+async def fetch_account_balance(account_id):
+    """Fetch one account's balances, raising if Tarabut does not return them"""
+    response = await tarabut_request_async('GET', f"/accountInformation/v2/accounts/{account_id}/balances")
+    if response is None:
+        raise RuntimeError('Failed to get access token')
+    if response.status_code != 200:
+        raise RuntimeError(f"Balance error: {response.status_code}")
+    return response.json()
+
+def fetch_transaction_page(account_id, params, page):
+    """Fetch one page of an account's transactions, or None on failure"""
+    response = tarabut_request(
+        'GET',
+        f"/accountInformation/v2/accounts/{account_id}/transactions",
+        params={**params, 'page': page}
+    )
+    if response is None or response.status_code != 200:
+        return None
+    return response.json()
+
+def categorize_many(items):
+    """Categorize by rules, then the local model, then the cache, batching the rest to the AI"""
+    def from_cache(rest):
+        return category_cache.categorize(rest, transaction_categorizer.categorize)
+    
+    def from_model(rest):
+        if ml_categorizer:
+            return ml_categorizer.categorize(rest, fallback=from_cache)
+        return from_cache(rest)
+    
+    return rule_classifier.categorize(items, fallback=from_model)
+
+# Saves of one chat turn retried when a concurrent turn took the same seqs
+CHAT_SAVE_ATTEMPTS = 3
+
+def append_chat_messages(chat_session, messages):
+    """Append ``(role, content)`` messages to a session, moving any legacy JSON history first"""
+    pending = []
+    if chat_session.messages:
+        for legacy in json.loads(chat_session.messages):
+            timestamp = legacy.get('timestamp')
+            pending.append((legacy.get('role'), legacy.get('content'),
+                            datetime.fromisoformat(timestamp) if timestamp else None))
+        chat_session.messages = None
+    pending.extend((role, content, datetime.utcnow()) for role, content in messages)
+    
+    # Lock the session row (where the database supports it) so a concurrent
+    # turn in the same session numbers its messages after these
+    db.session.query(ChatSession.id).filter(ChatSession.id == chat_session.id).with_for_update().one()
+    last_seq = db.session.query(db.func.max(ChatMessage.seq))\
+        .filter(ChatMessage.session_id == chat_session.id).scalar() or 0
+    for offset, (role, content, created_at) in enumerate(pending, start=1):
+        db.session.add(ChatMessage(
+            session_id=chat_session.id, seq=last_seq + offset,
+            role=role, content=content, created_at=created_at
+        ))
 
 @app.route('/api/providers', methods=['GET'])
 def get_providers():
     """Get available bank providers"""
+    # For demo purposes, return static Saudi bank data if Tarabut fails
+    static_providers = {
+        "providers": [
+            {
+                "providerId": "SNB",
+                "name": "Saudi National Bank",
+                "displayName": "SNB",
+                "logoUrl": "https://tg-external-entities-prod.s3.me-south-1.amazonaws.com/SNB.png",
+                "countryCode": "SAU",
+                "aisStatus": "AVAILABLE",
+                "pisStatus": "UNAVAILABLE"
+            },
+            {
+                "providerId": "SABR-SAU",
+                "name": "Saudi British Bank",
+                "displayName": "SABB",
+                "logoUrl": "https://tg-external-entities-prod.s3.me-south-1.amazonaws.com/SABR-SAU.png",
+                "countryCode": "SAU",
+                "aisStatus": "AVAILABLE",
+                "pisStatus": "AVAILABLE"
+            },
+            {
+                "providerId": "RIBL",
+                "name": "Riyad Bank",
+                "displayName": "Riyad Bank",
+                "logoUrl": "https://tg-external-entities-prod.s3.me-south-1.amazonaws.com/RIBL.png",
+                "countryCode": "SAU",
+                "aisStatus": "AVAILABLE",
+                "pisStatus": "UNAVAILABLE"
+            },
+            {
+                "providerId": "ANBB",
+                "name": "Arab National Bank",
+                "displayName": "ANB",
+                "logoUrl": "https://tg-external-entities-prod.s3.me-south-1.amazonaws.com/ANBB.png",
+                "countryCode": "SAU",
+                "aisStatus": "AVAILABLE",
+                "pisStatus": "UNAVAILABLE"
+            }
+        ]
+    }
+    
     try:
-        # For demo purposes, return static Saudi bank data if Tarabut fails
-        static_providers = {
-            "providers": [
-                {
-                    "providerId": "SNB",
-                    "name": "Saudi National Bank",
-                    "displayName": "SNB",
-                    "logoUrl": "https://tg-external-entities-prod.s3.me-south-1.amazonaws.com/SNB.png",
-                    "countryCode": "SAU",
-                    "aisStatus": "AVAILABLE",
-                    "pisStatus": "UNAVAILABLE"
-                },
-                {
-                    "providerId": "SABR-SAU",
-                    "name": "Saudi British Bank",
-                    "displayName": "SABB",
-                    "logoUrl": "https://tg-external-entities-prod.s3.me-south-1.amazonaws.com/SABR-SAU.png",
-                    "countryCode": "SAU",
-                    "aisStatus": "AVAILABLE",
-                    "pisStatus": "AVAILABLE"
-                },
-                {
-                    "providerId": "RIBL",
-                    "name": "Riyad Bank",
-                    "displayName": "Riyad Bank",
-                    "logoUrl": "https://tg-external-entities-prod.s3.me-south-1.amazonaws.com/RIBL.png",
-                    "countryCode": "SAU",
-                    "aisStatus": "AVAILABLE",
-                    "pisStatus": "UNAVAILABLE"
-                },
-                {
-                    "providerId": "ANBB",
-                    "name": "Arab National Bank",
-                    "displayName": "ANB",
-                    "logoUrl": "https://tg-external-entities-prod.s3.me-south-1.amazonaws.com/ANBB.png",
-                    "countryCode": "SAU",
-                    "aisStatus": "AVAILABLE",
-                    "pisStatus": "UNAVAILABLE"
-                }
-            ]
-        }
-        
-        token = get_tarabut_token()
-        if not token:
+        response = tarabut_request('GET', "/v1/providers")
+        if response is None:
             print("Using static provider data due to token failure")
+            metrics.incr('fallback.providers')
             return jsonify(static_providers)
         
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.get(f"{TARABUT_BASE_URL}/v1/providers", headers=headers)
         if response.status_code == 200:
             return jsonify(response.json())
         else:
             print(f"Providers API error: {response.status_code} - {response.text}")
             print("Falling back to static provider data")
+            metrics.incr('fallback.providers')
             return jsonify(static_providers)
     except Exception as e:
+        # Includes CircuitOpenError: while Tarabut is failing this returns at once
         print(f"Error in get_providers: {e}")
-        # Return static data as fallback
-        return jsonify({
-            "providers": [
-                {
-                    "providerId": "SNB",
-                    "name": "Saudi National Bank",
-                    "displayName": "SNB",
-                    "logoUrl": "",
-                    "countryCode": "SAU",
-                    "aisStatus": "AVAILABLE",
-                    "pisStatus": "UNAVAILABLE"
-                }
-            ]
-        })
+        metrics.incr('fallback.providers')
+        return jsonify(static_providers)
 
 @app.route('/api/register', methods=['POST'])
 def register_user():
@@ -255,10 +449,6 @@ def register_user():
 def create_intent():
     """Create Tarabut intent for bank connection"""
     data = request.get_json()
-    token = get_tarabut_token()
-    
-    if not token:
-        return jsonify({'error': 'Failed to get access token'}), 500
     
     try:
         payload = {
@@ -271,17 +461,15 @@ def create_intent():
             "redirectUrl": data.get('redirectUrl', 'https://namaai.app/callback')
         }
         
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.post(
-            f"{TARABUT_BASE_URL}/accountInformation/v1/intent",
-            json=payload,
-            headers=headers
+        response = tarabut_request(
+            'POST',
+            "/accountInformation/v1/intent",
+            json=payload
         )
         
+        if response is None:
+            return jsonify({'error': 'Failed to get access token'}), 500
+        
         if response.status_code == 200:
             return jsonify(response.json())
         else:
@@ -289,216 +477,217 @@ def create_intent():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Background sync jobs: endpoints enqueue and return stored data, workers call Tarabut and the AI
+@job_queue.handler('sync_accounts')
+def sync_user_accounts(user_id):
+    """Refresh a user's account list and balances from Tarabut"""
+    response = tarabut_request('GET', "/accountInformation/v2/accounts")
+    if response is None:
+        raise RuntimeError('Failed to get access token')
+    if response.status_code != 200:
+        raise RuntimeError(f"Accounts error: {response.status_code}")
+    accounts_data = response.json()
+    
+    if not User.query.get(user_id):
+        return {'accounts': 0}
+    
+    existing_accounts = {
+        acc.account_id: acc for acc in Account.query.filter_by(user_id=user_id).all()
+    }
+    accounts = []
+    for acc_data in accounts_data.get('accounts', []):
+        account = existing_accounts.get(acc_data.get('accountId'))
+        
+        if not account:
+            account = Account(
+                user_id=user_id,
+                account_id=acc_data.get('accountId'),
+                account_name=acc_data.get('accountName'),
+                account_type=acc_data.get('accountType'),
+                bank_name=acc_data.get('bankName'),
+                provider_id=acc_data.get('providerId')
+            )
+            db.session.add(account)
+            existing_accounts[account.account_id] = account
+        accounts.append(account)
+    
+    # Fetch all balances concurrently on the service loop, then apply them in one commit
+    balances, balance_errors = run_async(async_fan_out(
+        fetch_account_balance,
+        [account.account_id for account in accounts],
+        user_key=user_id
+    ))
+    
+    for account in accounts:
+        balance_data = balances.get(account.account_id)
+        if balance_data and balance_data.get('balances'):
+            account.balance = float(balance_data['balances'][0].get('amount', {}).get('value', 0))
+            account.currency = balance_data['balances'][0].get('amount', {}).get('currency', 'SAR')
+            account.last_updated = datetime.utcnow()
+    
+    financial_context.invalidate(user_id)
+    db.session.commit()
+    return {'accounts': len(accounts), 'balanceErrors': balance_errors}
+
+@job_queue.handler('sync_transactions')
+def sync_account_transactions(account_id):
+    """Fetch an account's new transactions from Tarabut, categorize and store them"""
+    account = Account.query.filter_by(account_id=account_id).first()
+    if not account:
+        return {'newTransactions': 0}
+    
+    # Resume from the latest stored booking, with an overlap for late postings
+    end_date = datetime.utcnow()
+    latest = db.session.query(db.func.max(Transaction.transaction_date)).filter_by(account_id=account.id).scalar()
+    start_date = latest - SYNC_OVERLAP if latest else end_date - timedelta(days=FULL_SYNC_DAYS)
+    params = {
+        'fromBookingDateTime': start_date.isoformat() + 'Z',
+        'toBookingDateTime': end_date.isoformat() + 'Z'
+    }
+    
+    new_count = ingest_stream(
+        db, Transaction, account.id,
+        iter_items(lambda page: fetch_transaction_page(account_id, params, page)),
+        categorize=categorize_many,
+        on_chunk=lambda rows: spending_rollups.add(account.user_id, account.id, rows),
+        user_id=account.user_id
+    )
+    account.last_updated = datetime.utcnow()
+    if new_count:
+        financial_context.invalidate(account.user_id)
+    db.session.commit()
+    return {'newTransactions': new_count}
+
+def find_stale_accounts():
+    """Accounts not refreshed within SYNC_STALE_HOURS, for the background scheduler"""
+    cutoff = datetime.utcnow() - timedelta(hours=SYNC_STALE_HOURS)
+    stale = Account.query.filter(
+        db.or_(Account.last_updated.is_(None), Account.last_updated < cutoff)
+    ).limit(100).all()
+    return [
+        ({'account_id': account.account_id}, account.user_id, f"sync_transactions:{account.account_id}")
+        for account in stale
+    ]
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Poll a background sync job"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/api/accounts/<user_id>', methods=['GET'])
 def get_user_accounts(user_id):
-    """Get user accounts with balances"""
-    token = get_tarabut_token()
-    if not token:
-        return jsonify({'error': 'Failed to get access token'}), 500
-    
+    """Get stored accounts with balances and queue a refresh from Tarabut"""
     try:
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Get accounts from Tarabut
-        response = requests.get(f"{TARABUT_BASE_URL}/accountInformation/v2/accounts", headers=headers)
+        job = job_queue.enqueue(
+            'sync_accounts', {'user_id': user_id},
+            user_id=user_id, dedup_key=f"sync_accounts:{user_id}", priority=PRIORITY_USER
+        )
         
-        if response.status_code == 200:
-            accounts_data = response.json()
-            
-            # Store/update accounts in database
-            user = User.query.get(user_id)
-            if user:
-                for acc_data in accounts_data.get('accounts', []):
-                    account = Account.query.filter_by(
-                        user_id=user_id,
-                        account_id=acc_data.get('accountId')
-                    ).first()
-                    
-                    if not account:
-                        account = Account(
-                            user_id=user_id,
-                            account_id=acc_data.get('accountId'),
-                            account_name=acc_data.get('accountName'),
-                            account_type=acc_data.get('accountType'),
-                            bank_name=acc_data.get('bankName'),
-                            provider_id=acc_data.get('providerId')
-                        )
-                        db.session.add(account)
-                    
-                    # Update balance
-                    balance_response = requests.get(
-                        f"{TARABUT_BASE_URL}/accountInformation/v2/accounts/{account.account_id}/balances",
-                        headers=headers
-                    )
-                    
-                    if balance_response.status_code == 200:
-                        balance_data = balance_response.json()
-                        if balance_data.get('balances'):
-                            account.balance = float(balance_data['balances'][0].get('amount', {}).get('value', 0))
-                            account.currency = balance_data['balances'][0].get('amount', {}).get('currency', 'SAR')
-                    
-                    account.last_updated = datetime.utcnow()
-                
-                db.session.commit()
-            
-            return jsonify(accounts_data)
-        else:
-            return jsonify({'error': 'Failed to fetch accounts'}), 500
+        accounts = Account.query.filter_by(user_id=user_id).all()
+        return jsonify({
+            'accounts': [
+                {
+                    'id': account.id,
+                    'accountId': account.account_id,
+                    'accountName': account.account_name,
+                    'accountType': account.account_type,
+                    'bankName': account.bank_name,
+                    'providerId': account.provider_id,
+                    'balance': account.balance,
+                    'currency': account.currency,
+                    'lastUpdated': account.last_updated.isoformat() if account.last_updated else None
+                }
+                for account in accounts
+            ],
+            'jobId': job.id,
+            'jobStatus': job.status
+        }), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/transactions/<account_id>', methods=['GET'])
 def get_account_transactions(account_id):
-    """Get account transactions and categorize them"""
-    token = get_tarabut_token()
-    if not token:
-        return jsonify({'error': 'Failed to get access token'}), 500
-    
+    """Get stored, categorized transactions and queue a sync of new ones"""
     try:
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Get date range (last 3 months)
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=90)
+        account = Account.query.filter_by(account_id=account_id).first()
+        if not account:
+            return jsonify({'error': 'Account not found; load the user\'s accounts first'}), 404
         
-        params = {
-            'fromBookingDateTime': start_date.isoformat() + 'Z',
-            'toBookingDateTime': end_date.isoformat() + 'Z'
-        }
+        job = job_queue.enqueue(
+            'sync_transactions', {'account_id': account_id},
+            user_id=account.user_id, dedup_key=f"sync_transactions:{account_id}", priority=PRIORITY_USER
+        )
         
-        response = requests.get(
-            f"{TARABUT_BASE_URL}/accountInformation/v2/accounts/{account_id}/transactions",
-            headers=headers,
-            params=params
+        # Last 3 months from the database
+        start_date = datetime.utcnow() - timedelta(days=FULL_SYNC_DAYS)
+        # Category totals (debit transactions only), summed in SQL as integer halalas
+        debit_category = db.func.coalesce(Transaction.category, 'Other')
+        category_totals = dict(db.session.query(debit_category, money_sum(Transaction.amount)).filter(
+            Transaction.account_id == account.id,
+            Transaction.transaction_date >= start_date,
+            Transaction.credit_debit == 'Debit'
+        ).group_by(debit_category).all())
+        
+        # Sort categories by spending
+        top_categories = sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:5]
+        
+        # Column tuples, not ORM objects, read in batches while the response is
+        # written; dates are encoded by the serialiser
+        transactions = db.session.query(
+            Transaction.transaction_id, Transaction.description, Transaction.amount, Transaction.currency,
+            Transaction.credit_debit, Transaction.transaction_date, Transaction.category, Transaction.merchant
+        ).filter(
+            Transaction.account_id == account.id,
+            Transaction.transaction_date >= start_date
+        ).order_by(Transaction.transaction_date.desc()).yield_per(STREAM_BATCH_ROWS)
+        
+        processed_transactions = (
+            {
+                'transactionId': transaction_id,
+                'transactionDescription': description,
+                'amount': {'value': amount, 'currency': currency},
+                'creditDebitIndicator': credit_debit,
+                'transactionDateTime': transaction_date,
+                'category': category or 'Other',
+                'merchant': merchant or 'Unknown'
+            }
+            for transaction_id, description, amount, currency, credit_debit, transaction_date, category, merchant
+            in transactions
         )
         
-        if response.status_code == 200:
-            transactions_data = response.json()
-            
-            # Process and categorize transactions
-            processed_transactions = []
-            category_totals = {}
-            
-            for trans in transactions_data.get('transactions', []):
-                description = trans.get('transactionDescription', '')
-                amount = float(trans.get('amount', {}).get('value', 0))
-                
-                # Categorize transaction
-                category, merchant = categorize_transaction(description, amount)
-                
-                # Store in database
-                account = Account.query.filter_by(account_id=account_id).first()
-                if account:
-                    transaction = Transaction(
-                        account_id=account.id,
-                        transaction_id=trans.get('transactionId'),
-                        description=description,
-                        amount=amount,
-                        currency=trans.get('amount', {}).get('currency', 'SAR'),
-                        credit_debit=trans.get('creditDebitIndicator'),
-                        transaction_date=datetime.fromisoformat(trans.get('transactionDateTime', '').replace('Z', '+00:00')),
-                        category=category,
-                        merchant=merchant
-                    )
-                    
-                    db.session.merge(transaction)
-                
-                # Calculate category totals (for debit transactions only)
-                if trans.get('creditDebitIndicator') == 'Debit':
-                    if category not in category_totals:
-                        category_totals[category] = 0
-                    category_totals[category] += amount
-                
-                processed_transactions.append({
-                    **trans,
-                    'category': category,
-                    'merchant': merchant
-                })
-            
-            db.session.commit()
-            
-            # Sort categories by spending
-            top_categories = sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:5]
-            
-            return jsonify({
-                'transactions': processed_transactions,
-                'categoryTotals': dict(category_totals),
-                'topCategories': top_categories
-            })
-        else:
-            return jsonify({'error': 'Failed to fetch transactions'}), 500
+        # Three months of a busy account is streamed as a chunked array
+        return stream_json({
+            'categoryTotals': category_totals,
+            'topCategories': top_categories,
+            'jobId': job.id,
+            'jobStatus': job.status
+        }, 'transactions', processed_transactions, status=202)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/chat/send', methods=['POST'])
-def chat_with_ai():
-    """Chat with AI financial advisor"""
-    data = request.get_json()
-    user_id = data.get('userId')
-    message = data.get('message')
-    session_id = data.get('sessionId', 'default')
+def build_chat_prompt(context):
+    """Build the advisor's system prompt from the user's financial context snapshot"""
+    # Create AI prompt
+    return f"""
+    You are Nama'aAI (نَماء), an intelligent Arabic-English bilingual financial advisor.
     
-    try:
-        # Get user's financial data
-        user = User.query.get(user_id)
-        accounts = Account.query.filter_by(user_id=user_id).all()
-        
-        # Prepare context
-        financial_context = {
-            'total_balance': sum(acc.balance for acc in accounts),
-            'accounts_count': len(accounts),
-            'currency': accounts[0].currency if accounts else 'SAR'
-        }
-        
-        # Get recent transactions for context
-        recent_transactions = []
-        for account in accounts:
-            transactions = Transaction.query.filter_by(account_id=account.id)\
-                .order_by(Transaction.transaction_date.desc())\
-                .limit(10).all()
-            
-            for trans in transactions:
-                recent_transactions.append({
-                    'description': trans.description,
-                    'amount': trans.amount,
-                    'category': trans.category,
-                    'date': trans.transaction_date.isoformat() if trans.transaction_date else None
-                })
-        
-        # Create AI prompt
-        system_prompt = f"""
-        You are Nama'aAI (نَماء), an intelligent Arabic-English bilingual financial advisor.
-        
-        User's Financial Profile:
-        - Total Balance: {financial_context['total_balance']} {financial_context['currency']}
-        - Number of Accounts: {financial_context['accounts_count']}
-        
-        Recent Transactions Context:
-        {json.dumps(recent_transactions[:5], indent=2)}
-        
-        Provide personalized financial advice, budgeting tips, and investment suggestions.
-        Be concise but helpful. Support both Arabic and English.
-        """
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        
-        ai_response = response.choices[0].message.content
-        
-        # Store chat session
+    User's Financial Profile:
+    - Total Balance: {context['total_balance']} {context['currency']}
+    - Number of Accounts: {context['accounts_count']}
+    
+    Recent Transactions Context:
+    {compact_json(context['recent_transactions'])}
+    
+    Provide personalized financial advice, budgeting tips, and investment suggestions.
+    Be concise but helpful. Support both Arabic and English.
+    """
+
+def save_chat_turn(user_id, session_id, message, ai_response):
+    """Append a user message and the assistant's reply to the session (created if needed)"""
+    for attempt in range(CHAT_SAVE_ATTEMPTS):
         chat_session = ChatSession.query.filter_by(
             user_id=user_id,
             session_id=session_id
@@ -507,20 +696,51 @@ def chat_with_ai():
         if not chat_session:
             chat_session = ChatSession(
                 user_id=user_id,
-                session_id=session_id,
-                messages=json.dumps([])
+                session_id=session_id
             )
             db.session.add(chat_session)
+            db.session.flush()
         
-        # Update messages
-        messages = json.loads(chat_session.messages)
-        messages.extend([
-            {"role": "user", "content": message, "timestamp": datetime.utcnow().isoformat()},
-            {"role": "assistant", "content": ai_response, "timestamp": datetime.utcnow().isoformat()}
-        ])
-        chat_session.messages = json.dumps(messages)
+        # Append this turn; earlier messages are not rewritten
+        append_chat_messages(chat_session, [('user', message), ('assistant', ai_response)])
         
-        db.session.commit()
+        try:
+            db.session.commit()
+            return
+        except IntegrityError:
+            # A concurrent turn took the same seqs (SQLite has no row locks): renumber
+            db.session.rollback()
+            if attempt == CHAT_SAVE_ATTEMPTS - 1:
+                raise
+
+@app.route('/api/chat/send', methods=['POST'])
+def chat_with_ai():
+    """Chat with AI financial advisor"""
+    data = request.get_json()
+    user_id = data.get('userId')
+    message = data.get('message')
+    session_id = data.get('sessionId', 'default')
+    
+    try:
+        context = financial_context.get(user_id)
+        
+        # Generic questions may be answered from the semantic cache with this user's figures
+        ai_response = semantic_cache.answer(message, context)
+        if ai_response is None:
+            messages, _ = prompt_builder.build(build_chat_prompt(context), [], message)
+            
+            response = openai_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500
+            )
+            
+            ai_response = response.choices[0].message.content
+            semantic_cache.learn(message, lambda question: answer_template(openai_client, question))
+        
+        # Store chat session
+        save_chat_turn(user_id, session_id, message, ai_response)
         
         return jsonify({
             'response': ai_response,
@@ -530,6 +750,49 @@ def chat_with_ai():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def stream_chat_with_ai():
+    """Chat with AI financial advisor, streaming the reply as Server-Sent Events
+    
+    Emits ``delta`` events as tokens arrive, then a ``done`` event with the
+    full response; the turn is stored when the stream ends.
+    """
+    started = time.perf_counter()
+    data = request.get_json()
+    user_id = data.get('userId')
+    message = data.get('message')
+    session_id = data.get('sessionId', 'default')
+    
+    try:
+        context = financial_context.get(user_id)
+        cached = semantic_cache.answer(message, context)
+        messages, _ = prompt_builder.build(build_chat_prompt(context), [], message)
+        # Release the read transaction before the reply starts streaming
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    if cached is not None:
+        deltas = iter([cached])
+    else:
+        deltas = iter_completion(openai_client, messages)
+        semantic_cache.learn(message, lambda question: answer_template(openai_client, question))
+    
+    def on_complete(ai_response):
+        try:
+            save_chat_turn(user_id, session_id, message, ai_response)
+        except Exception:
+            db.session.rollback()
+            raise
+        return {'sessionId': session_id}
+    
+    return Response(
+        stream_with_context(stream_reply(deltas, on_complete, started=started)),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
 @app.route('/api/investment-advice', methods=['POST'])
 def get_investment_advice():
     """Get personalized investment advice"""
@@ -539,18 +802,10 @@ def get_investment_advice():
     investment_amount = data.get('investmentAmount', 0)
     
     try:
-        # Get user's financial profile
-        user = User.query.get(user_id)
-        accounts = Account.query.filter_by(user_id=user_id).all()
-        total_balance = sum(acc.balance for acc in accounts)
-        
-        # Get spending patterns
-        transactions = db.session.query(Transaction.category, db.func.sum(Transaction.amount))\
-            .filter(Transaction.credit_debit == 'Debit')\
-            .group_by(Transaction.category)\
-            .all()
-        
-        monthly_spending = sum(amount for _, amount in transactions) / 3  # 3 months average
+        # Get user's financial profile from the cached snapshot
+        context = financial_context.get(user_id)
+        total_balance = context['total_balance']
+        monthly_spending = context['average_monthly_spending']  # 3 months average
         
         # Create investment advice prompt
         prompt = f"""
@@ -597,31 +852,111 @@ def get_spending_alternatives(category):
     try:
         # This would integrate with Tivaly API for local alternatives
         # For now, using AI to suggest alternatives
+        language = normalize_language(request.args.get('lang') or request.headers.get('Accept-Language'))
         
-        prompt = f"""
-        Suggest 3-5 cheaper alternatives for the category "{category}" in Saudi Arabia.
-        Focus on local options, apps, or services that could help save money.
-        
-        Format as JSON array with:
-        - name: Alternative name
-        - description: Brief description
-        - estimatedSavings: Percentage savings
-        - type: "app", "service", "store", etc.
-        """
+        def generate():
+            prompt = f"""
+            Suggest 3-5 cheaper alternatives for the category "{category}" in Saudi Arabia.
+            Focus on local options, apps, or services that could help save money.
+            Write names and descriptions in {'Arabic' if language == 'ar' else 'English'}.
+            
+            Format as JSON array with:
+            - name: Alternative name
+            - description: Brief description
+            - estimatedSavings: Percentage savings
+            - type: "app", "service", "store", etc.
+            """
+            
+            response = openai_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.3
+            )
+            
+            return json.loads(response.choices[0].message.content)
         
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
+        # The same for every user, so one generation per category and language is shared
+        alternatives = content_cache.get_or_generate(
+            content_key(ALTERNATIVES_TEMPLATE_VERSION, category, 'any', language), generate
         )
         
-        alternatives = json.loads(response.choices[0].message.content)
-        
         return jsonify({'alternatives': alternatives})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def create_demo_data(user):
+    """Give a user without accounts a demo account with a few transactions (hackathon demo)"""
+    # Create demo account
+    demo_account = Account(
+        user_id=user.id,
+        account_id=f"DEMO_{user.id}",
+        account_name="Demo Account",
+        account_type="current",
+        bank_name="Saudi National Bank",
+        provider_id="SNB",
+        balance=15000.0,
+        currency="SAR"
+    )
+    db.session.add(demo_account)
+    db.session.commit()
+    
+    # Create demo transactions
+    demo_transactions = [
+        {
+            'description': 'Supermarket Purchase',
+            'amount': 250.0,
+            'category': 'Groceries',
+            'credit_debit': 'Debit'
+        },
+        {
+            'description': 'Restaurant Bill',
+            'amount': 180.0,
+            'category': 'Food & Dining',
+            'credit_debit': 'Debit'
+        },
+        {
+            'description': 'Gas Station',
+            'amount': 120.0,
+            'category': 'Transportation',
+            'credit_debit': 'Debit'
+        },
+        {
+            'description': 'Online Shopping',
+            'amount': 350.0,
+            'category': 'Shopping',
+            'credit_debit': 'Debit'
+        },
+        {
+            'description': 'Salary Credit',
+            'amount': 8000.0,
+            'category': 'Income',
+            'credit_debit': 'Credit'
+        }
+    ]
+    
+    demo_rows = []
+    for index, trans_data in enumerate(demo_transactions):
+        transaction = Transaction(
+            account_id=demo_account.id,
+            user_id=user.id,
+            transaction_id=f"DEMO_{index}_{user.id}",
+            description=trans_data['description'],
+            amount=trans_data['amount'],
+            currency='SAR',
+            credit_debit=trans_data['credit_debit'],
+            transaction_date=datetime.now() - timedelta(days=5),
+            category=trans_data['category'],
+            merchant='Demo Merchant'
+        )
+        db.session.add(transaction)
+        demo_rows.append(transaction)
+    
+    spending_rollups.add(user.id, demo_account.id, demo_rows)
+    financial_context.invalidate(user.id)
+    db.session.commit()
+    return demo_account
+
 @app.route('/api/insights/dashboard/<user_id>', methods=['GET'])
 def get_dashboard_data(user_id):
     """Get comprehensive dashboard data"""
@@ -633,100 +968,25 @@ def get_dashboard_data(user_id):
         
         # Get user accounts
         accounts = Account.query.filter_by(user_id=user_id).all()
-        total_balance = sum(acc.balance for acc in accounts) if accounts else 0.0
+        total_balance = db.session.query(money_sum(Account.balance)).filter(Account.user_id == user_id).scalar()
         
         # Generate some demo data for hackathon
         if not accounts:
-            # Create demo account
-            demo_account = Account(
-                user_id=user_id,
-                account_id=f"DEMO_{user_id}",
-                account_name="Demo Account",
-                account_type="current",
-                bank_name="Saudi National Bank",
-                provider_id="SNB",
-                balance=15000.0,
-                currency="SAR"
-            )
-            db.session.add(demo_account)
-            db.session.commit()
-            
-            # Create demo transactions
-            demo_transactions = [
-                {
-                    'description': 'Supermarket Purchase',
-                    'amount': 250.0,
-                    'category': 'Groceries',
-                    'credit_debit': 'Debit'
-                },
-                {
-                    'description': 'Restaurant Bill',
-                    'amount': 180.0,
-                    'category': 'Food & Dining',
-                    'credit_debit': 'Debit'
-                },
-                {
-                    'description': 'Gas Station',
-                    'amount': 120.0,
-                    'category': 'Transportation',
-                    'credit_debit': 'Debit'
-                },
-                {
-                    'description': 'Online Shopping',
-                    'amount': 350.0,
-                    'category': 'Shopping',
-                    'credit_debit': 'Debit'
-                },
-                {
-                    'description': 'Salary Credit',
-                    'amount': 8000.0,
-                    'category': 'Income',
-                    'credit_debit': 'Credit'
-                }
-            ]
-            
-            for trans_data in demo_transactions:
-                transaction = Transaction(
-                    account_id=demo_account.id,
-                    transaction_id=f"DEMO_{len(demo_transactions)}_{user_id}",
-                    description=trans_data['description'],
-                    amount=trans_data['amount'],
-                    currency='SAR',
-                    credit_debit=trans_data['credit_debit'],
-                    transaction_date=datetime.now() - timedelta(days=5),
-                    category=trans_data['category'],
-                    merchant='Demo Merchant'
-                )
-                db.session.add(transaction)
-            
-            db.session.commit()
+            demo_account = create_demo_data(user)
             accounts = [demo_account]
             total_balance = demo_account.balance
         
         # Get spending by category (last 30 days)
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        
-        category_spending = db.session.query(
-            Transaction.category,
-            db.func.sum(Transaction.amount).label('total'),
-            db.func.count(Transaction.id).label('count')
-        ).filter(
-            Transaction.credit_debit == 'Debit',
-            Transaction.transaction_date >= thirty_days_ago
-        ).group_by(Transaction.category).all()
+        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+        category_spending = spending_rollups.by_category(user.id, thirty_days_ago)
         
         # Get recent transactions
-        recent_transactions = Transaction.query\
-            .order_by(Transaction.transaction_date.desc())\
-            .limit(10).all()
+        recent_transactions = recent_transactions_query(Transaction, user.id, 10).all()
         
         # Calculate monthly income and spending
-        monthly_income = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.credit_debit == 'Credit',
-            Transaction.transaction_date >= thirty_days_ago
-        ).scalar() or 0
+        monthly_income = spending_rollups.total(user.id, thirty_days_ago, credit_debit='Credit')
         
-        monthly_spending = sum(float(amount) for _, amount, _ in category_spending)
+        monthly_spending = spending_rollups.total(user.id, thirty_days_ago)
         savings_rate = ((monthly_income - monthly_spending) / monthly_income * 100) if monthly_income > 0 else 0
         
         return jsonify({
@@ -746,15 +1006,15 @@ def get_dashboard_data(user_id):
                 'bank_name': acc.bank_name,
                 'currency': acc.currency
             } for acc in accounts],
-            'monthlyIncome': float(monthly_income),
+            'monthlyIncome': monthly_income,
             'monthlySpending': monthly_spending,
             'savingsRate': max(0, savings_rate),
             'categorySpending': [
                 {
                     'category': cat if cat else 'Other',
-                    'amount': float(amount),
+                    'amount': amount,
                     'count': count,
-                    'percentage': (float(amount) / monthly_spending * 100) if monthly_spending > 0 else 0
+                    'percentage': (amount / monthly_spending * 100) if monthly_spending > 0 else 0
                 }
                 for cat, amount, count in category_spending
             ],
@@ -772,6 +1032,37 @@ def get_dashboard_data(user_id):
         print(f"Dashboard error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/insights/dashboard/<int:user_id>/summary', methods=['GET'])
+def get_dashboard_summary(user_id):
+    """All dashboard widgets from one aggregate query, revalidated with an ETag"""
+    try:
+        since = dashboard_since()
+        etag = dashboard_etag(user_id, financial_context.version(user_id), since)
+        if request.if_none_match.contains(etag):
+            # Nothing changed since the client's copy: one primary-key lookup, no aggregation
+            metrics.incr('dashboard.not_modified')
+            response = Response(status=304, headers=DASHBOARD_HEADERS)
+            response.set_etag(etag)
+            return response
+        
+        dashboard = build_dashboard(db, User, Account, Transaction, SpendingRollup, user_id, since)
+        if dashboard is None:
+            return jsonify({'error': 'User not found'}), 404
+        
+        # Generate some demo data for hackathon
+        if not dashboard['accounts']:
+            create_demo_data(User.query.get(user_id))
+            etag = dashboard_etag(user_id, financial_context.version(user_id), since)
+            dashboard = build_dashboard(db, User, Account, Transaction, SpendingRollup, user_id, since)
+        
+        response = json_response(dashboard, headers=DASHBOARD_HEADERS)
+        response.set_etag(etag)
+        return response
+        
+    except Exception as e:
+        print(f"Dashboard summary error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/debug/create-test-user', methods=['POST'])
 def create_test_user():
     """Create a test user for debugging"""
@@ -818,7 +1109,45 @@ def debug_env():
         'database_url': app.config['SQLALCHEMY_DATABASE_URI']
     })
 
+@app.route('/api/debug/metrics', methods=['GET'])
+def debug_metrics():
+    """Debug endpoint exposing in-process performance metrics"""
+    return jsonify(metrics.snapshot())
+
+# Models with Money columns; stored as integer halalas once migrate_database has run
+MONEY_MODELS = (Account, Transaction, SpendingRollup)
+
+def migrate_database():
+    """Bring an existing database up to the current schema. Safe to run on every start"""
+    db.create_all()
+    # Before the money conversion: on SQLite it rebuilds tables and their indexes
+    remove_duplicate_transactions(db, Transaction)
+    ensure_minor_units(db, *MONEY_MODELS)
+    ensure_user_column(db, Transaction, Account)
+    ensure_unique_index(db, Transaction)
+    ensure_indexes(db, Account, Transaction)
+    spending_rollups.ensure_built()
+
+def require_schema():
+    """Refuse to run against a database that migrate_database has not converted"""
+    require_minor_units(db, *MONEY_MODELS)
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Migrate the database without starting the server: flask --app app migrate"""
+    migrate_database()
+    require_schema()
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        migrate_database()
+        require_schema()
+    
+    # Development: run sync jobs in a thread of the serving process (production uses sync_worker.py)
+    if os.getenv('SYNC_WORKER_EMBEDDED', '1') == '1' and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        def run_embedded_worker():
+            with app.app_context():
+                job_queue.work()
+        threading.Thread(target=run_embedded_worker, daemon=True).start()
+    
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,175 @@
+import json
+import time
+
+import metrics
+
+# Rough local estimate; good enough to keep a batch under the budget
+CHARS_PER_TOKEN = 4
+# Completion tokens reserved per transaction in the response
+OUTPUT_TOKENS_PER_ITEM = 45
+
+DEFAULT_RESULT = {
+    "category": "Other",
+    "merchant": "Unknown",
+    "transaction_type": "unknown",
+    "confidence": 0.0
+}
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class BatchCategorizer:
+    """Categorizes many transactions per chat completion.
+
+    ``categories`` maps category name to a short hint shown to the model.
+    Transactions are packed into prompts up to ``token_budget`` input tokens,
+    each result is validated individually and only the items that failed
+    validation are sent again in a single retry call.
+    """
+
+    def __init__(self, client, categories, model="gpt-4o-mini", token_budget=3000, max_items=60):
+        self.client = client
+        self.categories = categories
+        self.model = model
+        self.token_budget = token_budget
+        self.max_items = max_items
+        self._category_lookup = {name.lower(): name for name in categories}
+
+        metrics.register_gauge('ai.categorize.throughput_tps', self.throughput)
+
+    def categorize(self, transactions):
+        """Categorize ``transactions`` (dicts with id, description, amount, currency).
+
+        Returns a dict mapping each transaction id to
+        ``{category, merchant, transaction_type, confidence}``. Items the model
+        could not categorize fall back to "Other" with confidence 0.0.
+        """
+        items = {str(trans['id']): trans for trans in transactions}
+        if not items:
+            return {}
+
+        start = time.perf_counter()
+        results = self._run(items)
+
+        failed = {item_id: items[item_id] for item_id in items if item_id not in results}
+        if failed:
+            metrics.incr('ai.categorize.retried_items', len(failed))
+            results.update(self._run(failed))
+
+        for item_id in items:
+            if item_id not in results:
+                metrics.incr('ai.categorize.failed_items')
+                results[item_id] = dict(DEFAULT_RESULT)
+
+        metrics.observe('ai.categorize.batch', time.perf_counter() - start)
+        metrics.incr('ai.categorize.transactions', len(items))
+        return results
+
+    def _run(self, items):
+        results = {}
+        for batch in self._pack(items):
+            results.update(self._categorize_batch(batch))
+        return results
+
+    def _pack(self, items):
+        """Split items into batches that fit the token budget"""
+        base_tokens = estimate_tokens(self._prompt([]))
+        batch, used = [], base_tokens
+        for item_id, trans in items.items():
+            line = self._item_line(item_id, trans)
+            cost = estimate_tokens(line) + OUTPUT_TOKENS_PER_ITEM
+            if batch and (used + cost > self.token_budget or len(batch) >= self.max_items):
+                yield batch
+                batch, used = [], base_tokens
+            batch.append((item_id, line))
+            used += cost
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _item_line(item_id, trans):
+        return json.dumps({
+            "id": item_id,
+            "description": trans.get('description', ''),
+            "amount": trans.get('amount', 0),
+            "currency": trans.get('currency', 'SAR')
+        }, ensure_ascii=False, separators=(',', ':'))
+
+    def _prompt(self, lines):
+        category_lines = "\n".join(
+            f"- {name} ({hint})" if hint else f"- {name}"
+            for name, hint in self.categories.items()
+        )
+        transaction_lines = "\n".join(lines)
+        return f"""Categorize each Saudi Arabian bank transaction below and extract merchant information.
+
+Categories to choose from (use the exact name):
+{category_lines}
+
+Transactions, one JSON object per line:
+{transaction_lines}
+
+Respond with a JSON object containing exactly one result per transaction id:
+{{"results": [{{"id": "0", "category": "category_name", "merchant": "merchant_name", "transaction_type": "purchase", "confidence": 0.95}}]}}"""
+
+    def _categorize_batch(self, batch):
+        ids = {item_id for item_id, _ in batch}
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": self._prompt([line for _, line in batch])}],
+                temperature=0.2,
+                max_tokens=OUTPUT_TOKENS_PER_ITEM * len(batch) + 100,
+                response_format={"type": "json_object"}
+            )
+        except Exception as e:
+            print(f"Batch categorization error: {e}")
+            metrics.incr('ai.categorize.errors')
+            return {}
+
+        metrics.incr('ai.categorize.requests')
+        usage = getattr(response, 'usage', None)
+        if usage:
+            metrics.incr('ai.categorize.prompt_tokens', usage.prompt_tokens)
+            metrics.incr('ai.categorize.completion_tokens', usage.completion_tokens)
+
+        try:
+            payload = json.loads(response.choices[0].message.content)
+            entries = payload.get('results', []) if isinstance(payload, dict) else payload
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"Batch categorization parse error: {e}")
+            return {}
+
+        results = {}
+        for entry in entries if isinstance(entries, list) else []:
+            item_id, result = self._validate(entry)
+            if item_id in ids:
+                results[item_id] = result
+        return results
+
+    def _validate(self, entry):
+        """Return ``(id, result)`` for a well-formed entry, else ``(None, None)``"""
+        if not isinstance(entry, dict):
+            return None, None
+
+        category = self._category_lookup.get(str(entry.get('category', '')).strip().lower())
+        if category is None:
+            return None, None
+
+        try:
+            confidence = min(max(float(entry.get('confidence', 0.5)), 0.0), 1.0)
+        except (TypeError, ValueError):
+            confidence = 0.5
+
+        return str(entry.get('id')), {
+            "category": category,
+            "merchant": str(entry.get('merchant') or 'Unknown'),
+            "transaction_type": str(entry.get('transaction_type') or 'unknown'),
+            "confidence": confidence
+        }
+
+    @staticmethod
+    def throughput():
+        """Categorized transactions per second of batch categorization time"""
+        elapsed = metrics.get_timing('ai.categorize.batch')['total']
+        return metrics.get_counter('ai.categorize.transactions') / elapsed if elapsed else 0.0
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Async Throughput Benchmark
+Simulates concurrent users, each loading their account balances page after
+page, against a local fake Tarabut API with fixed latency (in a separate
+process). Compares the sync TarabutService served by a fixed number of
+worker threads (like gunicorn sync workers) with AsyncTarabutService on a
+single event loop. Latency includes waiting for a free worker. No external
+calls are made.
+
+Usage:
+    python benchmarks/bench_async_throughput.py
+    python benchmarks/bench_async_throughput.py --users 200 --workers 8 --latency 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TARABUT_CLIENT_ID', 'bench')
+os.environ.setdefault('TARABUT_CLIENT_SECRET', 'bench')
+os.environ.setdefault('TARABUT_HTTP_POOL_SIZE', '64')
+os.environ.setdefault('TARABUT_HTTP_MAX_RETRIES', '0')
+
+from http_transport import close_loop_local
+from tarabut_service import AsyncTarabutService, TarabutService
+from token_manager import get_token_manager
+
+TOKEN_BODY = json.dumps({'access_token': 'bench-token', 'expires_in': 3600}).encode()
+BALANCE_BODY = json.dumps({'balances': [{'amount': {'value': '1250.00', 'currency': 'SAR'}}]}).encode()
+
+async def handle_connection(reader, writer, latency):
+    """Minimal keep-alive HTTP/1.1 responder: a token for POSTs, a balance for GETs"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            length = 0
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = header.decode().partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            if length:
+                await reader.readexactly(length)
+
+            await asyncio.sleep(latency)
+            body = TOKEN_BODY if request_line.startswith(b'POST') else BALANCE_BODY
+            writer.write(
+                b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+def serve(latency, ports):
+    """Fake Tarabut API, run in its own process so it does not compete for the GIL"""
+    async def main():
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_connection(reader, writer, latency), '127.0.0.1', 0, backlog=1024
+        )
+        ports.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+    asyncio.run(main())
+
+def start_server(latency):
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(latency, ports), daemon=True)
+    server.start()
+    return server, f"http://127.0.0.1:{ports.get(timeout=10)}"
+
+def point_at(service, base_url):
+    service.base_url = base_url
+    service.token_manager = get_token_manager(
+        service.client_id, service.client_secret, f"{base_url}/token", customer_user_id='bench'
+    )
+    return service
+
+def accounts_of(user, accounts):
+    return [f"acc-{user}-{n}" for n in range(accounts)]
+
+def run_sync(base_url, users, pages, accounts, workers):
+    """Each user loads pages one after another; ``workers`` threads serve them"""
+    service = point_at(TarabutService(), base_url)
+    service.get_access_token()
+    worker_slots = threading.BoundedSemaphore(workers)
+    latencies = []
+    errors = []
+
+    def user(user_id):
+        account_ids = accounts_of(user_id, accounts)
+        for _ in range(pages):
+            requested = time.perf_counter()
+            with worker_slots:
+                _, failed = service.get_account_balances(account_ids, user_key=user_id)
+            latencies.append(time.perf_counter() - requested)
+            errors.append(len(failed))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(user, range(users)))
+    return time.perf_counter() - start, latencies, sum(errors)
+
+async def run_async(base_url, users, pages, accounts):
+    """Each user loads pages one after another, all on one event loop"""
+    service = point_at(AsyncTarabutService(), base_url)
+    await service.get_access_token()
+    latencies = []
+    errors = []
+
+    async def user(user_id):
+        account_ids = accounts_of(user_id, accounts)
+        for _ in range(pages):
+            requested = time.perf_counter()
+            _, failed = await service.get_account_balances(account_ids, user_key=user_id)
+            latencies.append(time.perf_counter() - requested)
+            errors.append(len(failed))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(user_id) for user_id in range(users)))
+    elapsed = time.perf_counter() - start
+    await close_loop_local()
+    return elapsed, latencies, sum(errors)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sync and async Tarabut throughput")
+    parser.add_argument('--users', type=int, default=100, help="Concurrent users")
+    parser.add_argument('--pages', type=int, default=3, help="Page loads per user")
+    parser.add_argument('--accounts', type=int, default=4, help="Balance calls per page load")
+    parser.add_argument('--workers', type=int, default=8, help="Sync worker threads")
+    parser.add_argument('--latency', type=float, default=0.2, help="Fake API latency (s)")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.latency)
+    loads = args.users * args.pages
+    calls = loads * args.accounts
+
+    def describe(label, elapsed, latencies, errors):
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{label:<22} {loads / elapsed:8.1f} pages/s  {calls / elapsed:8.1f} calls/s  "
+              f"p50 {statistics.median(latencies) * 1000:6.0f} ms  p95 {p95 * 1000:6.0f} ms  errors {errors}")
+        return loads / elapsed
+
+    print(f"{args.users} users x {args.pages} page loads x {args.accounts} balance calls, "
+          f"{args.latency * 1000:.0f} ms API latency")
+    sync_rate = describe(
+        f"Sync ({args.workers} workers)",
+        *run_sync(base_url, args.users, args.pages, args.accounts, args.workers)
+    )
+    async_rate = describe(
+        "Async (1 event loop)",
+        *asyncio.run(run_async(base_url, args.users, args.pages, args.accounts))
+    )
+    print(f"Speedup:               {async_rate / sync_rate:.1f}x")
+    server.terminate()
+
+if __name__ == '__main__':
+    main()
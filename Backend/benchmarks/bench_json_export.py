@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Transaction Export Serialisation Benchmark
+Seeds an in-memory SQLite database with one account and measures the CPU
+time of one full JSON export of its transactions: the previous path (ORM
+objects, ``to_dict`` with an ``isoformat()`` per date, Flask ``jsonify``)
+against column tuples encoded by ``serialization.dumps``, with orjson and
+with the stdlib fallback, and as the streamed chunked array. Each response
+body is checked to decode to the same rows.
+
+Usage:
+    python benchmarks/bench_json_export.py
+    python benchmarks/bench_json_export.py --transactions 50000 --repeat 9
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from sqlalchemy import select
+
+import serialization
+from models import Account, Transaction, User, db
+from serialization import columns, dumps, row_dicts, stream_json
+
+CATEGORIES = ['Groceries', 'Dining', 'Transport', 'Utilities', 'Shopping', None]
+MERCHANTS = ['Panda', 'Careem', 'Jarir', 'STC', 'Al Baik', None]
+
+def seed(transactions, rng):
+    db.session.add(User(id=1, customer_user_id='bench', first_name='Bench', last_name='User', email='b@example.com'))
+    db.session.add(Account(id=1, user_id=1, account_id='acc-1'))
+    now = datetime.utcnow()
+    db.session.bulk_insert_mappings(Transaction, [
+        {'account_id': 1, 'user_id': 1, 'transaction_id': f"t-{n}", 'description': f"Card purchase {n}",
+         'amount': round(rng.uniform(1, 900), 2), 'credit_debit': rng.choice(['Debit', 'Debit', 'Credit']),
+         'category': rng.choice(CATEGORIES), 'merchant': rng.choice(MERCHANTS),
+         'transaction_date': now - timedelta(minutes=n * 7), 'confidence_score': rng.random()}
+        for n in range(transactions)
+    ])
+    db.session.commit()
+
+def legacy_to_dict(trans):
+    """``Transaction.to_dict`` as it was written field by field"""
+    return {
+        'id': trans.id,
+        'transaction_id': trans.transaction_id,
+        'description': trans.description,
+        'amount': trans.amount,
+        'currency': trans.currency,
+        'credit_debit': trans.credit_debit,
+        'transaction_date': trans.transaction_date.isoformat() if trans.transaction_date else None,
+        'category': trans.category,
+        'subcategory': trans.subcategory,
+        'merchant': trans.merchant,
+        'merchant_category': trans.merchant_category,
+        'is_recurring': trans.is_recurring,
+        'is_essential': trans.is_essential,
+        'confidence_score': trans.confidence_score
+    }
+
+def ordered():
+    return (Transaction.transaction_date.desc(), Transaction.id.desc())
+
+def orm_jsonify():
+    transactions = Transaction.query.filter_by(account_id=1).order_by(*ordered()).all()
+    body = jsonify({'transactions': [legacy_to_dict(trans) for trans in transactions]}).get_data()
+    db.session.expunge_all()
+    return body
+
+def tuples_dumps():
+    rows = db.session.connection().execute(
+        select(*columns(Transaction, Transaction.JSON_FIELDS)).where(Transaction.account_id == 1).order_by(*ordered())
+    ).all()
+    return dumps({'transactions': list(row_dicts(rows, Transaction.JSON_FIELDS))})
+
+def tuples_streamed():
+    rows = db.session.connection().execute(
+        select(*columns(Transaction, Transaction.JSON_FIELDS)).where(Transaction.account_id == 1).order_by(*ordered())
+        .execution_options(yield_per=serialization.STREAM_BATCH_ROWS)
+    )
+    response = stream_json({}, 'transactions', row_dicts(rows, Transaction.JSON_FIELDS))
+    return b''.join(response.response)
+
+def cpu_ms(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        run()
+        samples.append(time.process_time() - start)
+    return statistics.median(samples) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON export paths by CPU time per response")
+    parser.add_argument('--transactions', type=int, default=10000, help="Transactions in the export")
+    parser.add_argument('--repeat', type=int, default=7, help="Timed runs per path")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.test_request_context():
+        db.create_all()
+        seed(args.transactions, random.Random(5))
+        orjson_module = serialization.orjson
+
+        def stdlib_dumps():
+            serialization.orjson = None
+            try:
+                return tuples_dumps()
+            finally:
+                serialization.orjson = orjson_module
+
+        paths = [('ORM + to_dict + jsonify', orm_jsonify)]
+        if orjson_module is not None:
+            paths += [('tuples + orjson', tuples_dumps), ('tuples + orjson, streamed', tuples_streamed)]
+        else:
+            print("orjson is not installed; only the stdlib fallback is measured")
+        paths.append(('tuples + stdlib fallback', stdlib_dumps))
+
+        expected = json.loads(orm_jsonify())
+        for name, run in paths[1:]:
+            assert json.loads(run()) == expected, f"{name} does not encode the same rows"
+
+        print(f"{args.transactions} transactions per export; median CPU time of {args.repeat} runs\n")
+        baseline = None
+        for name, run in paths:
+            elapsed = cpu_ms(run, args.repeat)
+            baseline = baseline or elapsed
+            print(f"{name:<28} {elapsed:9.1f} ms  {baseline / elapsed:5.1f}x")
+
+        # Reading the rows out of SQLite is the same work on every path
+        def fetch():
+            db.session.connection().exec_driver_sql('SELECT * FROM transactions WHERE account_id = 1').all()
+        print(f"\nof which the SQLite read alone: {cpu_ms(fetch, args.repeat):.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Prompt Token Benchmark
+Estimates prompt tokens per chat turn over a long conversation, for the
+previous prompt (indented JSON context, last 10 messages) and for the
+token-budgeted builder with a running summary. No API calls are made.
+
+Usage:
+    python benchmarks/bench_prompt_tokens.py
+    python benchmarks/bench_prompt_tokens.py --turns 50 --budget 2000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'unused')
+
+from ai_service import AIFinancialAdvisor
+from prompt_builder import PromptBuilder, message_tokens, summary_due
+
+QUESTIONS = [
+    "How can I save more money each month?",
+    "ما هي أفضل الاستثمارات الحلال لمبلغ 20 ألف ريال؟",
+    "Why did my grocery spending go up?",
+    "Can you suggest a budget plan for my salary?",
+    "هل يجب أن أسدد القرض مبكراً؟",
+    "Is it a good time to invest in sukuk?",
+]
+REPLY_WORDS = "budget savings spending category income investment halal sukuk emergency fund month riyal plan".split()
+SUMMARY = " ".join(["The user wants to save for a car and asked about sukuk and a monthly budget."] * 6)
+
+def make_profile(rng):
+    categories = ['Food & Dining', 'Groceries', 'Transportation', 'Shopping', 'Bills & Utilities']
+    return {
+        'total_balance': 15230.5,
+        'monthly_income': 12000.0,
+        'monthly_spending': 6840.25,
+        'accounts_count': 2,
+        'savings_rate': 42.9,
+        'top_categories': [[category, round(rng.uniform(200, 2000), 2)] for category in categories],
+        'recent_transactions': [
+            {
+                'description': f"POS PURCHASE {rng.choice(['PANDA', 'STARBUCKS', 'ALDREES', 'JARIR'])} RIYADH",
+                'amount': round(rng.uniform(10, 900), 2),
+                'category': rng.choice(categories),
+                'date': f"2024-05-{rng.randint(1, 28):02d}T12:00:00"
+            }
+            for _ in range(5)
+        ]
+    }
+
+def legacy_messages(advisor, profile, history, message):
+    """The prompt as it was built before the token budget: indented JSON, last 10 messages"""
+    messages, _ = advisor.build_advice_messages(profile, [], message)
+    system = messages[0]['content']
+    for key in ('top_categories', 'recent_transactions'):
+        compact = json.dumps(profile[key], ensure_ascii=False, separators=(',', ':'))
+        system = system.replace(compact, json.dumps(profile[key], indent=2))
+    # The old template was sent with its source indentation
+    system = "\n".join("            " + line for line in system.splitlines())
+    return [{"role": "system", "content": system}] + [
+        {"role": m['role'], "content": m['content']} for m in history[-10:]
+    ] + [{"role": "user", "content": message}]
+
+def run(turns, budget, seed=42):
+    rng = random.Random(seed)
+    advisor = AIFinancialAdvisor()
+    advisor.prompt_builder = PromptBuilder(budget)
+    profile = make_profile(rng)
+
+    history = []
+    summary, summary_seq = None, 0
+    legacy_tokens, budgeted_tokens = [], []
+    build_time = 0.0
+    for turn in range(turns):
+        message = rng.choice(QUESTIONS)
+        legacy_tokens.append(message_tokens(legacy_messages(advisor, profile, history, message)))
+
+        window = [m for m in history if m['seq'] > summary_seq][-10:]
+        start = time.perf_counter()
+        messages, first_seq = advisor.build_advice_messages(profile, window, message, summary=summary)
+        build_time += time.perf_counter() - start
+        budgeted_tokens.append(message_tokens(messages))
+
+        # What the summarize_chat job would do after this turn
+        through = summary_due(summary_seq, first_seq, len(history) or None)
+        reply = " ".join(rng.choice(REPLY_WORDS) for _ in range(rng.randint(200, 450)))
+        history.append({'seq': len(history) + 1, 'role': 'user', 'content': message})
+        history.append({'seq': len(history) + 1, 'role': 'assistant', 'content': reply})
+        if through:
+            summary, summary_seq = SUMMARY, through
+
+    return legacy_tokens, budgeted_tokens, build_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate prompt tokens per chat turn")
+    parser.add_argument('--turns', type=int, default=30)
+    parser.add_argument('--budget', type=int, default=PromptBuilder().budget)
+    args = parser.parse_args()
+
+    legacy, budgeted, build_time = run(args.turns, args.budget)
+
+    def describe(tokens):
+        return f"avg {sum(tokens) / len(tokens):7.0f}  max {max(tokens):6d}  last {tokens[-1]:6d}"
+
+    print(f"Turns:            {args.turns} (budget {args.budget} tokens)")
+    print(f"Previous prompt:  {describe(legacy)}")
+    print(f"Budgeted prompt:  {describe(budgeted)}")
+    print(f"Saved per turn:   {(sum(legacy) - sum(budgeted)) / len(legacy):.0f} tokens "
+          f"({(1 - sum(budgeted) / sum(legacy)) * 100:.0f}%)")
+    print(f"Build time:       {build_time / args.turns * 1000:.2f} ms/turn")
+
+    if max(budgeted) > args.budget:
+        print("FAIL: a prompt exceeded the budget")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Rule Classifier Benchmark
+Measures how many transaction descriptions the local pre-classifier
+handles per second in a single process.
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rule_classifier import RuleClassifier, MERCHANT_DICTIONARY, KEYWORD_RULES
+
+TARGET_PER_SECOND = 20000
+
+TEMPLATES = [
+    "POS PURCHASE {name} {city} {ref}",
+    "{name}*ORDER {ref} {date}",
+    "MADA {name} {city}",
+    "{name} RIYADH SA {date} REF:{ref}",
+    "شراء عبر نقاط البيع {name} {city}",
+]
+UNKNOWN = ["AL FAHAD TRADING EST", "MOHAMMED ABDULLAH", "GENERAL CONTRACTING CO", "مؤسسة النور التجارية"]
+CITIES = ["RIYADH", "JEDDAH", "DAMMAM", "KHOBAR", "الرياض", "جدة"]
+
+def generate_descriptions(count, seed=42):
+    rng = random.Random(seed)
+    names = [name.upper() for name in list(MERCHANT_DICTIONARY) + list(KEYWORD_RULES)] + UNKNOWN * 10
+    return [
+        rng.choice(TEMPLATES).format(
+            name=rng.choice(names),
+            city=rng.choice(CITIES),
+            ref=f"{rng.randint(100000, 999999)}",
+            date=f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024"
+        )
+        for _ in range(count)
+    ]
+
+def run(count=50000):
+    classifier = RuleClassifier()
+    descriptions = generate_descriptions(count)
+
+    start = time.perf_counter()
+    results = [classifier.classify(description) for description in descriptions]
+    elapsed = time.perf_counter() - start
+
+    confident = sum(1 for result in results if result and result['confidence'] >= classifier.min_confidence)
+    per_second = count / elapsed
+
+    print("\n⚡ Rule Classifier Benchmark")
+    print("=" * 60)
+    print(f"Descriptions:       {count}")
+    print(f"Elapsed:            {elapsed:.3f}s")
+    print(f"Throughput:         {per_second:,.0f} descriptions/sec")
+    print(f"Per description:    {elapsed / count * 1e6:.1f} µs")
+    print(f"Resolved locally:   {confident / count * 100:.1f}% (confidence >= {classifier.min_confidence})")
+    print(f"Target:             {TARGET_PER_SECOND:,} descriptions/sec -> {'PASS' if per_second >= TARGET_PER_SECOND else 'FAIL'}")
+    return per_second >= TARGET_PER_SECOND
+
+if __name__ == '__main__':
+    sys.exit(0 if run() else 1)
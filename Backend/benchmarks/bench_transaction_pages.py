@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Transaction Paging Benchmark
+Seeds an in-memory SQLite database with one large account and times loading
+a page of its transactions at increasing depths, with the previous OFFSET
+pagination (page query plus COUNT) and with keyset cursors. Also checks that
+walking every cursor page returns each transaction exactly once.
+
+Usage:
+    python benchmarks/bench_transaction_pages.py
+    python benchmarks/bench_transaction_pages.py --transactions 200000 --per-page 50
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from keyset import keyset_page
+from models import Account, SpendingRollup, Transaction, User, db
+from spending_rollups import SpendingRollups
+
+def seed(transactions, rng):
+    db.session.add(User(id=1, customer_user_id='bench', first_name='Bench', last_name='User', email='b@example.com'))
+    db.session.add(Account(id=1, user_id=1, account_id='acc-1'))
+    now = datetime.utcnow()
+    # Timestamps at minute resolution, so many rows share a date and the id breaks ties
+    db.session.bulk_insert_mappings(Transaction, [
+        {'account_id': 1, 'user_id': 1, 'transaction_id': f"t-{n}", 'amount': 10.0,
+         'credit_debit': 'Debit', 'category': 'Groceries',
+         'transaction_date': (now - timedelta(minutes=rng.randrange(transactions // 3))).replace(second=0, microsecond=0)}
+        for n in range(transactions)
+    ])
+    SpendingRollups(db, SpendingRollup, Transaction, Account).rebuild()
+    db.session.commit()
+    db.session.execute(text('ANALYZE'))
+
+def timed(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OFFSET and keyset pagination by page depth")
+    parser.add_argument('--transactions', type=int, default=100000, help="Transactions in the account")
+    parser.add_argument('--per-page', type=int, default=50, help="Rows per page")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per page")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        seed(args.transactions, random.Random(11))
+        base = Transaction.query.filter_by(account_id=1)
+        ordered = base.order_by(Transaction.transaction_date.desc(), Transaction.id.desc())
+
+        # Walk every cursor page once: no row missed or repeated, and remember each page's cursor
+        cursors, seen, cursor = [None], [], None
+        while True:
+            rows, cursor = keyset_page(base, Transaction.transaction_date, Transaction.id, cursor, args.per_page)
+            seen.extend(row.id for row in rows)
+            if cursor is None:
+                break
+            cursors.append(cursor)
+        db.session.expunge_all()
+        assert len(seen) == len(set(seen)) == args.transactions, "cursor walk missed or repeated rows"
+
+        print(f"{args.transactions} transactions, {args.per_page} per page, "
+              f"{len(cursors)} pages; median of {args.repeat} runs\n")
+        print(f"{'page':>6}  {'OFFSET + COUNT':>15}  {'keyset':>10}")
+        for page in (1, 10, 100, 500, len(cursors)):
+            if page > len(cursors):
+                continue
+
+            def offset_page():
+                ordered.paginate(page=page, per_page=args.per_page, error_out=False)
+
+            def cursor_page():
+                keyset_page(base, Transaction.transaction_date, Transaction.id, cursors[page - 1], args.per_page)
+
+            print(f"{page:>6}  {timed(offset_page, args.repeat):12.2f} ms  {timed(cursor_page, args.repeat):7.2f} ms")
+
+        rollups = SpendingRollups(db, SpendingRollup, Transaction, Account)
+        start = time.perf_counter()
+        estimate = rollups.count(1, account_id=1)
+        print(f"\nEstimated total from the rollup: {estimate} in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        plan = db.session.connection().exec_driver_sql(
+            'EXPLAIN QUERY PLAN SELECT id FROM transactions WHERE account_id = 1 AND transaction_date IS NOT NULL '
+            'AND (transaction_date, id) < (?, ?) ORDER BY transaction_date DESC, id DESC LIMIT 51',
+            (datetime.utcnow(), 10 ** 9)
+        ).all()
+        print("Cursor page plan: " + "; ".join(row[3] for row in plan))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Dashboard Index Check
+Seeds an in-memory SQLite database with many users, runs the queries of the
+dashboard path (financial snapshot, recent transactions, goals and the
+single-query summary) and checks their EXPLAIN QUERY PLAN: every table must
+be reached through an index on the user (or account), and the newest-first
+ordering must come from the index rather than a sort. Exits with status 1
+when a plan scans a table.
+
+Usage:
+    python benchmarks/check_dashboard_indexes.py
+    python benchmarks/check_dashboard_indexes.py --users 500 --transactions 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event, text
+
+from dashboard import build_dashboard, dashboard_since
+from financial_context import build_snapshot, recent_transactions_query
+from models import Account, FinancialGoal, SpendingRollup, Transaction, User, db
+from spending_rollups import SpendingRollups
+
+CATEGORIES = ['Groceries', 'Food & Dining', 'Transportation', 'Shopping', 'Bills & Utilities']
+
+def seed(users, accounts_per_user, transactions_per_account, rng):
+    now = datetime.utcnow()
+    db.session.bulk_insert_mappings(User, [
+        {'id': user_id, 'customer_user_id': f"user-{user_id}", 'first_name': 'Bench',
+         'last_name': str(user_id), 'email': f"user{user_id}@example.com"}
+        for user_id in range(1, users + 1)
+    ])
+    accounts = [
+        {'id': (user_id - 1) * accounts_per_user + n + 1, 'user_id': user_id,
+         'account_id': f"acc-{user_id}-{n}", 'balance': 1000.0}
+        for user_id in range(1, users + 1) for n in range(accounts_per_user)
+    ]
+    db.session.bulk_insert_mappings(Account, accounts)
+    db.session.bulk_insert_mappings(FinancialGoal, [
+        {'user_id': user_id, 'title': 'Emergency fund', 'target_amount': 10000.0,
+         'goal_type': 'emergency_fund', 'status': 'active'}
+        for user_id in range(1, users + 1)
+    ])
+    db.session.bulk_insert_mappings(Transaction, [
+        {'account_id': account['id'], 'user_id': account['user_id'],
+         'transaction_id': f"t-{account['id']}-{n}", 'amount': round(rng.uniform(5, 500), 2),
+         'credit_debit': 'Credit' if n % 10 == 0 else 'Debit', 'category': rng.choice(CATEGORIES),
+         'merchant': f"merchant-{rng.randrange(50)}",
+         'transaction_date': now - timedelta(minutes=rng.randrange(90 * 24 * 60))}
+        for account in accounts for n in range(transactions_per_account)
+    ])
+    SpendingRollups(db, SpendingRollup, Transaction, Account).rebuild()
+    db.session.commit()
+    db.session.execute(text('ANALYZE'))
+
+def capture_statements(run):
+    """Run ``run()`` and return the (sql, parameters) of each query it executed"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        run()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return statements
+
+def plan_problems(plan, tables):
+    """Full scans of stored tables, and sorts of rows rather than of aggregated groups"""
+    problems = []
+    previous = ''
+    for detail in plan:
+        words = detail.split()
+        if words[0] == 'SCAN' and words[1] in tables and 'INDEX' not in detail:
+            problems.append(f"full table scan: {detail}")
+        if 'TEMP B-TREE FOR ORDER BY' in detail and 'GROUP BY' not in previous:
+            problems.append(f"sort not served by an index: {detail}")
+        previous = detail
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that dashboard queries use per-user indexes")
+    parser.add_argument('--users', type=int, default=200, help="Users in the database")
+    parser.add_argument('--accounts', type=int, default=2, help="Accounts per user")
+    parser.add_argument('--transactions', type=int, default=100, help="Transactions per account")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        seed(args.users, args.accounts, args.transactions, random.Random(7))
+        rollups = SpendingRollups(db, SpendingRollup, Transaction, Account)
+        user_id = args.users // 2
+
+        def dashboard():
+            build_snapshot(db, Account, Transaction, rollups, user_id)
+            recent_transactions_query(Transaction, user_id, 10).all()
+            FinancialGoal.query.filter_by(user_id=user_id, status='active').all()
+            build_dashboard(db, User, Account, Transaction, SpendingRollup, user_id, dashboard_since())
+
+        start = time.perf_counter()
+        statements = capture_statements(dashboard)
+        elapsed = time.perf_counter() - start
+
+        print(f"{args.users} users, {args.users * args.accounts * args.transactions} transactions; "
+              f"dashboard queries for one user took {elapsed * 1000:.1f} ms\n")
+        failures = 0
+        for statement, parameters in statements:
+            plan = [row[3] for row in db.session.connection().exec_driver_sql(
+                f'EXPLAIN QUERY PLAN {statement}', tuple(parameters)
+            )]
+            problems = plan_problems(plan, db.metadata.tables)
+            failures += bool(problems)
+            print(' '.join(statement.split())[:110])
+            for detail in plan:
+                print(f"    {detail}")
+            for problem in problems:
+                print(f"    !! {problem}")
+            print()
+
+    print(f"{len(statements) - failures}/{len(statements)} queries use an index")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
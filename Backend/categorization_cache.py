@@ -0,0 +1,197 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import metrics
+
+TATWEEL = '\u0640'
+# Alef/yeh/waw variants and teh marbuta folded to their base letter
+ARABIC_LETTER_MAP = str.maketrans({
+    '\u0623': '\u0627', '\u0625': '\u0627', '\u0622': '\u0627', '\u0671': '\u0627',
+    '\u0649': '\u064a', '\u0626': '\u064a', '\u0624': '\u0648', '\u0629': '\u0647',
+    TATWEEL: None
+})
+MONTH_TOKEN = re.compile(
+    r'\b\d{0,2}(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\d{2,4}\b'
+)
+# Any token that contains a digit is a date, time, card number or reference code
+DIGIT_TOKEN = re.compile(r'\S*\d\S*')
+NON_WORD = re.compile(r'[\W_]+')
+NOISE_WORDS = {'pos', 'ref', 'refno', 'trx', 'txn', 'rrn', 'auth', 'no', 'id'}
+
+def normalize_description(description):
+    """Reduce a bank transaction description to a stable merchant key.
+
+    "JAHEZ*ORDER 88412 RIYADH 12/03/2024" and "jahez order 99120 riyadh"
+    both become "jahez order riyadh".
+    """
+    if not description:
+        return ''
+
+    text = unicodedata.normalize('NFKC', description).casefold().translate(ARABIC_LETTER_MAP)
+    # Dropping combining marks strips both Latin accents and Arabic tashkeel
+    text = ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+
+    text = MONTH_TOKEN.sub(' ', text)
+    text = DIGIT_TOKEN.sub(' ', text)
+    text = NON_WORD.sub(' ', text)
+    return ' '.join(word for word in text.split() if word not in NOISE_WORDS)
+
+class CategorizationCache:
+    """Two-tier cache of categorization results keyed by normalized description.
+
+    The front tier is an in-process LRU; the back tier is a DB table (``model``)
+    with ``key``, ``category``, ``merchant``, ``confidence``, ``hits`` and
+    ``last_used_at`` columns. Entries expire after ``ttl`` and the table is
+    trimmed to the ``max_entries`` most recently used keys.
+    """
+
+    def __init__(self, db, model, ttl=timedelta(days=90), max_entries=50000,
+                 memory_size=5000, min_confidence=0.5):
+        self.db = db
+        self.model = model
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_size = memory_size
+        self.min_confidence = min_confidence
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+
+        metrics.register_gauge('catcache.hit_rate', self.hit_rate)
+
+    def categorize(self, transactions, categorize_many):
+        """Categorize transactions, asking ``categorize_many`` only for cache misses.
+
+        ``transactions`` are dicts with id, description, amount and currency.
+        Misses are deduplicated by key, so a merchant that appears many times
+        in one sync is categorized once; descriptions that normalize to an
+        empty key are sent one by one. Returns results keyed by ``str(id)``.
+        """
+        keys = {str(trans['id']): normalize_description(trans.get('description')) for trans in transactions}
+        cached = self.get_many(set(keys.values()))
+
+        misses = {}
+        for trans in transactions:
+            item_id = str(trans['id'])
+            key = keys[item_id]
+            if not key:
+                # Nothing left to identify the merchant: categorized on its own,
+                # never shared. '#' cannot occur in a normalized key
+                misses[f'#{item_id}'] = {**trans, 'id': f'#{item_id}'}
+            elif key not in cached and key not in misses:
+                misses[key] = {**trans, 'id': key}
+
+        fresh = categorize_many(list(misses.values())) if misses else {}
+        self.put_many({key: result for key, result in fresh.items() if key and not key.startswith('#')})
+
+        results = {}
+        for item_id, key in keys.items():
+            result = cached.get(key) or fresh.get(key or f'#{item_id}')
+            if result:
+                results[item_id] = dict(result)
+        return results
+
+    def get_many(self, keys):
+        """Look up normalized keys; returns a dict of the ones that were found"""
+        keys = {key for key in keys if key}
+        found = {}
+        now = time.monotonic()
+
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry and entry[1] > now:
+                    self._memory.move_to_end(key)
+                    found[key] = entry[0]
+        metrics.incr('catcache.hits.memory', len(found))
+
+        remaining = keys - found.keys()
+        if remaining:
+            cutoff = datetime.utcnow() - self.ttl
+            rows = self.model.query.filter(
+                self.model.key.in_(remaining),
+                self.model.last_used_at >= cutoff
+            ).all()
+            for row in rows:
+                found[row.key] = self._remember(row.key, {
+                    'category': row.category,
+                    'merchant': row.merchant,
+                    'confidence': row.confidence
+                })
+            if rows:
+                self.model.query.filter(self.model.key.in_([row.key for row in rows])).update(
+                    {'last_used_at': datetime.utcnow(), 'hits': self.model.hits + 1},
+                    synchronize_session=False
+                )
+            metrics.incr('catcache.hits.db', len(rows))
+            metrics.incr('catcache.misses', len(remaining) - len(rows))
+
+        return found
+
+    def put_many(self, results):
+        """Store confident results; the caller commits the session"""
+        results = {
+            key: result for key, result in results.items()
+            if result and result.get('confidence', 0) >= self.min_confidence
+        }
+        if not results:
+            return
+
+        now = datetime.utcnow()
+        existing = {
+            row.key: row for row in self.model.query.filter(self.model.key.in_(results.keys())).all()
+        }
+        for key, result in results.items():
+            row = existing.get(key)
+            if row is None:
+                row = self.model(key=key, hits=0)
+                self.db.session.add(row)
+            row.category = result.get('category')
+            row.merchant = result.get('merchant')
+            row.confidence = result.get('confidence')
+            row.last_used_at = now
+            self._remember(key, result)
+
+        self._writes_since_evict += len(results)
+        if self._writes_since_evict >= 500:
+            self._writes_since_evict = 0
+            self.evict()
+
+    def evict(self):
+        """Delete expired rows and trim the table to the most recently used entries"""
+        cutoff = datetime.utcnow() - self.ttl
+        expired = self.model.query.filter(self.model.last_used_at < cutoff).delete(synchronize_session=False)
+
+        overflow = self.model.query.count() - self.max_entries
+        if overflow > 0:
+            oldest = self.db.select(self.model.id)\
+                .order_by(self.model.last_used_at.asc())\
+                .limit(overflow)
+            self.model.query.filter(self.model.id.in_(oldest)).delete(synchronize_session=False)
+            expired += overflow
+
+        metrics.incr('catcache.evicted', expired)
+
+    def _remember(self, key, result):
+        result = {
+            'category': result.get('category'),
+            'merchant': result.get('merchant'),
+            'confidence': result.get('confidence')
+        }
+        with self._lock:
+            self._memory[key] = (result, time.monotonic() + self.ttl.total_seconds())
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+        return result
+
+    @staticmethod
+    def hit_rate():
+        hits = metrics.get_counter('catcache.hits.memory') + metrics.get_counter('catcache.hits.db')
+        total = hits + metrics.get_counter('catcache.misses')
+        return hits / total if total else 0.0
@@ -0,0 +1,104 @@
+import json
+import time
+
+import metrics
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'  # stop nginx from buffering the whole reply
+}
+# Appended to a stored reply that the upstream error or a disconnect cut short
+INTERRUPTED_MARKER = '\n\n[Reply interrupted]'
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event with a JSON payload"""
+    lines = f"event: {event}\n" if event else ""
+    return f"{lines}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def iter_completion(client, messages, model="gpt-4o-mini", temperature=0.7, max_tokens=500):
+    """Yield the text deltas of a streamed chat completion.
+
+    The upstream HTTP response is closed when the generator is closed, so
+    a caller that stops early (a client that disconnected) does not keep
+    the OpenAI request running in the background.
+    """
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True
+    )
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    finally:
+        stream.response.close()
+
+async def aiter_completion(client, messages, model="gpt-4o-mini", temperature=0.7, max_tokens=500):
+    """``iter_completion`` for an ``AsyncOpenAI`` client"""
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True
+    )
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    finally:
+        await stream.response.aclose()
+
+def stream_reply(deltas, on_complete, started=None,
+                 error_message="Sorry, there was a system error. Please try again."):
+    """Forward ``deltas`` (an iterator of text) as SSE ``delta`` events.
+
+    ``on_complete(text)`` persists the reply: with the full text when the
+    stream ends, or, if the upstream fails or the client disconnects, with
+    what was sent so far followed by ``INTERRUPTED_MARKER``.
+    The final ``done`` event carries the full text plus any dict that
+    ``on_complete`` returns.
+    Time to first token is measured from ``started`` (a perf_counter
+    value, by default the first iteration) and recorded as ``chat.ttft``.
+    """
+    started = started or time.perf_counter()
+    parts = []
+    done = {}
+    finished = False
+    try:
+        for delta in deltas:
+            if not parts:
+                metrics.observe('chat.ttft', time.perf_counter() - started)
+            parts.append(delta)
+            yield sse_event({'delta': delta})
+        finished = True
+    except GeneratorExit:
+        metrics.incr('chat.stream.disconnected')
+        raise
+    except Exception as e:
+        print(f"Chat stream error: {e}")
+        metrics.incr('chat.stream.errors')
+        yield sse_event({'error': error_message}, event='error')
+    finally:
+        # Closing the delta iterator also closes the upstream response
+        close = getattr(deltas, 'close', None)
+        if close:
+            close()
+        if parts:
+            try:
+                done = on_complete(''.join(parts) + ('' if finished else INTERRUPTED_MARKER)) or {}
+            except Exception as e:
+                print(f"Chat stream persist error: {e}")
+        metrics.observe('chat.stream.duration', time.perf_counter() - started)
+
+    if finished:
+        yield sse_event({**done, 'response': ''.join(parts)}, event='done')
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+def _env(name, default, cast):
+    value = os.getenv(name)
+    return cast(value) if value else default
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker for one outbound dependency.
+
+    The outcomes of the last ``window`` calls are kept. Once at least
+    ``min_calls`` are recorded and the share of failures reaches
+    ``failure_rate``, the breaker opens and ``allow`` returns False for
+    ``open_seconds``, so callers go straight to their fallback. After that
+    up to ``half_open_calls`` probes are let through: if they all succeed
+    the breaker closes, and any failure opens it again. Calls slower than
+    ``slow_seconds`` (when set) count as failures, so a dependency that
+    hangs trips the breaker as well as one that errors.
+
+    Every setting can be passed explicitly or read from ``<NAME>_BREAKER_*``
+    environment variables (e.g. ``TARABUT_BREAKER_OPEN_SECONDS``).
+    """
+
+    def __init__(self, name, failure_rate=None, window=None, min_calls=None,
+                 open_seconds=None, half_open_calls=None, slow_seconds=None):
+        prefix = f"{name.upper()}_BREAKER"
+        self.name = name
+        self.failure_rate = failure_rate or _env(f'{prefix}_FAILURE_RATE', 0.5, float)
+        self.window = window or _env(f'{prefix}_WINDOW', 20, int)
+        self.min_calls = min_calls or _env(f'{prefix}_MIN_CALLS', 5, int)
+        self.open_seconds = open_seconds or _env(f'{prefix}_OPEN_SECONDS', 30.0, float)
+        self.half_open_calls = half_open_calls or _env(f'{prefix}_HALF_OPEN_CALLS', 1, int)
+        self.slow_seconds = slow_seconds if slow_seconds is not None else _env(f'{prefix}_SLOW_SECONDS', 0.0, float)
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=self.window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+
+        metrics.register_gauge(f'breaker.{name}', self.stats)
+
+    @property
+    def state(self):
+        with self._lock:
+            self._advance()
+            return self._state
+
+    def allow(self):
+        """Whether a call may go ahead; False means fail fast and use the fallback"""
+        with self._lock:
+            self._advance()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+        metrics.incr(f'breaker.{self.name}.rejected')
+        return False
+
+    def record(self, success, seconds=None):
+        """Record the outcome of a call that ``allow`` let through"""
+        if success and self.slow_seconds and seconds is not None and seconds > self.slow_seconds:
+            metrics.incr(f'breaker.{self.name}.slow_calls')
+            success = False
+
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if not success:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    metrics.incr(f'breaker.{self.name}.closed')
+                return
+
+            self._outcomes.append(success)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+                if self._failure_rate() >= self.failure_rate:
+                    self._open()
+
+    def reset(self):
+        """Close the breaker and forget recorded outcomes"""
+        with self._lock:
+            self._state = CLOSED
+            self._outcomes.clear()
+
+    def _advance(self):
+        """Move from open to half-open once the open period is over. Caller holds the lock."""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        metrics.incr(f'breaker.{self.name}.opened')
+        print(f"Circuit breaker '{self.name}' opened; failing fast for {self.open_seconds:.0f}s")
+
+    def _failure_rate(self):
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def stats(self):
+        with self._lock:
+            self._advance()
+            return {
+                'state': self._state,
+                'failure_rate': round(self._failure_rate(), 3),
+                'calls': len(self._outcomes),
+                'open_for': max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+                if self._state == OPEN else 0.0
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name, **defaults):
+    """Return the process-wide breaker for the dependency ``name``.
+
+    ``defaults`` apply when the breaker is first created and are still
+    overridden by ``<NAME>_BREAKER_*`` environment variables.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            prefix = f"{name.upper()}_BREAKER"
+            settings = {
+                key: value for key, value in defaults.items()
+                if not os.getenv(f'{prefix}_{key.upper()}')
+            }
+            breaker = _breakers[name] = CircuitBreaker(name, **settings)
+        return breaker
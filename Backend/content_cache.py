@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import inspect
+
+import metrics
+
+CONTENT_TTL = timedelta(hours=float(os.getenv('CONTENT_CACHE_TTL_HOURS', '24')))
+# How long past its TTL an entry is still served while a refresh runs
+CONTENT_STALE = timedelta(hours=float(os.getenv('CONTENT_CACHE_STALE_HOURS', '168')))
+
+# Upper bounds (SAR per month) of the spending bands content is generated for
+SPENDING_BANDS = (100, 250, 500, 1000, 2500, 5000, 10000)
+
+def spending_band(amount):
+    """Round a monthly amount to a band label such as "250-500" or "10000+" """
+    amount = max(float(amount or 0), 0)
+    lower = 0
+    for upper in SPENDING_BANDS:
+        if amount < upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+def normalize_language(value):
+    """Map a ``lang`` parameter or Accept-Language header to 'ar' or 'en'"""
+    return 'ar' if (value or '').strip().lower().startswith('ar') else 'en'
+
+def content_key(*parts):
+    """Cache key from (template version, category, band, language, ...) parts"""
+    return ':'.join(str(part).strip().casefold() for part in parts)
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class ContentCache:
+    """Shared cache of AI-generated content that is the same for many users.
+
+    The front tier is an in-process LRU; the back tier is a DB table
+    (``model``) with ``key``, ``value`` (JSON), ``created_at``,
+    ``fresh_until`` and ``stale_until`` columns, so content survives
+    restarts and is shared between processes. A fresh entry is served
+    directly; a stale one is served while a background thread regenerates
+    it; concurrent misses for one key wait for a single generation. If
+    generation fails (e.g. the AI circuit breaker is open), content past
+    its stale window is served rather than nothing, for one more stale
+    window.
+    """
+
+    def __init__(self, db, model, ttl=CONTENT_TTL, stale=CONTENT_STALE, memory_size=2000):
+        self.db = db
+        self.model = model
+        self.ttl = ttl
+        self.stale = stale
+        self.memory_size = memory_size
+
+        self._memory = OrderedDict()
+        self._flights = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='content-refresh')
+        self._writes_since_evict = 0
+
+        metrics.register_gauge('content_cache.hit_rate', self.hit_rate)
+
+    def get_or_generate(self, key, generate, wait_timeout=60):
+        """Return the cached value for ``key``, calling ``generate()`` only when needed.
+
+        ``generate`` returns a JSON-serialisable value; empty results (an
+        error fallback such as ``[]``) are returned but not cached, and an
+        exception reaches every caller waiting on that generation. A caller
+        that waits longer than ``wait_timeout`` for another's generation
+        gets TimeoutError. Call inside an app context.
+        """
+        entry = self._lookup(key)
+        now = time.time()
+        if entry:
+            value, fresh_until, stale_until = entry
+            if now < fresh_until:
+                metrics.incr('content_cache.hits')
+                return value
+            if now < stale_until:
+                metrics.incr('content_cache.stale_hits')
+                self._refresh_in_background(key, generate)
+                return value
+
+        metrics.incr('content_cache.misses')
+        # Expired content beats an error while the generator is failing
+        fallback = entry if entry and now < entry[2] + self.stale.total_seconds() else None
+        try:
+            value = self._single_flight(key, generate, wait_timeout)
+        except Exception:
+            if fallback is None:
+                raise
+            value = None
+        if not value and fallback is not None:
+            metrics.incr('content_cache.expired_served')
+            return fallback[0]
+        return value
+
+    def invalidate(self, key):
+        """Drop ``key`` from both tiers; the caller commits"""
+        with self._lock:
+            self._memory.pop(key, None)
+        self.model.query.filter_by(key=key).delete(synchronize_session=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                self._memory.move_to_end(key)
+                return entry
+
+        row = self.model.query.filter_by(key=key).first()
+        if row is None:
+            return None
+        metrics.incr('content_cache.db_loads')
+        return self._remember(key, json.loads(row.value), row.fresh_until, row.stale_until)
+
+    def _single_flight(self, key, generate, wait_timeout):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            metrics.incr('content_cache.coalesced')
+            if not flight.done.wait(wait_timeout):
+                # get_or_generate serves expired content instead, if it has any
+                metrics.incr('content_cache.wait_timeouts')
+                raise TimeoutError(f"Timed out waiting for content generation of {key}")
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            with metrics.timed('content_cache.generate'):
+                flight.value = generate()
+            if flight.value:
+                self._store(key, flight.value)
+            return flight.value
+        except Exception as e:
+            # Callers waiting on this generation see the same error
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _refresh_in_background(self, key, generate):
+        with self._lock:
+            if key in self._flights or key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        app = current_app._get_current_object()
+
+        def refresh():
+            with app.app_context():
+                try:
+                    self._single_flight(key, generate, wait_timeout=0)
+                    metrics.incr('content_cache.refreshed')
+                except Exception as e:
+                    self.db.session.rollback()
+                    print(f"Content cache refresh error for {key}: {e}")
+                finally:
+                    with self._lock:
+                        self._refreshing.discard(key)
+
+        self._refresher.submit(refresh)
+
+    def _store(self, key, value):
+        """Upsert the value and commit"""
+        Entry = self.model
+        now = datetime.utcnow()
+        fresh_until, stale_until = now + self.ttl, now + self.ttl + self.stale
+        values = {
+            'key': key, 'value': json.dumps(value, ensure_ascii=False),
+            'created_at': now, 'fresh_until': fresh_until, 'stale_until': stale_until
+        }
+
+        try:
+            dialect = self.db.session.get_bind(mapper=inspect(Entry)).dialect.name
+            if dialect in ('sqlite', 'postgresql'):
+                if dialect == 'sqlite':
+                    from sqlalchemy.dialects.sqlite import insert
+                else:
+                    from sqlalchemy.dialects.postgresql import insert
+                statement = insert(Entry).values(**values)
+                statement = statement.on_conflict_do_update(
+                    index_elements=['key'],
+                    set_={name: statement.excluded[name] for name in values if name != 'key'}
+                )
+                self.db.session.execute(statement)
+            else:
+                row = Entry.query.filter_by(key=key).first()
+                if row is None:
+                    self.db.session.add(Entry(**values))
+                else:
+                    for name, column_value in values.items():
+                        setattr(row, name, column_value)
+
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= 100:
+                self._writes_since_evict = 0
+                # Expired rows are kept one more stale window as a fallback
+                Entry.query.filter(Entry.stale_until < now - self.stale).delete(synchronize_session=False)
+            self.db.session.commit()
+        except Exception as e:
+            # Content is still served from memory; the next process regenerates it
+            self.db.session.rollback()
+            print(f"Content cache write error for {key}: {e}")
+
+        self._remember(key, value, fresh_until, stale_until)
+
+    def _remember(self, key, value, fresh_until, stale_until):
+        entry = (value, _timestamp(fresh_until), _timestamp(stale_until))
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def hit_rate():
+        hits = metrics.get_counter('content_cache.hits') + metrics.get_counter('content_cache.stale_hits')
+        total = hits + metrics.get_counter('content_cache.misses')
+        return hits / total if total else 0.0
+
+def _timestamp(value):
+    """Epoch seconds of a naive UTC datetime"""
+    return (value - datetime(1970, 1, 1)).total_seconds()
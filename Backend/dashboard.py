@@ -0,0 +1,145 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, literal, null, select, union_all
+
+import metrics
+from money import from_minor, halalas, sum_money
+
+DASHBOARD_DAYS = 30
+RECENT_TRANSACTIONS = 10
+TOP_MERCHANTS = 5
+# Browsers keep the response but revalidate it (If-None-Match) on every load
+DASHBOARD_HEADERS = {'Cache-Control': 'private, no-cache'}
+
+def dashboard_since(now=None):
+    """Start of the dashboard window: whole UTC days, like the spending rollup"""
+    now = now or datetime.utcnow()
+    return datetime.combine((now - timedelta(days=DASHBOARD_DAYS)).date(), datetime.min.time())
+
+def dashboard_etag(user_id, version, since):
+    """ETag for a user's dashboard: changes with the financial context version and the window"""
+    key = f"{user_id}:{version}:{since.date().isoformat()}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def dashboard_statement(user_model, account_model, transaction_model, rollup_model, user_id, since,
+                        recent=RECENT_TRANSACTIONS, top_merchants=TOP_MERCHANTS):
+    """One SELECT returning every dashboard widget for a user as tagged rows.
+
+    Each row is ``(kind, id, name, detail, flow, amount, count, date)``:
+    ``user`` (first and last name), ``account`` (name, bank, currency and
+    balance), ``category`` (30-day totals per category and credit/debit,
+    from the rollup), ``merchant`` (top debit merchants) and ``recent``
+    (newest transactions). Every part reads through a per-user index.
+    Amounts are integer halalas, so the totals are added without floats.
+    """
+    User, Account, Transaction, Rollup = user_model, account_model, transaction_model, rollup_model
+    columns = ('kind', 'id', 'name', 'detail', 'flow', 'amount', 'count', 'date')
+
+    def row(kind, *values):
+        return [literal(kind).label('kind')] + [
+            (null() if value is None else value).label(name)
+            for name, value in zip(columns[1:], values)
+        ]
+
+    newest = select(
+        Transaction.id, Transaction.description, Transaction.category, Transaction.credit_debit,
+        Transaction.amount, Transaction.transaction_date
+    ).where(Transaction.user_id == user_id).order_by(
+        Transaction.transaction_date.desc(), Transaction.id.desc()
+    ).limit(recent).cte('recent')
+
+    merchant_total = func.sum(Transaction.amount)
+    merchants = select(
+        Transaction.merchant, merchant_total.label('total'), func.count().label('count')
+    ).where(
+        Transaction.user_id == user_id,
+        Transaction.credit_debit == 'Debit',
+        Transaction.transaction_date >= since,
+        Transaction.merchant.is_not(None)
+    ).group_by(Transaction.merchant).order_by(merchant_total.desc()).limit(top_merchants).cte('merchants')
+
+    # The recent part comes first: a UNION takes its column types from the
+    # first SELECT, and it is the one with real dates
+    return union_all(
+        select(*row('recent', newest.c.id, newest.c.description, newest.c.category,
+                    newest.c.credit_debit, halalas(newest.c.amount), None, newest.c.transaction_date)),
+        select(*row('user', User.id, User.first_name, User.last_name, None, None, None, None))
+        .where(User.id == user_id),
+        select(*row('account', Account.id, Account.account_name, Account.bank_name,
+                    Account.currency, halalas(Account.balance), None, None))
+        .where(Account.user_id == user_id),
+        select(*row('category', None, Rollup.category, None, Rollup.credit_debit,
+                    halalas(func.sum(Rollup.total)), func.sum(Rollup.count), None))
+        .where(Rollup.user_id == user_id, Rollup.day >= since.date())
+        .group_by(Rollup.category, Rollup.credit_debit),
+        select(*row('merchant', None, merchants.c.merchant, None, None,
+                    halalas(merchants.c.total), merchants.c.count, None))
+    )
+
+def build_dashboard(db, user_model, account_model, transaction_model, rollup_model, user_id, since):
+    """Run ``dashboard_statement`` and shape the rows into the dashboard payload.
+
+    Returns None when the user does not exist.
+    """
+    with metrics.timed('dashboard.build'):
+        rows = db.session.execute(dashboard_statement(
+            user_model, account_model, transaction_model, rollup_model, user_id, since
+        )).all()
+
+    user = None
+    accounts, spending, recent, merchants = [], [], [], []
+    balances, income, spent = [], [], []
+    for kind, row_id, name, detail, flow, amount, count, date in rows:
+        if kind == 'user':
+            user = {'id': row_id, 'first_name': name, 'last_name': detail}
+        elif kind == 'account':
+            accounts.append({
+                'id': row_id, 'account_name': name, 'bank_name': detail,
+                'currency': flow, 'balance': from_minor(amount)
+            })
+            balances.append(amount)
+        elif kind == 'category':
+            if flow == 'Credit':
+                income.append(amount)
+            else:
+                spending.append((name, from_minor(amount), int(count or 0)))
+                spent.append(amount)
+        elif kind == 'merchant':
+            merchants.append({'merchant': name, 'amount': from_minor(amount), 'count': count})
+        else:
+            recent.append({
+                'id': row_id, 'description': name, 'category': detail, 'credit_debit': flow,
+                'amount': from_minor(amount), 'date': date.isoformat() if date else None
+            })
+    if user is None:
+        return None
+
+    # A UNION does not keep the order of its parts
+    merchants.sort(key=lambda merchant: merchant['amount'], reverse=True)
+    recent.sort(key=lambda transaction: (transaction['date'] or '', transaction['id']), reverse=True)
+
+    income = sum_money(income)
+    monthly_spending = sum_money(spent)
+    savings_rate = (income - monthly_spending) / income * 100 if income > 0 else 0
+    return {
+        'user': user,
+        'since': since.date().isoformat(),
+        'totalBalance': sum_money(balances),
+        'accountsCount': len(accounts),
+        'accounts': accounts,
+        'monthlyIncome': income,
+        'monthlySpending': monthly_spending,
+        'savingsRate': max(0, savings_rate),
+        'categorySpending': [
+            {
+                'category': category,
+                'amount': amount,
+                'count': count,
+                'percentage': amount / monthly_spending * 100 if monthly_spending > 0 else 0
+            }
+            for category, amount, count in sorted(spending, key=lambda item: item[1], reverse=True)
+        ],
+        'topMerchants': merchants,
+        'recentTransactions': recent
+    }
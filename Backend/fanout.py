@@ -0,0 +1,109 @@
+import asyncio
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Max outbound calls in flight for one user across all of their requests
+PER_USER_CONCURRENCY = int(os.getenv('PER_USER_CONCURRENCY', '4'))
+
+# Held only while a user has calls in flight, so idle users do not accumulate
+_user_slots = weakref.WeakValueDictionary()
+_user_slots_lock = threading.Lock()
+# Per event loop: asyncio semaphores only work on the loop they were created on
+_async_user_slots = weakref.WeakKeyDictionary()
+
+def _slots_for(user_key):
+    with _user_slots_lock:
+        slots = _user_slots.get(user_key)
+        if slots is None:
+            slots = threading.BoundedSemaphore(PER_USER_CONCURRENCY)
+            _user_slots[user_key] = slots
+        return slots
+
+def _async_slots_for(user_key):
+    loop = asyncio.get_running_loop()
+    with _user_slots_lock:
+        loop_slots = _async_user_slots.setdefault(loop, weakref.WeakValueDictionary())
+        slots = loop_slots.get(user_key)
+        if slots is None:
+            slots = asyncio.Semaphore(PER_USER_CONCURRENCY)
+            loop_slots[user_key] = slots
+        return slots
+
+def fan_out(func, items, user_key=None, max_workers=None):
+    """Call ``func(item)`` for every item in parallel with bounded concurrency.
+
+    Calls made on behalf of the same ``user_key`` share one concurrency cap,
+    so two simultaneous page loads cannot double a user's outbound load.
+    Returns ``(results, errors)``: dicts keyed by item. A failing item only
+    lands in ``errors``; it never fails the other items.
+    """
+    items = list(items)
+    if not items:
+        return {}, {}
+
+    slots = _slots_for(user_key) if user_key is not None else None
+    workers = min(max_workers or PER_USER_CONCURRENCY, len(items))
+
+    def run(item):
+        if slots is None:
+            return func(item)
+        with slots:
+            return func(item)
+
+    results = {}
+    errors = {}
+    with metrics.timed('fanout.batch'), ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {item: executor.submit(run, item) for item in items}
+        for item, future in futures.items():
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                errors[item] = str(e)
+                metrics.incr('fanout.errors')
+
+    metrics.incr('fanout.calls', len(items))
+    return results, errors
+
+async def async_fan_out(func, items, user_key=None, max_concurrency=None):
+    """``fan_out`` for coroutines: await ``func(item)`` for every item concurrently.
+
+    Without ``user_key`` or ``max_concurrency`` every call is in flight at
+    once, with no thread per call. Calls for the same ``user_key`` on one
+    event loop share the ``PER_USER_CONCURRENCY`` cap. Returns
+    ``(results, errors)`` like ``fan_out``.
+    """
+    items = list(items)
+    if not items:
+        return {}, {}
+
+    if max_concurrency:
+        slots = asyncio.Semaphore(max_concurrency)
+    elif user_key is not None:
+        slots = _async_slots_for(user_key)
+    else:
+        slots = None
+
+    async def run(item):
+        if slots is None:
+            return await func(item)
+        async with slots:
+            return await func(item)
+
+    with metrics.timed('fanout.batch'):
+        outcomes = await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
+    results = {}
+    errors = {}
+    for item, outcome in zip(items, outcomes):
+        if isinstance(outcome, Exception):
+            errors[item] = str(outcome)
+            metrics.incr('fanout.errors')
+        else:
+            results[item] = outcome
+
+    metrics.incr('fanout.calls', len(items))
+    return results, errors
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, inspect
+
+import metrics
+from money import money_sum
+
+# Snapshots also expire, since "last 30 days" moves even when no data changes
+CONTEXT_TTL = float(os.getenv('FINANCIAL_CONTEXT_TTL', '900'))
+CONTEXT_MAX_USERS = int(os.getenv('FINANCIAL_CONTEXT_MAX_USERS', '1000'))
+RECENT_TRANSACTIONS = 5
+
+def recent_transactions_query(transaction_model, user_id, limit):
+    """The user's newest transactions, read in order from the (user_id, transaction_date) index"""
+    Transaction = transaction_model
+    return Transaction.query.filter(Transaction.user_id == user_id).order_by(
+        Transaction.transaction_date.desc(), Transaction.id.desc()
+    ).limit(limit)
+
+def build_snapshot(db, account_model, transaction_model, rollups, user_id):
+    """Build the financial context the AI endpoints put in their prompts.
+
+    Six queries: account totals, the most recent transactions across all
+    of them, and four rollup reads. Money is summed in SQL. The result is
+    plain JSON-serialisable data.
+    """
+    Account, Transaction = account_model, transaction_model
+    now = datetime.utcnow()
+    thirty_days_ago = now - timedelta(days=30)
+    three_months_ago = now - timedelta(days=90)
+
+    total_balance, accounts_count, currency = db.session.query(
+        money_sum(Account.balance), func.count(Account.id), func.min(Account.currency)
+    ).filter(Account.user_id == user_id).one()
+
+    recent = recent_transactions_query(Transaction, user_id, RECENT_TRANSACTIONS).with_entities(
+        Transaction.description, Transaction.amount, Transaction.category, Transaction.transaction_date
+    ).all()
+
+    category_spending = rollups.by_category(user_id, thirty_days_ago)
+    monthly_spending = rollups.total(user_id, thirty_days_ago)
+    monthly_income = rollups.total(user_id, thirty_days_ago, credit_debit='Credit')
+
+    return {
+        'total_balance': total_balance,
+        'currency': currency or 'SAR',
+        'accounts_count': accounts_count,
+        'monthly_spending': monthly_spending,
+        'monthly_income': monthly_income,
+        'average_monthly_spending': rollups.total(user_id, three_months_ago) / 3,
+        'top_categories': sorted(
+            ([category, total] for category, total, _ in category_spending),
+            key=lambda x: x[1], reverse=True
+        )[:5],
+        'recent_transactions': [
+            {
+                'description': description,
+                'amount': amount,
+                'category': category,
+                'date': date.isoformat() if date else None
+            }
+            for description, amount, category, date in recent
+        ],
+        'savings_rate': max(0, (total_balance - monthly_spending) / total_balance * 100) if total_balance > 0 else 0,
+        'built_at': now.isoformat()
+    }
+
+class FinancialContextCache:
+    """Per-user financial context snapshots, shared by chat turns and advice endpoints.
+
+    ``model`` has ``user_id`` (primary key), ``version`` and ``updated_at``
+    columns. Anything that changes a user's balances or transactions calls
+    ``invalidate`` in the same transaction, which bumps the stored version;
+    a cached snapshot is used only while its version matches, so one
+    primary-key lookup replaces the queries of ``build(user_id)``, and
+    changes made by sync worker processes are seen by every web process.
+    """
+
+    def __init__(self, db, model, build, account_model=None, ttl=CONTEXT_TTL, max_users=CONTEXT_MAX_USERS):
+        self.db = db
+        self.model = model
+        self.build = build
+        self.account_model = account_model
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        metrics.register_gauge('financial_context.cached_users', lambda: len(self._entries))
+
+    def get(self, user_id):
+        """Return the user's snapshot (shared, so read-only), rebuilding it if missing, stale or expired"""
+        user_id = int(user_id)
+        version = self._version(user_id)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] == version and now - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                metrics.incr('financial_context.hits')
+                return entry[2]
+
+        metrics.incr('financial_context.misses')
+        with metrics.timed('financial_context.build'):
+            snapshot = {**self.build(user_id), 'version': version}
+
+        # Stored under the version read before building, so a change committed
+        # meanwhile makes the next read rebuild again
+        with self._lock:
+            self._entries[user_id] = (version, now, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_ids):
+        """Bump the context version of ``user_ids``; commits with the caller's transaction"""
+        if isinstance(user_ids, (int, str)):
+            user_ids = [user_ids]
+        user_ids = sorted({int(user_id) for user_id in user_ids if user_id is not None})
+        if not user_ids:
+            return
+
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+        Version = self.model
+        now = datetime.utcnow()
+        dialect = self.db.session.get_bind(mapper=inspect(Version)).dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            statement = insert(Version)
+            statement = statement.on_conflict_do_update(
+                index_elements=['user_id'],
+                set_={'version': Version.version + 1, 'updated_at': statement.excluded.updated_at}
+            )
+            self.db.session.execute(
+                statement, [{'user_id': user_id, 'version': 1, 'updated_at': now} for user_id in user_ids]
+            )
+        else:
+            existing = {row.user_id: row for row in Version.query.filter(Version.user_id.in_(user_ids))}
+            for user_id in user_ids:
+                row = existing.get(user_id)
+                if row is None:
+                    self.db.session.add(Version(user_id=user_id, version=1, updated_at=now))
+                else:
+                    row.version += 1
+                    row.updated_at = now
+        metrics.incr('financial_context.invalidations', len(user_ids))
+
+    def invalidate_accounts(self, account_ids):
+        """Invalidate the owners of ``account_ids`` (database ids)"""
+        Account = self.account_model
+        account_ids = {account_id for account_id in account_ids if account_id is not None}
+        if not account_ids:
+            return
+        owners = self.db.session.query(Account.user_id).filter(Account.id.in_(account_ids)).distinct()
+        self.invalidate([user_id for user_id, in owners])
+
+    def version(self, user_id):
+        """The user's current context version; it changes whenever their data does"""
+        return self._version(int(user_id))
+
+    def _version(self, user_id):
+        version = self.db.session.query(self.model.version).filter(self.model.user_id == user_id).scalar()
+        return version or 0
@@ -0,0 +1,408 @@
+import asyncio
+import atexit
+import os
+import random
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from circuit_breaker import CircuitOpenError, get_breaker
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses that mean the server did not process the request, so even a POST can be resent
+SAFE_RETRY_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+# Loading the CA bundle takes ~40 ms, so every async client shares one context
+SSL_CONTEXT = httpx.create_ssl_context()
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+class RetryPolicy:
+    """Timeouts and jittered retry/backoff settings shared by the sync and async transports.
+
+    Every setting can be passed explicitly or read from ``<PREFIX>_HTTP_*``
+    environment variables (e.g. ``TARABUT_HTTP_POOL_SIZE``).
+    """
+
+    def __init__(self, name='tarabut', pool_size=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, backoff_base=None, backoff_max=None):
+        prefix = f"{name.upper()}_HTTP"
+        self.name = name
+        self.pool_size = pool_size or _env_int(f'{prefix}_POOL_SIZE', 20)
+        self.connect_timeout = connect_timeout or _env_float(f'{prefix}_CONNECT_TIMEOUT', 3.05)
+        self.read_timeout = read_timeout or _env_float(f'{prefix}_READ_TIMEOUT', 20.0)
+        self.max_retries = max_retries if max_retries is not None else _env_int(f'{prefix}_MAX_RETRIES', 3)
+        self.backoff_base = backoff_base or _env_float(f'{prefix}_BACKOFF_BASE', 0.5)
+        self.backoff_max = backoff_max or _env_float(f'{prefix}_BACKOFF_MAX', 10.0)
+        # Calls taking over half the read timeout count as failures too
+        self.breaker = get_breaker(name, slow_seconds=self.read_timeout / 2)
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_delay(self, method, response, attempt):
+        """Seconds to wait before resending after ``response``, or None to return it"""
+        if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+            return None
+        if method not in IDEMPOTENT_METHODS and response.status_code not in SAFE_RETRY_STATUSES:
+            return None
+
+        delay = self._retry_after(response)
+        if delay is None:
+            return self._backoff(attempt)
+        if delay > self.backoff_max:
+            # Server asked us to wait longer than we are willing to block
+            return None
+        return delay
+
+    @staticmethod
+    def _retry_after(response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+class HTTPTransport(RetryPolicy):
+    """Pooled keep-alive HTTP client with timeouts, jittered retry/backoff and a circuit breaker.
+
+    While the ``name`` breaker is open, requests raise CircuitOpenError
+    at once instead of waiting on a failing dependency.
+    """
+
+    def __init__(self, name='tarabut', **settings):
+        super().__init__(name, **settings)
+
+        # Retries are handled here (with Retry-After support), not by urllib3
+        self._adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+
+        metrics.register_gauge(f'http.{name}.pool', self.pool_stats)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def request(self, method, url, **kwargs):
+        """Send a request through the pooled session, retrying on 429/5xx"""
+        method = method.upper()
+        kwargs.setdefault('timeout', self.timeout)
+        idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+
+        while True:
+            self._check_breaker()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.breaker.record(False)
+                metrics.incr(f'http.{self.name}.errors')
+                # Only a connect timeout guarantees a POST never reached the server
+                retriable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if not retriable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            except Exception:
+                self.breaker.record(False)
+                raise
+            else:
+                elapsed = time.perf_counter() - start
+                self.breaker.record(response.status_code not in RETRY_STATUSES, elapsed)
+                metrics.observe(f'http.{self.name}.latency', elapsed)
+                metrics.incr(f'http.{self.name}.requests')
+
+                delay = self._retry_delay(method, response, attempt)
+                if delay is None:
+                    return response
+                response.close()
+
+            attempt += 1
+            metrics.incr(f'http.{self.name}.retries')
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def pool_stats(self):
+        """Connections opened vs. requests served by the connection pools"""
+        connections = 0
+        pooled_requests = 0
+        for pool in list(self._adapter.poolmanager.pools._container.values()):
+            connections += pool.num_connections
+            pooled_requests += pool.num_requests
+
+        return {
+            'pool_size': self.pool_size,
+            'connections_opened': connections,
+            'requests': pooled_requests,
+            'reused_requests': max(0, pooled_requests - connections),
+            'reuse_ratio': (1 - connections / pooled_requests) if pooled_requests else 0.0
+        }
+
+class AsyncHTTPTransport(RetryPolicy):
+    """``HTTPTransport`` for coroutines, on ``httpx.AsyncClient``.
+
+    Same retry rules and metrics as the sync transport, but a request
+    waiting on the network does not hold a thread, so one event loop can
+    keep up to ``max_connections`` (``<PREFIX>_HTTP_MAX_CONNECTIONS``)
+    requests in flight. Each connection is a single-connection client
+    handed out from an idle stack: httpcore's own pool rescans every
+    connection and queued request on each event, which made throughput
+    fall as concurrency rose. Clients are bound to the event loop they
+    first run on; use ``get_async_transport`` rather than sharing one.
+    """
+
+    def __init__(self, name='tarabut', max_connections=None, **settings):
+        super().__init__(name, **settings)
+        self.max_connections = max_connections or _env_int(f"{name.upper()}_HTTP_MAX_CONNECTIONS", 200)
+        self._idle = asyncio.LifoQueue()
+        self._clients = []
+
+    def _client(self):
+        return httpx.AsyncClient(
+            verify=SSL_CONTEXT,
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=1, max_keepalive_connections=1)
+        )
+
+    async def _acquire(self):
+        if self._idle.empty() and len(self._clients) < self.max_connections:
+            client = self._client()
+            self._clients.append(client)
+            return client
+        # Most recently used first, so warm keep-alive connections are reused
+        return await self._idle.get()
+
+    async def request(self, method, url, **kwargs):
+        """Send a request on a pooled connection, retrying on 429/5xx"""
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+
+        while True:
+            self._check_breaker()
+            client = await self._acquire()
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                self.breaker.record(False)
+                metrics.incr(f'http.{self.name}.errors')
+                # Only a connect timeout guarantees a POST never reached the server
+                retriable = idempotent or isinstance(e, httpx.ConnectTimeout)
+                if not retriable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            except BaseException:
+                # Includes cancellation, so a half-open probe is never left pending
+                self.breaker.record(False)
+                raise
+            else:
+                elapsed = time.perf_counter() - start
+                self.breaker.record(response.status_code not in RETRY_STATUSES, elapsed)
+                metrics.observe(f'http.{self.name}.latency', elapsed)
+                metrics.incr(f'http.{self.name}.requests')
+
+                delay = self._retry_delay(method, response, attempt)
+                if delay is None:
+                    return response
+            finally:
+                self._idle.put_nowait(client)
+
+            attempt += 1
+            metrics.incr(f'http.{self.name}.retries')
+            await asyncio.sleep(delay)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
+
+    async def aclose(self):
+        for client in self._clients:
+            await client.aclose()
+
+def _rejected(request, name):
+    """Response standing in for a call the breaker refused; tells SDKs not to retry"""
+    return httpx.Response(
+        503,
+        headers={'x-should-retry': 'false'},
+        json={'error': {'message': f"{name} is unavailable (circuit open)", 'type': 'circuit_open'}},
+        request=request
+    )
+
+class BreakerTransport(httpx.BaseTransport):
+    """httpx transport that sends requests through a circuit breaker.
+
+    For SDK clients (OpenAI) that take an ``http_client``: while the breaker
+    is open, requests get an immediate 503 marked as not retryable, so the
+    SDK raises at once and the caller's fallback runs.
+    """
+
+    def __init__(self, breaker, transport=None):
+        self.breaker = breaker
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        if not self.breaker.allow():
+            return _rejected(request, self.breaker.name)
+        start = time.perf_counter()
+        try:
+            response = self.transport.handle_request(request)
+        except Exception:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(response.status_code not in RETRY_STATUSES, time.perf_counter() - start)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+class AsyncBreakerTransport(httpx.AsyncBaseTransport):
+    """``BreakerTransport`` for async httpx clients"""
+
+    def __init__(self, breaker, transport=None):
+        self.breaker = breaker
+        self.transport = transport or httpx.AsyncHTTPTransport(verify=SSL_CONTEXT)
+
+    async def handle_async_request(self, request):
+        if not self.breaker.allow():
+            return _rejected(request, self.breaker.name)
+        start = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(response.status_code not in RETRY_STATUSES, time.perf_counter() - start)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+def guarded_http_client(name, **kwargs):
+    """httpx.Client whose requests go through the ``name`` circuit breaker"""
+    return httpx.Client(transport=BreakerTransport(get_breaker(name)), **kwargs)
+
+def guarded_async_http_client(name, **kwargs):
+    """httpx.AsyncClient whose requests go through the ``name`` circuit breaker"""
+    return httpx.AsyncClient(transport=AsyncBreakerTransport(get_breaker(name)), **kwargs)
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+_loop_objects = weakref.WeakKeyDictionary()
+
+def get_transport(name='tarabut'):
+    """Return the process-wide transport for ``name``"""
+    with _transports_lock:
+        transport = _transports.get(name)
+        if transport is None:
+            transport = _transports[name] = HTTPTransport(name)
+        return transport
+
+def loop_local(name, factory):
+    """Return the object ``factory()`` made for ``name`` on the running event loop.
+
+    Async clients hold connections tied to one loop, so they live on the
+    service loop (see ``run_async``) and are shared by every request.
+    Whoever ends a loop awaits ``close_loop_local`` first.
+    """
+    loop = asyncio.get_running_loop()
+    with _transports_lock:
+        objects = _loop_objects.setdefault(loop, {})
+        obj = objects.get(name)
+        if obj is None:
+            obj = objects[name] = factory()
+        return obj
+
+async def close_loop_local():
+    """Close the objects ``loop_local`` made on the running event loop"""
+    with _transports_lock:
+        objects = _loop_objects.pop(asyncio.get_running_loop(), {})
+    for obj in objects.values():
+        await (getattr(obj, 'aclose', None) or obj.close)()
+
+_service_loop = None
+_service_loop_pid = None
+
+def service_loop():
+    """Return the process's event loop for async services, started on first use.
+
+    It runs in a daemon thread for the life of the process, so async
+    clients keep their connections across requests and jobs instead of
+    being rebuilt in a loop per request.
+    """
+    global _service_loop, _service_loop_pid
+    with _transports_lock:
+        # A forked worker inherits the loop object but not the thread running it
+        if _service_loop is None or _service_loop_pid != os.getpid():
+            _service_loop = asyncio.new_event_loop()
+            _service_loop_pid = os.getpid()
+            threading.Thread(target=_service_loop.run_forever, name='async-services', daemon=True).start()
+        return _service_loop
+
+def run_async(coro, timeout=None):
+    """Run ``coro`` on the service loop from sync code and return its result"""
+    return asyncio.run_coroutine_threadsafe(coro, service_loop()).result(timeout)
+
+@atexit.register
+def close_service_loop(timeout=5):
+    """Close the service loop's clients, then stop the loop"""
+    global _service_loop
+    with _transports_lock:
+        loop, _service_loop = _service_loop, None
+        if loop is None or _service_loop_pid != os.getpid():
+            return
+    try:
+        asyncio.run_coroutine_threadsafe(close_loop_local(), loop).result(timeout)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+
+def get_async_transport(name='tarabut'):
+    """Return the async transport for ``name`` on the running event loop"""
+    return loop_local(f'http.{name}', lambda: AsyncHTTPTransport(name))
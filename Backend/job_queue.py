@@ -0,0 +1,245 @@
+import json
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+
+LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1.0'))
+RETRY_DELAY = 30
+
+# User-initiated syncs run ahead of scheduled refreshes
+PRIORITY_USER = 10
+PRIORITY_SCHEDULED = 0
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+class JobQueue:
+    """Durable job queue stored in a DB table, with no external broker.
+
+    ``model`` has kind, dedup_key, user_id, payload, priority, status,
+    attempts, max_attempts, run_at, leased_by, lease_expires_at, result,
+    error, created_at, started_at and finished_at columns. Workers claim a
+    job with a conditional UPDATE, so several processes can share the table;
+    a claim is a lease that the worker extends while the job runs, and a job
+    whose worker died is picked up again once its lease expires.
+    """
+
+    def __init__(self, db, model, lease=timedelta(seconds=LEASE_SECONDS), max_attempts=MAX_ATTEMPTS):
+        self.db = db
+        self.model = model
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.handlers = {}
+
+    def handler(self, kind):
+        """Register the function that runs jobs of ``kind`` with the payload as kwargs"""
+        def register(func):
+            self.handlers[kind] = func
+            return func
+        return register
+
+    def enqueue(self, kind, payload=None, user_id=None, dedup_key=None, priority=0, delay=0):
+        """Add a job and commit; returns the job.
+
+        If a queued or running job with the same ``dedup_key`` exists, that
+        job is returned instead (with its priority raised if needed), so
+        repeated sync requests from one user do not pile up.
+        """
+        Job = self.model
+        if dedup_key:
+            existing = self._active(dedup_key)
+            if existing:
+                return self._bump(existing, priority)
+
+        job = Job(
+            kind=kind,
+            dedup_key=dedup_key,
+            user_id=user_id,
+            payload=json.dumps(payload or {}),
+            priority=priority,
+            status='queued',
+            attempts=0,
+            max_attempts=self.max_attempts,
+            run_at=datetime.utcnow() + timedelta(seconds=delay)
+        )
+        self.db.session.add(job)
+        try:
+            self.db.session.commit()
+        except IntegrityError:
+            # Another request enqueued the same job first
+            self.db.session.rollback()
+            existing = self._active(dedup_key)
+            if existing is None:
+                raise
+            return self._bump(existing, priority)
+
+        metrics.incr(f'jobs.enqueued.{kind}')
+        return job
+
+    def claim(self, worker_id, kinds=None):
+        """Lease the next runnable job to ``worker_id``; returns it or None"""
+        Job = self.model
+        now = datetime.utcnow()
+        runnable = or_(
+            Job.status == 'queued',
+            (Job.status == 'running') & (Job.lease_expires_at < now)
+        )
+
+        query = Job.query.filter(runnable, Job.run_at <= now, Job.attempts < Job.max_attempts)
+        if kinds:
+            query = query.filter(Job.kind.in_(kinds))
+        candidates = [row.id for row in query.order_by(Job.priority.desc(), Job.run_at, Job.id).limit(5)]
+
+        for job_id in candidates:
+            claimed = self.db.session.execute(
+                update(Job)
+                .where(Job.id == job_id, runnable, Job.attempts < Job.max_attempts)
+                .values(
+                    status='running',
+                    leased_by=worker_id,
+                    lease_expires_at=now + self.lease,
+                    attempts=Job.attempts + 1,
+                    started_at=now
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            self.db.session.commit()
+            if claimed:
+                metrics.incr('jobs.claimed')
+                return self.db.session.get(Job, job_id, populate_existing=True)
+        return None
+
+    def complete(self, job, result=None):
+        job.status = 'done'
+        job.result = json.dumps(result) if result is not None else None
+        job.error = None
+        job.finished_at = datetime.utcnow()
+        job.lease_expires_at = None
+        self.db.session.commit()
+        metrics.incr(f'jobs.done.{job.kind}')
+
+    def fail(self, job, error):
+        """Record a failure; the job is retried with backoff until it runs out of attempts"""
+        job.error = str(error)[:1000]
+        job.lease_expires_at = None
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            metrics.incr(f'jobs.failed.{job.kind}')
+        self.db.session.commit()
+
+    def reap(self):
+        """Mark jobs whose lease expired on their last attempt as failed"""
+        Job = self.model
+        reaped = Job.query.filter(
+            Job.status == 'running',
+            Job.lease_expires_at < datetime.utcnow(),
+            Job.attempts >= Job.max_attempts
+        ).update(
+            {'status': 'failed', 'error': 'Lease expired', 'finished_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        self.db.session.commit()
+        return reaped
+
+    def get(self, job_id):
+        return self.db.session.get(self.model, job_id)
+
+    def run(self, job, worker_id):
+        """Run a claimed job, extending its lease until the handler returns"""
+        handler = self.handlers.get(job.kind)
+        if handler is None:
+            job.attempts = job.max_attempts
+            self.fail(job, f"No handler for job kind {job.kind}")
+            return
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(self.db.engine, job.id, worker_id, stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            with metrics.timed(f'jobs.run.{job.kind}'):
+                result = handler(**json.loads(job.payload or '{}'))
+        except Exception as e:
+            self.db.session.rollback()
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            self.fail(job, e)
+        else:
+            self.complete(job, result)
+        finally:
+            stop.set()
+            heartbeat.join()
+
+    def work(self, worker_id=None, stop=None, poll_interval=POLL_INTERVAL, kinds=None):
+        """Claim and run jobs until ``stop`` is set; call inside an app context"""
+        worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                job = self.claim(worker_id, kinds)
+            except Exception as e:
+                self.db.session.rollback()
+                print(f"Job claim error: {e}")
+                job = None
+
+            if job is None:
+                stop.wait(poll_interval)
+                continue
+            self.run(job, worker_id)
+            self.db.session.remove()
+
+    def _active(self, dedup_key):
+        return self.model.query.filter(
+            self.model.dedup_key == dedup_key,
+            self.model.status.in_(ACTIVE_STATUSES)
+        ).first()
+
+    def _bump(self, job, priority):
+        if priority > (job.priority or 0):
+            job.priority = priority
+            self.db.session.commit()
+        metrics.incr('jobs.deduplicated')
+        return job
+
+    def _heartbeat(self, engine, job_id, worker_id, stop):
+        Job = self.model
+        interval = self.lease.total_seconds() / 3
+        while not stop.wait(interval):
+            try:
+                with engine.begin() as connection:
+                    connection.execute(
+                        update(Job.__table__)
+                        .where(Job.__table__.c.id == job_id, Job.__table__.c.leased_by == worker_id)
+                        .values(lease_expires_at=datetime.utcnow() + self.lease)
+                    )
+            except Exception as e:
+                print(f"Job {job_id} heartbeat error: {e}")
+
+def schedule_stale(queue, find_stale, kind, interval, stop=None):
+    """Every ``interval`` seconds enqueue low-priority ``kind`` jobs for stale items.
+
+    ``find_stale()`` returns ``(payload, user_id, dedup_key)`` tuples; call
+    inside an app context.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            queue.reap()
+            for payload, user_id, dedup_key in find_stale():
+                queue.enqueue(kind, payload, user_id=user_id, dedup_key=dedup_key, priority=PRIORITY_SCHEDULED)
+        except Exception as e:
+            queue.db.session.rollback()
+            print(f"Scheduler error: {e}")
+        queue.db.session.remove()
+        stop.wait(interval)
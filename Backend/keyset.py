@@ -0,0 +1,54 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+import metrics
+
+def encode_cursor(date, row_id):
+    """Opaque token for the position after the row ``(date, row_id)``; ``date`` may be None"""
+    raw = json.dumps([date.isoformat() if date else None, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+def decode_cursor(token):
+    """Return the ``(date, row_id)`` of a cursor; raises ValueError for a malformed token"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        date, row_id = json.loads(raw)
+        return (datetime.fromisoformat(date) if date is not None else None), int(row_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def keyset_page(query, date_column, id_column, cursor=None, limit=50):
+    """Return ``(rows, next_cursor)`` for one page of ``query``, newest first.
+
+    Rows are ordered by ``(date_column, id_column)`` descending and the next
+    page starts strictly after the last row returned, so with an index on
+    (..., date) each page is an index seek of ``limit`` rows however deep
+    it is: no OFFSET, and no COUNT. Rows without a date come last, by id
+    alone. ``next_cursor`` is None on the last page.
+    """
+    date = row_id = None
+    if cursor:
+        date, row_id = decode_cursor(cursor)
+
+    with metrics.timed('keyset.page'):
+        rows = []
+        if not cursor or date is not None:
+            dated = query.filter(date_column.is_not(None))
+            if cursor:
+                dated = dated.filter(tuple_(date_column, id_column) < tuple_(date, row_id))
+            rows = dated.order_by(date_column.desc(), id_column.desc()).limit(limit + 1).all()
+        if len(rows) <= limit:
+            # The dated rows are exhausted; continue into the rows without a date
+            undated = query.filter(date_column.is_(None))
+            if cursor and date is None:
+                undated = undated.filter(id_column < row_id)
+            rows += undated.order_by(id_column.desc()).limit(limit + 1 - len(rows)).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, date_column.key), getattr(last, id_column.key))
@@ -0,0 +1,74 @@
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_gauges = {}
+
+def incr(name, value=1):
+    """Increment a counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def observe(name, seconds):
+    """Record a duration (or any sample) under ``name``"""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0}
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+
+@contextmanager
+def timed(name):
+    """Time the wrapped block and record it with ``observe``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+def get_counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+def get_timing(name):
+    with _lock:
+        return dict(_timings.get(name, {'count': 0, 'total': 0.0, 'max': 0.0}))
+
+def register_gauge(name, func):
+    """Register a callable that is evaluated whenever a snapshot is taken"""
+    with _lock:
+        _gauges[name] = func
+
+def snapshot():
+    """Return all counters, timings and gauges as a JSON-serialisable dict"""
+    with _lock:
+        counters = dict(_counters)
+        timings = {
+            name: {**timing, 'avg': timing['total'] / timing['count'] if timing['count'] else 0.0}
+            for name, timing in _timings.items()
+        }
+        gauges = dict(_gauges)
+
+    gauge_values = {}
+    for name, func in gauges.items():
+        try:
+            gauge_values[name] = func()
+        except Exception as e:
+            gauge_values[name] = f"error: {e}"
+
+    return {
+        'counters': counters,
+        'timings': timings,
+        'gauges': gauge_values
+    }
+
+def reset():
+    """Clear counters and timings (gauges stay registered)"""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
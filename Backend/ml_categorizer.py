@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Local transaction categorizer: hashed character n-grams + multinomial naive Bayes.
+
+Usage:
+    python ml_categorizer.py export --db sqlite:///instance/namaai.db --out training.jsonl
+    python ml_categorizer.py train --data training.jsonl --out ml_models/categorizer.bin
+    python ml_categorizer.py train --db sqlite:///instance/namaai.db
+    python ml_categorizer.py predict "JAHEZ ORDER 1234" "صيدلية النهدي"
+"""
+
+import argparse
+import json
+import os
+import sys
+import zlib
+from collections import Counter, defaultdict
+
+import numpy as np
+
+import metrics
+from categorization_cache import normalize_description
+
+MAGIC = b'NAMACAT1'
+HEADER_ALIGN = 64
+DEFAULT_MODEL_PATH = os.getenv(
+    'CATEGORIZER_MODEL_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml_models', 'categorizer.bin')
+)
+
+def ngram_indices(description, n_features, ngram_range=(3, 5)):
+    """Hash the character n-grams of a normalized description into feature indices"""
+    text = f" {normalize_description(description)} "
+    indices = []
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        for start in range(len(text) - n + 1):
+            indices.append(zlib.crc32(text[start:start + n].encode('utf-8')) % n_features)
+    return indices
+
+class MLCategorizer:
+    """Naive Bayes categorizer over hashed character n-grams.
+
+    ``weights`` has shape (n_features, n_classes) and holds each feature's
+    log-likelihood relative to an unseen feature, so n-grams never seen in
+    training contribute nothing. It is a read-only memory map when loaded
+    from disk, so several worker processes share one copy. Confidence is the
+    posterior of the best class scaled by the share of n-grams the model knows.
+    """
+
+    def __init__(self, classes, weights, log_priors, log_norms, merchants=None,
+                 ngram_range=(3, 5), min_confidence=0.85, category_aliases=None):
+        self.classes = list(classes)
+        self.weights = weights
+        self.log_priors = np.asarray(log_priors, dtype=np.float32)
+        self.log_norms = np.asarray(log_norms, dtype=np.float32)
+        self.merchants = merchants or {}
+        self.ngram_range = tuple(ngram_range)
+        self.min_confidence = min_confidence
+        self.category_aliases = category_aliases or {}
+
+    @property
+    def n_features(self):
+        return self.weights.shape[0]
+
+    @classmethod
+    def train(cls, rows, n_features=2 ** 16, ngram_range=(3, 5), alpha=0.1, min_weight=0.3):
+        """Fit from ``(description, category, merchant, confidence)`` rows.
+
+        Each row counts with its confidence as weight, so manual corrections
+        (confidence 1.0) outweigh uncertain AI labels; rows below
+        ``min_weight`` (e.g. failed categorizations) are skipped.
+        """
+        samples = []
+        merchant_votes = defaultdict(Counter)
+        for description, category, merchant, confidence in rows:
+            weight = 0.5 if confidence is None else float(confidence)
+            if not description or not category or weight < min_weight:
+                continue
+            samples.append((description, category, weight))
+            if merchant and merchant != 'Unknown':
+                merchant_votes[normalize_description(description)][merchant] += weight
+
+        if not samples:
+            raise ValueError("No labelled transactions to train on")
+
+        classes = sorted({category for _, category, _ in samples})
+        class_index = {category: i for i, category in enumerate(classes)}
+
+        feature_rows, class_columns, weights = [], [], []
+        class_weights = np.zeros(len(classes), dtype=np.float64)
+        for description, category, weight in samples:
+            indices = ngram_indices(description, n_features, ngram_range)
+            feature_rows.extend(indices)
+            class_columns.extend([class_index[category]] * len(indices))
+            weights.extend([weight] * len(indices))
+            class_weights[class_index[category]] += weight
+
+        counts = np.zeros((n_features, len(classes)), dtype=np.float64)
+        np.add.at(counts, (np.array(feature_rows, dtype=np.int64), np.array(class_columns, dtype=np.int64)), weights)
+
+        weights = np.log1p(counts / alpha)
+        log_norms = np.log(alpha) - np.log(counts.sum(axis=0) + alpha * n_features)
+        log_priors = np.log(class_weights / class_weights.sum())
+
+        merchants = {
+            key: votes.most_common(1)[0][0]
+            for key, votes in merchant_votes.items()
+            if key and sum(votes.values()) >= 1.0
+        }
+
+        return cls(classes, weights.astype(np.float32), log_priors, log_norms, merchants, ngram_range)
+
+    def predict(self, descriptions):
+        """Predict categories for an array of descriptions.
+
+        Returns ``(categories, confidences)`` as NumPy arrays.
+        """
+        descriptions = list(descriptions)
+        if not descriptions:
+            return np.array([], dtype=object), np.array([], dtype=np.float32)
+
+        features = [ngram_indices(d, self.n_features, self.ngram_range) or [0] for d in descriptions]
+        lengths = np.array([len(f) for f in features])
+        offsets = np.concatenate(([0], np.cumsum(lengths[:-1])))
+        gathered = np.asarray(self.weights[np.concatenate(features)])
+
+        known = np.add.reduceat((gathered.max(axis=1) > 0).astype(np.float32), offsets)
+        scores = np.add.reduceat(gathered, offsets, axis=0) + known[:, None] * self.log_norms + self.log_priors
+
+        scores -= scores.max(axis=1, keepdims=True)
+        probs = np.exp(scores)
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        best = probs.argmax(axis=1)
+        categories = np.array(self.classes, dtype=object)[best]
+        return categories, probs[np.arange(len(best)), best] * (known / lengths)
+
+    def categorize(self, transactions, fallback=None):
+        """Categorize confidently predicted transactions; pass the rest to ``fallback``"""
+        transactions = list(transactions)
+        categories, confidences = self.predict(trans.get('description') or '' for trans in transactions)
+
+        results = {}
+        remaining = []
+        for trans, category, confidence in zip(transactions, categories, confidences):
+            if confidence >= self.min_confidence:
+                results[str(trans['id'])] = {
+                    'category': self.category_aliases.get(category, category),
+                    'merchant': self.merchants.get(normalize_description(trans.get('description')), 'Unknown'),
+                    'transaction_type': 'purchase',
+                    'confidence': float(confidence)
+                }
+            else:
+                remaining.append(trans)
+
+        metrics.incr('ml.classified', len(results))
+        metrics.incr('ml.passed_on', len(remaining))
+
+        if remaining and fallback:
+            results.update(fallback(remaining))
+        return results
+
+    def classify(self, description):
+        """Classify one description; returns a result dict (check its confidence)"""
+        categories, confidences = self.predict([description or ''])
+        return {
+            'category': self.category_aliases.get(categories[0], categories[0]),
+            'merchant': self.merchants.get(normalize_description(description), 'Unknown'),
+            'transaction_type': 'purchase',
+            'confidence': float(confidences[0])
+        }
+
+    def save(self, path):
+        """Write the model as a JSON header followed by the raw float32 weight matrix"""
+        header = json.dumps({
+            'classes': self.classes,
+            'log_priors': self.log_priors.tolist(),
+            'log_norms': self.log_norms.tolist(),
+            'ngram_range': list(self.ngram_range),
+            'shape': list(self.weights.shape),
+            'merchants': self.merchants
+        }, ensure_ascii=False).encode('utf-8')
+
+        prefix = len(MAGIC) + 8
+        padding = (-(prefix + len(header))) % HEADER_ALIGN
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write((len(header) + padding).to_bytes(8, 'little'))
+            f.write(header + b' ' * padding)
+            f.write(np.ascontiguousarray(self.weights, dtype='<f4').tobytes())
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Load a model file, memory-mapping the weight matrix"""
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a categorizer model")
+            header_length = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_length).decode('utf-8'))
+
+        weights = np.memmap(
+            path, dtype='<f4', mode='r',
+            offset=len(MAGIC) + 8 + header_length,
+            shape=tuple(header['shape'])
+        )
+        return cls(
+            header['classes'], weights, header['log_priors'], header['log_norms'],
+            header.get('merchants'), header.get('ngram_range', (3, 5)), **kwargs
+        )
+
+def load_default(**kwargs):
+    """Load the model from CATEGORIZER_MODEL_PATH, or return None if there is none"""
+    if not os.path.exists(DEFAULT_MODEL_PATH):
+        return None
+    try:
+        return MLCategorizer.load(DEFAULT_MODEL_PATH, **kwargs)
+    except Exception as e:
+        print(f"Error loading categorizer model: {e}")
+        return None
+
+def read_training_rows(db_url, table):
+    """Read (description, category, merchant, confidence) rows from the DB"""
+    from sqlalchemy import create_engine, inspect, text
+
+    engine = create_engine(db_url)
+    columns = {column['name'] for column in inspect(engine).get_columns(table)}
+    confidence = 'confidence_score' if 'confidence_score' in columns else 'NULL'
+    query = text(
+        f"SELECT description, category, merchant, {confidence} FROM {table} "
+        f"WHERE category IS NOT NULL AND description IS NOT NULL"
+    )
+    with engine.connect() as connection:
+        return [tuple(row) for row in connection.execute(query)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and use the local transaction categorizer")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_cmd = commands.add_parser('export', help='Export labelled transactions to JSONL')
+    export_cmd.add_argument('--db', default=os.getenv('DATABASE_URL', 'sqlite:///instance/namaai.db'))
+    export_cmd.add_argument('--table', default='transactions')
+    export_cmd.add_argument('--out', required=True)
+
+    train_cmd = commands.add_parser('train', help='Train a model from the DB or an exported JSONL file')
+    train_cmd.add_argument('--db', default=os.getenv('DATABASE_URL', 'sqlite:///instance/namaai.db'))
+    train_cmd.add_argument('--table', default='transactions')
+    train_cmd.add_argument('--data', help='JSONL file written by the export command')
+    train_cmd.add_argument('--features', type=int, default=2 ** 16)
+    train_cmd.add_argument('--out', default=DEFAULT_MODEL_PATH)
+
+    predict_cmd = commands.add_parser('predict', help='Load a model and categorize descriptions')
+    predict_cmd.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    predict_cmd.add_argument('descriptions', nargs='*', help='Descriptions (read from stdin if omitted)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        rows = read_training_rows(args.db, args.table)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            for description, category, merchant, confidence in rows:
+                f.write(json.dumps({
+                    'description': description,
+                    'category': category,
+                    'merchant': merchant,
+                    'confidence': confidence
+                }, ensure_ascii=False) + '\n')
+        print(f"Exported {len(rows)} transactions to {args.out}")
+
+    elif args.command == 'train':
+        if args.data:
+            with open(args.data, encoding='utf-8') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            rows = [(r.get('description'), r.get('category'), r.get('merchant'), r.get('confidence')) for r in records]
+        else:
+            rows = read_training_rows(args.db, args.table)
+
+        model = MLCategorizer.train(rows, n_features=args.features)
+        model.save(args.out)
+        size_kb = os.path.getsize(args.out) / 1024
+        print(f"Trained on {len(rows)} rows, {len(model.classes)} categories -> {args.out} ({size_kb:.0f} KB)")
+
+    elif args.command == 'predict':
+        model = MLCategorizer.load(args.model)
+        descriptions = args.descriptions or [line.strip() for line in sys.stdin if line.strip()]
+        categories, confidences = model.predict(descriptions)
+        for description, category, confidence in zip(descriptions, categories, confidences):
+            print(f"{confidence:.2f}  {category:<28}  {description}")
+
+if __name__ == '__main__':
+    main()
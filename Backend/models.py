@@ -2,6 +2,9 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import json
 
+from money import Money
+from serialization import json_value
+
 db = SQLAlchemy()
 
 class User(db.Model):
@@ -68,7 +71,7 @@ class Account(db.Model):
     __tablename__ = 'accounts'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     account_id = db.Column(db.String(100), nullable=False, index=True)
     account_name = db.Column(db.String(100))
     account_type = db.Column(db.String(50))
@@ -76,40 +79,45 @@ class Account(db.Model):
     bank_name = db.Column(db.String(100))
     provider_id = db.Column(db.String(20))
     iban = db.Column(db.String(50))
-    balance = db.Column(db.Float, default=0.0)
-    available_balance = db.Column(db.Float, default=0.0)
+    balance = db.Column(Money, default=0.0)
+    available_balance = db.Column(Money, default=0.0)
     currency = db.Column(db.String(10), default='SAR')
     status = db.Column(db.String(20), default='ACTIVE')
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Sync cursor (high-water mark of transactions already stored)
+    sync_cursor_date = db.Column(db.DateTime)
+    last_synced_at = db.Column(db.DateTime)
+    
     # Relationships
     transactions = db.relationship('Transaction', backref='account', lazy=True, cascade='all, delete-orphan')
     
+    # Columns in the API representation; list endpoints select them as tuples
+    JSON_FIELDS = (
+        'id', 'account_id', 'account_name', 'account_type', 'bank_name', 'provider_id', 'iban',
+        'balance', 'available_balance', 'currency', 'status', 'last_updated', 'last_synced_at'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'account_id': self.account_id,
-            'account_name': self.account_name,
-            'account_type': self.account_type,
-            'bank_name': self.bank_name,
-            'provider_id': self.provider_id,
-            'iban': self.iban,
-            'balance': self.balance,
-            'available_balance': self.available_balance,
-            'currency': self.currency,
-            'status': self.status,
-            'last_updated': self.last_updated.isoformat() if self.last_updated else None
-        }
+        return {name: json_value(getattr(self, name)) for name in self.JSON_FIELDS}
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('uq_transactions_account_transaction', 'account_id', 'transaction_id', unique=True),
+        # Dashboard and per-account reads, newest first
+        db.Index('ix_transactions_user_date', 'user_id', 'transaction_date'),
+        db.Index('ix_transactions_account_date', 'account_id', 'transaction_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
+    # Copied from the account so per-user reads need no join
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     transaction_id = db.Column(db.String(100), nullable=False, index=True)
     description = db.Column(db.Text)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     currency = db.Column(db.String(10), default='SAR')
     credit_debit = db.Column(db.String(10))  # Credit, Debit
     transaction_date = db.Column(db.DateTime, index=True)
@@ -129,27 +137,111 @@ class Transaction(db.Model):
     
     # Reference fields
     reference_number = db.Column(db.String(100))
-    balance_after = db.Column(db.Float)
+    balance_after = db.Column(Money)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Columns in the API representation; list endpoints select them as tuples
+    JSON_FIELDS = (
+        'id', 'transaction_id', 'description', 'amount', 'currency', 'credit_debit', 'transaction_date',
+        'category', 'subcategory', 'merchant', 'merchant_category', 'is_recurring', 'is_essential',
+        'confidence_score'
+    )
+    
+    def to_dict(self):
+        return {name: json_value(getattr(self, name)) for name in self.JSON_FIELDS}
+
+class CategorizationCacheEntry(db.Model):
+    __tablename__ = 'categorization_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(200), unique=True, nullable=False, index=True)  # normalized description
+    category = db.Column(db.String(50))
+    merchant = db.Column(db.String(100))
+    confidence = db.Column(db.Float)
+    hits = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ContentCacheEntry(db.Model):
+    __tablename__ = 'content_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), unique=True, nullable=False, index=True)  # template version, category, band, language
+    value = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    fresh_until = db.Column(db.DateTime, nullable=False)
+    stale_until = db.Column(db.DateTime, nullable=False, index=True)
+
+class SpendingRollup(db.Model):
+    __tablename__ = 'spending_rollups'
+    __table_args__ = (
+        db.Index('uq_spending_rollups_key', 'user_id', 'account_id', 'day', 'category', 'credit_debit', unique=True),
+        db.Index('ix_spending_rollups_user_day', 'user_id', 'day'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    credit_debit = db.Column(db.String(10), nullable=False)
+    total = db.Column(Money, default=0.0)
+    count = db.Column(db.Integer, default=0)
+    min_amount = db.Column(Money)
+    max_amount = db.Column(Money)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FinancialContextVersion(db.Model):
+    __tablename__ = 'financial_context_versions'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SyncJob(db.Model):
+    __tablename__ = 'sync_jobs'
+    __table_args__ = (
+        db.Index('ix_sync_jobs_claim', 'status', 'priority', 'run_at'),
+        # At most one queued or running job per dedup key
+        db.Index(
+            'uq_sync_jobs_active_dedup', 'dedup_key', unique=True,
+            sqlite_where=db.text("status IN ('queued', 'running')"),
+            postgresql_where=db.text("status IN ('queued', 'running')")
+        ),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    dedup_key = db.Column(db.String(200))
+    user_id = db.Column(db.Integer, index=True)
+    payload = db.Column(db.Text)  # JSON string with handler kwargs
+    priority = db.Column(db.Integer, default=0)
+    status = db.Column(db.String(20), default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow)
+    leased_by = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    result = db.Column(db.Text)  # JSON string
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
     def to_dict(self):
         return {
             'id': self.id,
-            'transaction_id': self.transaction_id,
-            'description': self.description,
-            'amount': self.amount,
-            'currency': self.currency,
-            'credit_debit': self.credit_debit,
-            'transaction_date': self.transaction_date.isoformat() if self.transaction_date else None,
-            'category': self.category,
-            'subcategory': self.subcategory,
-            'merchant': self.merchant,
-            'merchant_category': self.merchant_category,
-            'is_recurring': self.is_recurring,
-            'is_essential': self.is_essential,
-            'confidence_score': self.confidence_score
+            'kind': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
         }
 
 class ChatSession(db.Model):
@@ -159,50 +251,120 @@ class ChatSession(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     session_id = db.Column(db.String(100), nullable=False, index=True)
     title = db.Column(db.String(200))
-    messages = db.Column(db.Text)  # JSON string
+    messages = db.Column(db.Text)  # Legacy JSON string, moved to chat_messages on first access
     context_data = db.Column(db.Text)  # JSON string for context
     total_messages = db.Column(db.Integer, default=0)
+    summary = db.Column(db.Text)  # Running summary of the messages up to summary_seq
+    summary_seq = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     
-    def get_messages(self):
-        if self.messages:
-            return json.loads(self.messages)
-        return []
+    # Relationships
+    chat_messages = db.relationship('ChatMessage', backref='session', lazy='dynamic',
+                                    order_by='ChatMessage.seq', cascade='all, delete-orphan')
+    
+    def get_messages(self, limit=None, before_seq=None, after_seq=None):
+        """Return messages oldest first; with ``limit``, only the most recent ones"""
+        self.migrate_json_messages()
+        query = self.chat_messages.order_by(None).order_by(ChatMessage.seq.desc())
+        if before_seq is not None:
+            query = query.filter(ChatMessage.seq < before_seq)
+        if after_seq is not None:
+            query = query.filter(ChatMessage.seq > after_seq)
+        if limit is not None:
+            query = query.limit(limit)
+        return [message.to_dict() for message in reversed(query.all())]
     
     def add_message(self, role, content):
-        messages = self.get_messages()
-        messages.append({
-            'role': role,
-            'content': content,
-            'timestamp': datetime.utcnow().isoformat()
-        })
-        self.messages = json.dumps(messages)
-        self.total_messages = len(messages)
+        """Append a message after the last stored one.
+
+        The seq comes from the stored maximum, read under a lock on the
+        session row where the database supports it, not from a counter read
+        earlier in the request, so concurrent turns get distinct seqs.
+        """
+        self.migrate_json_messages()
+        db.session.flush()
+        db.session.query(ChatSession.id).filter(ChatSession.id == self.id).with_for_update().one()
+        last_seq = db.session.query(db.func.max(ChatMessage.seq))\
+            .filter(ChatMessage.session_id == self.id).scalar() or 0
+        self.total_messages = last_seq + 1
+        self.chat_messages.append(ChatMessage(seq=self.total_messages, role=role, content=content))
         self.updated_at = datetime.utcnow()
     
-    def to_dict(self):
-        return {
+    def migrate_json_messages(self):
+        """Move messages stored in the legacy JSON column into chat_messages"""
+        if not self.messages:
+            return
+        legacy = json.loads(self.messages)
+        for seq, message in enumerate(legacy, start=1):
+            timestamp = message.get('timestamp')
+            self.chat_messages.append(ChatMessage(
+                seq=seq,
+                role=message.get('role'),
+                content=message.get('content'),
+                created_at=datetime.fromisoformat(timestamp) if timestamp else None
+            ))
+        self.total_messages = len(legacy)
+        self.messages = None
+    
+    @classmethod
+    def migrate_all_json_messages(cls, batch_size=200):
+        """Migrate every session that still has legacy JSON messages; returns the count"""
+        migrated = 0
+        while True:
+            sessions = cls.query.filter(cls.messages.isnot(None)).limit(batch_size).all()
+            if not sessions:
+                return migrated
+            for session in sessions:
+                session.migrate_json_messages()
+            db.session.commit()
+            migrated += len(sessions)
+    
+    def to_dict(self, include_messages=False):
+        data = {
             'id': self.id,
             'session_id': self.session_id,
             'title': self.title,
-            'messages': self.get_messages(),
             'total_messages': self.total_messages,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_messages:
+            data['messages'] = self.get_messages()
+        return data
+
+class ChatMessage(db.Model):
+    __tablename__ = 'chat_messages'
+    __table_args__ = (
+        db.Index('uq_chat_messages_session_seq', 'session_id', 'seq', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('chat_sessions.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # 1-based position in the session
+    role = db.Column(db.String(20), nullable=False)  # user, assistant
+    content = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'role': self.role,
+            'content': self.content,
+            'timestamp': self.created_at.isoformat() if self.created_at else None
+        }
 
 class FinancialGoal(db.Model):
     __tablename__ = 'financial_goals'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     goal_type = db.Column(db.String(50))  # saving, investment, debt_payoff, etc.
-    target_amount = db.Column(db.Float, nullable=False)
-    current_amount = db.Column(db.Float, default=0.0)
+    target_amount = db.Column(Money, nullable=False)
+    current_amount = db.Column(Money, default=0.0)
     target_date = db.Column(db.Date)
     priority = db.Column(db.String(20), default='medium')  # low, medium, high
     status = db.Column(db.String(20), default='active')  # active, completed, paused
@@ -236,9 +398,9 @@ class Budget(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     month = db.Column(db.Integer, nullable=False)  # 1-12
     year = db.Column(db.Integer, nullable=False)
-    total_income = db.Column(db.Float, default=0.0)
-    total_budgeted = db.Column(db.Float, default=0.0)
-    total_spent = db.Column(db.Float, default=0.0)
+    total_income = db.Column(Money, default=0.0)
+    total_budgeted = db.Column(Money, default=0.0)
+    total_spent = db.Column(Money, default=0.0)
     categories = db.Column(db.Text)  # JSON string with category budgets
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -314,8 +476,8 @@ class Investment(db.Model):
     symbol = db.Column(db.String(20))
     name = db.Column(db.String(200))
     quantity = db.Column(db.Float, default=0.0)
-    purchase_price = db.Column(db.Float)
-    current_price = db.Column(db.Float)
+    purchase_price = db.Column(Money)
+    current_price = db.Column(Money)
     currency = db.Column(db.String(10), default='SAR')
     purchase_date = db.Column(db.Date)
     is_sharia_compliant = db.Column(db.Boolean, default=True)
@@ -0,0 +1,143 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+from sqlalchemy import BigInteger, func, inspect, type_coerce
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.types import Integer, TypeDecorator
+
+# Amounts are stored as integer halalas (1/100 riyal); the currency code
+# stays in the row's ``currency`` column where it has one
+MINOR_UNITS = 100
+
+def to_minor(amount):
+    """Riyals (float, str, Decimal or int) to integer halalas, rounding half up"""
+    if amount is None:
+        return None
+    return int((Decimal(str(amount)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_minor(units):
+    """Integer halalas to riyals; exact to the cent for any realistic amount"""
+    if units is None:
+        return None
+    return int(units) / MINOR_UNITS
+
+class Money(TypeDecorator):
+    """A money amount stored as integer halalas (BIGINT).
+
+    Values are given and read as riyals, so model code and JSON output are
+    unchanged, but the database holds exact integers: SUM, MIN and MAX over
+    a Money column are integer arithmetic, converted once per result.
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_minor(value)
+
+    def process_literal_param(self, value, dialect):
+        return to_minor(value)
+
+    def process_result_value(self, value, dialect):
+        return from_minor(value)
+
+def money_sum(column):
+    """SQL SUM of a Money column, zero over no rows: added as integers, read back as riyals once"""
+    return func.coalesce(func.sum(column), 0)
+
+def halalas(column):
+    """A Money column read as its stored integer halalas (NULL as 0), for rows summed with ``sum_money``"""
+    return func.coalesce(type_coerce(column, BigInteger), 0)
+
+def sum_money(units):
+    """Exact sum, in riyals, of integer halalas selected with ``halalas``, added as a NumPy int64 array"""
+    return from_minor(int(np.fromiter(units, dtype=np.int64).sum()))
+
+def ensure_minor_units(db, *models):
+    """Convert existing float money columns of ``models`` to integer halalas.
+
+    ``create_all`` does not alter tables that already exist. A column still
+    reflected as non-integer holds riyals: PostgreSQL converts it in place;
+    SQLite, which cannot change a column's type, rebuilds the table with the
+    current schema and copies the rows across. Safe to run on every start.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    for model in models:
+        table = model.__table__
+        pending, existing = _float_money_columns(inspector, table)
+        if not pending:
+            continue
+
+        preparer = engine.dialect.identifier_preparer
+        with engine.begin() as connection:
+            if engine.dialect.name == 'postgresql':
+                for name in pending:
+                    column = preparer.quote(name)
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE {preparer.format_table(table)} ALTER COLUMN {column} '
+                        f'TYPE BIGINT USING ROUND({column} * {MINOR_UNITS})::BIGINT'
+                    )
+            elif engine.dialect.name == 'sqlite':
+                indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+                _rebuild_sqlite(connection, table, pending, existing, indexes, preparer)
+            else:
+                print(f"Money columns of {table.name} still hold riyals; convert {pending} to halalas manually")
+                continue
+        print(f"Converted {', '.join(pending)} in {table.name} to integer halalas")
+
+def require_minor_units(db, *models):
+    """Raise RuntimeError if a money column of ``models`` still holds float riyals.
+
+    Every process that reads or writes money checks this before it starts:
+    against an unconverted table, ``Money`` would read 250.0 as 2.50 and
+    write halalas that the conversion would later multiply again.
+    """
+    inspector = inspect(db.engine)
+    pending = {}
+    for model in models:
+        columns = _float_money_columns(inspector, model.__table__)[0]
+        if columns:
+            pending[model.__table__.name] = columns
+    if pending:
+        listed = '; '.join(f"{table}: {', '.join(columns)}" for table, columns in pending.items())
+        raise RuntimeError(f"Money columns still hold riyals ({listed}); run the database migration first")
+
+def _float_money_columns(inspector, table):
+    """``(pending, existing)``: Money columns of ``table`` not yet stored as integers, and the reflected column types"""
+    money = [column.name for column in table.columns if isinstance(column.type, Money)]
+    if not money or not inspector.has_table(table.name):
+        return [], {}
+    existing = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+    return [name for name in money if name in existing and not isinstance(existing[name], Integer)], existing
+
+def _rebuild_sqlite(connection, table, pending, existing, indexes, preparer):
+    """Recreate ``table`` with its declared schema, copying rows and scaling ``pending`` columns.
+
+    Declared unique indexes are only recreated if the old table already had
+    them (``indexes``); the others may still have duplicates to remove first.
+    """
+    metadata = table.metadata
+    rebuilt = table.to_metadata(metadata, name=f'{table.name}__minor_units')
+    # Left behind if an earlier rebuild failed part way
+    connection.exec_driver_sql(f'DROP TABLE IF EXISTS {preparer.quote(rebuilt.name)}')
+    try:
+        connection.execute(CreateTable(rebuilt))
+    finally:
+        metadata.remove(rebuilt)
+
+    names = [column.name for column in table.columns if column.name in existing]
+    values = [
+        f'CAST(ROUND({preparer.quote(name)} * {MINOR_UNITS}) AS INTEGER)' if name in pending
+        else preparer.quote(name)
+        for name in names
+    ]
+    connection.exec_driver_sql(
+        f'INSERT INTO {preparer.quote(rebuilt.name)} ({", ".join(preparer.quote(name) for name in names)}) '
+        f'SELECT {", ".join(values)} FROM {preparer.format_table(table)}'
+    )
+    connection.exec_driver_sql(f'DROP TABLE {preparer.format_table(table)}')
+    connection.exec_driver_sql(f'ALTER TABLE {preparer.quote(rebuilt.name)} RENAME TO {preparer.format_table(table)}')
+    for index in table.indexes:
+        if not index.unique or index.name in indexes:
+            index.create(connection)
@@ -0,0 +1,98 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Upper bound on pages followed for one request, in case the API never says "last page"
+MAX_PAGES = int(os.getenv('TARABUT_MAX_PAGES', '200'))
+
+def has_next_page(data, page):
+    """Decide from a page payload whether another page follows it.
+
+    Uses ``meta.totalPages`` when present, then ``links.next``; without
+    either, keeps going until a page comes back empty.
+    """
+    meta = data.get('meta') or {}
+    total_pages = meta.get('totalPages')
+    if total_pages is not None:
+        return page < int(total_pages)
+
+    links = data.get('links') or {}
+    if 'next' in links:
+        return bool(links['next'])
+
+    return bool(data.get('transactions'))
+
+def iter_pages(fetch_page, prefetch=True, max_pages=MAX_PAGES):
+    """Yield page payloads from ``fetch_page(page)``, starting at page 1.
+
+    With ``prefetch`` the next page is requested in a background thread
+    while the caller processes the current one, so network time overlaps
+    with categorization and DB writes. ``fetch_page`` returns the decoded
+    payload or None on failure; a failed page raises RuntimeError rather
+    than silently truncating the history.
+    """
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page = 1
+        pending = None
+        while True:
+            data = pending.result() if pending else fetch_page(page)
+            if data is None:
+                raise RuntimeError(f"Failed to fetch page {page}")
+            metrics.incr('pagination.pages')
+
+            more = has_next_page(data, page)
+            if more and page >= max_pages:
+                print(f"Stopped after {max_pages} pages; later pages were not fetched")
+                more = False
+            pending = executor.submit(fetch_page, page + 1) if more and executor else None
+
+            yield data
+
+            if not more:
+                return
+            page += 1
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def iter_items(fetch_page, key='transactions', **kwargs):
+    """Yield the items under ``key`` from every page, one at a time"""
+    for data in iter_pages(fetch_page, **kwargs):
+        yield from data.get(key) or []
+
+async def aiter_pages(fetch_page, prefetch=True, max_pages=MAX_PAGES):
+    """``iter_pages`` for an async ``fetch_page``; the next page is prefetched as a task"""
+    page = 1
+    pending = None
+    try:
+        while True:
+            data = await (pending if pending else fetch_page(page))
+            pending = None
+            if data is None:
+                raise RuntimeError(f"Failed to fetch page {page}")
+            metrics.incr('pagination.pages')
+
+            more = has_next_page(data, page)
+            if more and page >= max_pages:
+                print(f"Stopped after {max_pages} pages; later pages were not fetched")
+                more = False
+            if more and prefetch:
+                pending = asyncio.ensure_future(fetch_page(page + 1))
+
+            yield data
+
+            if not more:
+                return
+            page += 1
+    finally:
+        if pending:
+            pending.cancel()
+
+async def aiter_items(fetch_page, key='transactions', **kwargs):
+    """Yield the items under ``key`` from every page of an async ``fetch_page``"""
+    async for data in aiter_pages(fetch_page, **kwargs):
+        for item in data.get(key) or []:
+            yield item
@@ -0,0 +1,121 @@
+import json
+import math
+import os
+import re
+
+import metrics
+
+# Input tokens per chat call (system context, summary, history and the new message)
+CHAT_TOKEN_BUDGET = int(os.getenv('CHAT_PROMPT_TOKEN_BUDGET', '2000'))
+# Most recent messages considered for the prompt; older ones live in the summary
+HISTORY_WINDOW = int(os.getenv('CHAT_HISTORY_WINDOW', '10'))
+# Unsummarised messages that fell out of the prompt before a summary refresh is queued
+SUMMARY_BATCH = int(os.getenv('CHAT_SUMMARY_BATCH', '4'))
+
+# Chat format overhead per message and per request (role markers, separators)
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REQUEST = 3
+
+# Pieces the way a BPE pre-tokenizer splits text: words with their leading
+# space, runs of up to three digits, punctuation runs and whitespace
+_PIECES = re.compile(
+    r" ?[A-Za-z]+| ?[\u0600-\u06ff\u0750-\u077f]+| ?[0-9]{1,3}| ?[^\sA-Za-z0-9\u0600-\u06ff\u0750-\u077f]+|\s+"
+)
+
+def count_tokens(text):
+    """Estimate the tokens of ``text`` locally, without a tokenizer download.
+
+    Common English words are one token and longer ones about one per six
+    letters; Arabic words about one per three letters; numbers one per
+    three digits; punctuation about one per two characters. Errs on the
+    high side, which is the safe direction for a budget.
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        word = piece.lstrip(' ')
+        if not word:
+            tokens += 1
+        elif word[0].isspace():
+            tokens += 1 if len(word) < 8 else math.ceil(len(word) / 8)
+        elif word[0].isascii() and word[0].isalpha():
+            tokens += 1 + (len(word) - 1) // 6
+        elif word[0].isdigit():
+            tokens += 1
+        elif '\u0600' <= word[0] <= '\u077f':
+            tokens += math.ceil(len(word) / 3)
+        else:
+            tokens += math.ceil(len(word) / 2)
+    return tokens
+
+def message_tokens(messages):
+    """Estimated prompt tokens of a list of chat messages"""
+    return TOKENS_PER_REQUEST + sum(
+        TOKENS_PER_MESSAGE + count_tokens(message.get('content') or '') for message in messages
+    )
+
+def compact_json(data):
+    """JSON without indentation or spaces after separators, for embedding in prompts"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+
+def compact_text(text):
+    """Strip indentation and blank lines from a prompt written as an indented literal"""
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+class PromptBuilder:
+    """Assembles chat messages within a token budget.
+
+    The system prompt (without its indentation, plus the conversation
+    summary, if any) and the new user message are always sent; history is added newest first while it
+    fits, so a long chat keeps its most recent turns and the summary
+    covers the rest.
+    """
+
+    def __init__(self, budget=CHAT_TOKEN_BUDGET):
+        self.budget = budget
+
+    def build(self, system_prompt, history, current_message, summary=None):
+        """Return ``(messages, first_seq)``.
+
+        ``history`` is oldest first, as dicts with role and content (and
+        seq); ``first_seq`` is the seq of the oldest history message that
+        made it into the prompt (None when none did or seqs are absent).
+        """
+        system_prompt = compact_text(system_prompt)
+        if summary:
+            system_prompt = f"{system_prompt}\nEarlier in this conversation (summary):\n{summary}"
+        system = {"role": "system", "content": system_prompt}
+        current = {"role": "user", "content": current_message}
+
+        remaining = self.budget - message_tokens([system, current])
+        kept = []
+        for message in reversed(history):
+            cost = TOKENS_PER_MESSAGE + count_tokens(message.get('content') or '')
+            if cost > remaining:
+                break
+            remaining -= cost
+            kept.append(message)
+        kept.reverse()
+
+        if len(kept) < len(history):
+            metrics.incr('prompt.history_trimmed', len(history) - len(kept))
+
+        messages = [system] + [
+            {"role": message["role"], "content": message["content"]} for message in kept
+        ] + [current]
+        metrics.observe('prompt.tokens', message_tokens(messages))
+        return messages, kept[0].get('seq') if kept else None
+
+def summary_due(summary_seq, first_seq, last_seq):
+    """Return the seq to summarise through, or None if the summary is fresh enough.
+
+    Messages after ``summary_seq`` that are older than the oldest message
+    in the prompt (``first_seq``; everything up to ``last_seq`` when no
+    history fit) are covered by neither; a refresh is due once there are
+    ``SUMMARY_BATCH`` of them.
+    """
+    through = (first_seq - 1) if first_seq is not None else last_seq
+    if through is None or through - (summary_seq or 0) < SUMMARY_BATCH:
+        return None
+    return through
@@ -1,14 +1,70 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from datetime import datetime, timedelta
-from models import db, User, Account, Transaction, ChatSession, FinancialGoal, Budget, Insight
-from services.tarabut_service import TarabutService
-from services.ai_service import AIFinancialAdvisor
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Account, Transaction, ChatSession, ChatMessage, FinancialGoal, Budget, Investment, Insight, CategorizationCacheEntry, SyncJob, SpendingRollup, FinancialContextVersion, ContentCacheEntry
+from services.tarabut_service import AsyncTarabutService, TarabutService
+from services.ai_service import AIFinancialAdvisor, AsyncAIFinancialAdvisor, ALTERNATIVES_TEMPLATE_VERSION
+from categorization_cache import CategorizationCache
+from rule_classifier import RuleClassifier
+from ml_categorizer import load_default
+from transaction_ingest import (
+    advance_cursor, ensure_columns, ensure_indexes, ensure_unique_index, ensure_user_column, ingest_stream,
+    remove_duplicate_transactions, sync_window
+)
+from job_queue import JobQueue, PRIORITY_USER
+from spending_rollups import SpendingRollups
+from chat_stream import SSE_HEADERS, stream_reply
+from financial_context import FinancialContextCache, build_snapshot, recent_transactions_query
+from prompt_builder import HISTORY_WINDOW, summary_due
+from dashboard import DASHBOARD_HEADERS, build_dashboard, dashboard_etag, dashboard_since
+from keyset import keyset_page
+from money import ensure_minor_units, money_sum, require_minor_units
+from http_transport import run_async
+from serialization import STREAM_BATCH_ROWS, columns, json_response, row_dicts, stream_json
+from content_cache import ContentCache, content_key, normalize_language, spending_band
+from semantic_cache import SemanticCache, answer_template
+import metrics
+import os
 import json
+import time
 import uuid
 
 # Initialize services
 tarabut_service = TarabutService()
 ai_advisor = AIFinancialAdvisor()
+# Async services, run on the process-wide service loop with run_async: outbound calls wait there instead of holding a thread
+async_tarabut = AsyncTarabutService()
+async_advisor = AsyncAIFinancialAdvisor(shared=ai_advisor)
+category_cache = CategorizationCache(db, CategorizationCacheEntry)
+content_cache = ContentCache(db, ContentCacheEntry)
+semantic_cache = SemanticCache()
+rule_classifier = RuleClassifier()
+ml_categorizer = load_default()
+job_queue = JobQueue(db, SyncJob)
+spending_rollups = SpendingRollups(db, SpendingRollup, Transaction, Account)
+financial_context = FinancialContextCache(
+    db, FinancialContextVersion,
+    lambda user_id: build_snapshot(db, Account, Transaction, spending_rollups, user_id),
+    account_model=Account
+)
+SYNC_STALE_HOURS = float(os.getenv('SYNC_STALE_HOURS', '6'))
+# Models with Money columns, converted to integer halalas by prepare_database
+MONEY_MODELS = (Account, Transaction, SpendingRollup, FinancialGoal, Budget, Investment)
+# Saves of one chat turn retried when a concurrent turn took the same seqs
+CHAT_SAVE_ATTEMPTS = 3
+
+def categorize_new_transactions(items):
+    """Categorize by rules, then the local model, then the cache, batching the rest to the AI"""
+    def from_cache(rest):
+        return category_cache.categorize(rest, ai_advisor.categorize_transactions)
+    
+    def from_model(rest):
+        if ml_categorizer:
+            return ml_categorizer.categorize(rest, fallback=from_cache)
+        return from_cache(rest)
+    
+    return rule_classifier.categorize(items, fallback=from_model)
 
 # Create blueprints
 auth_bp = Blueprint('auth', __name__, url_prefix='/api')
@@ -58,7 +114,7 @@ def register():
 def get_providers():
     """Get available bank providers"""
     try:
-        providers_data = tarabut_service.get_providers()
+        providers_data = run_async(async_tarabut.get_providers())
         if providers_data:
             return jsonify(providers_data)
         else:
@@ -71,7 +127,7 @@ def create_intent():
     """Create Tarabut intent for bank connection"""
     try:
         data = request.get_json()
-        intent_data = tarabut_service.create_intent(data)
+        intent_data = run_async(async_tarabut.create_intent(data))
         
         if intent_data:
             return jsonify(intent_data)
@@ -80,57 +136,124 @@ def create_intent():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Background sync jobs: endpoints enqueue and return stored data, workers call Tarabut and the AI
+@job_queue.handler('sync_accounts')
+def sync_user_accounts(user_id):
+    """Refresh a user's account list and balances from Tarabut"""
+    accounts_data = tarabut_service.get_accounts()
+    if not accounts_data or 'accounts' not in accounts_data:
+        raise RuntimeError('Failed to fetch accounts')
+    
+    existing_accounts = {
+        acc.account_id: acc for acc in Account.query.filter_by(user_id=user_id).all()
+    }
+    accounts = []
+    for acc_data in accounts_data['accounts']:
+        # Check if account exists in database
+        account = existing_accounts.get(acc_data.get('accountId'))
+        
+        if not account:
+            # Create new account
+            account = Account(
+                user_id=user_id,
+                account_id=acc_data.get('accountId'),
+                account_name=acc_data.get('accountName'),
+                account_type=acc_data.get('accountType'),
+                bank_name=acc_data.get('bankName'),
+                provider_id=acc_data.get('providerId'),
+                iban=acc_data.get('iban')
+            )
+            db.session.add(account)
+            existing_accounts[account.account_id] = account
+        accounts.append(account)
+    
+    # Fetch all balances in parallel, then apply them in one commit
+    balances, balance_errors = tarabut_service.get_account_balances(
+        [account.account_id for account in accounts], user_key=user_id
+    )
+    
+    for account in accounts:
+        balance_data = balances.get(account.account_id)
+        if balance_data and 'balances' in balance_data:
+            balance_info = balance_data['balances'][0]
+            account.balance = float(balance_info.get('amount', {}).get('value', 0))
+            account.available_balance = float(balance_info.get('availableAmount', {}).get('value', 0))
+            account.currency = balance_info.get('amount', {}).get('currency', 'SAR')
+            account.last_updated = datetime.utcnow()
+    
+    financial_context.invalidate(user_id)
+    db.session.commit()
+    return {'accounts': len(accounts), 'balanceErrors': balance_errors}
+
+@job_queue.handler('sync_account')
+def sync_account_data(account_db_id, full=False):
+    """Sync one account's balance and new transactions from the bank"""
+    account = Account.query.get(account_db_id)
+    if not account:
+        return {'newTransactions': 0}
+    
+    # Sync balance
+    balance_data = tarabut_service.get_account_balance(account.account_id)
+    if balance_data and 'balances' in balance_data:
+        balance_info = balance_data['balances'][0]
+        account.balance = float(balance_info.get('amount', {}).get('value', 0))
+        account.available_balance = float(balance_info.get('availableAmount', {}).get('value', 0))
+        account.last_updated = datetime.utcnow()
+    
+    # Sync transactions booked since the account's cursor
+    from_date, to_date = sync_window(account, full=full)
+    transactions = tarabut_service.iter_account_transactions(
+        account.account_id, from_date=from_date, to_date=to_date
+    )
+    def on_chunk(rows):
+        advance_cursor(account, rows, synced_at=to_date)
+        spending_rollups.add(account.user_id, account.id, rows)
+    
+    # Pages stream in while earlier chunks are categorized and inserted
+    new_count = ingest_stream(
+        db, Transaction, account.id, transactions,
+        categorize=categorize_new_transactions, on_chunk=on_chunk, user_id=account.user_id
+    )
+    account.last_synced_at = to_date
+    
+    financial_context.invalidate(account.user_id)
+    db.session.commit()
+    return {
+        'newTransactions': new_count,
+        'syncWindow': {'from': from_date.isoformat(), 'to': to_date.isoformat(), 'full': full}
+    }
+
+def find_stale_accounts():
+    """Accounts not synced within SYNC_STALE_HOURS, for the background scheduler"""
+    cutoff = datetime.utcnow() - timedelta(hours=SYNC_STALE_HOURS)
+    stale = Account.query.filter(
+        Account.status == 'ACTIVE',
+        db.or_(Account.last_synced_at.is_(None), Account.last_synced_at < cutoff)
+    ).limit(100).all()
+    return [
+        ({'account_db_id': account.id}, account.user_id, f"sync_account:{account.id}")
+        for account in stale
+    ]
+
 @accounts_bp.route('/<int:user_id>', methods=['GET'])
 def get_user_accounts(user_id):
-    """Get user accounts with balances"""
+    """Get stored accounts with balances and queue a refresh from Tarabut"""
     try:
-        user = User.query.get_or_404(user_id)
+        User.query.get_or_404(user_id)
         
-        # Get accounts from Tarabut
-        accounts_data = tarabut_service.get_accounts()
-        
-        if accounts_data and 'accounts' in accounts_data:
-            for acc_data in accounts_data['accounts']:
-                # Check if account exists in database
-                account = Account.query.filter_by(
-                    user_id=user_id,
-                    account_id=acc_data.get('accountId')
-                ).first()
-                
-                if not account:
-                    # Create new account
-                    account = Account(
-                        user_id=user_id,
-                        account_id=acc_data.get('accountId'),
-                        account_name=acc_data.get('accountName'),
-                        account_type=acc_data.get('accountType'),
-                        bank_name=acc_data.get('bankName'),
-                        provider_id=acc_data.get('providerId'),
-                        iban=acc_data.get('iban')
-                    )
-                    db.session.add(account)
-                
-                # Update balance
-                balance_data = tarabut_service.get_account_balance(account.account_id)
-                if balance_data and 'balances' in balance_data:
-                    balance_info = balance_data['balances'][0]
-                    account.balance = float(balance_info.get('amount', {}).get('value', 0))
-                    account.available_balance = float(balance_info.get('availableAmount', {}).get('value', 0))
-                    account.currency = balance_info.get('amount', {}).get('currency', 'SAR')
-                
-                account.last_updated = datetime.utcnow()
-            
-            db.session.commit()
-            
-            # Return updated accounts from database
-            user_accounts = Account.query.filter_by(user_id=user_id).all()
-            return jsonify({
-                'accounts': [acc.to_dict() for acc in user_accounts],
-                'totalBalance': sum(acc.balance for acc in user_accounts),
-                'totalAccounts': len(user_accounts)
-            })
-        else:
-            return jsonify({'accounts': [], 'totalBalance': 0, 'totalAccounts': 0})
+        job = job_queue.enqueue(
+            'sync_accounts', {'user_id': user_id},
+            user_id=user_id, dedup_key=f"sync_accounts:{user_id}", priority=PRIORITY_USER
+        )
+        
+        user_accounts = db.session.query(*columns(Account, Account.JSON_FIELDS)).filter_by(user_id=user_id).all()
+        return json_response({
+            'accounts': list(row_dicts(user_accounts, Account.JSON_FIELDS)),
+            'totalBalance': db.session.query(money_sum(Account.balance)).filter(Account.user_id == user_id).scalar(),
+            'totalAccounts': len(user_accounts),
+            'jobId': job.id,
+            'jobStatus': job.status
+        }, status=202)
             
     except Exception as e:
         db.session.rollback()
@@ -138,139 +261,140 @@ def get_user_accounts(user_id):
 
 @accounts_bp.route('/<int:account_db_id>/sync', methods=['POST'])
 def sync_account(account_db_id):
-    """Sync account data from bank"""
+    """Queue a sync of account data from bank (only new transactions unless ?full=true)"""
     try:
         account = Account.query.get_or_404(account_db_id)
+        full_sync = request.args.get('full', '').lower() in ('1', 'true', 'yes')
         
-        # Sync balance
-        balance_data = tarabut_service.get_account_balance(account.account_id)
-        if balance_data and 'balances' in balance_data:
-            balance_info = balance_data['balances'][0]
-            account.balance = float(balance_info.get('amount', {}).get('value', 0))
-            account.available_balance = float(balance_info.get('availableAmount', {}).get('value', 0))
-            account.last_updated = datetime.utcnow()
-        
-        # Sync recent transactions
-        transactions_data = tarabut_service.get_account_transactions(account.account_id)
-        if transactions_data and 'transactions' in transactions_data:
-            for trans_data in transactions_data['transactions']:
-                # Check if transaction exists
-                existing_trans = Transaction.query.filter_by(
-                    account_id=account.id,
-                    transaction_id=trans_data.get('transactionId')
-                ).first()
-                
-                if not existing_trans:
-                    # Categorize transaction using AI
-                    description = trans_data.get('transactionDescription', '')
-                    amount = float(trans_data.get('amount', {}).get('value', 0))
-                    
-                    category_result = ai_advisor.categorize_transaction(description, amount)
-                    
-                    # Create new transaction
-                    transaction = Transaction(
-                        account_id=account.id,
-                        transaction_id=trans_data.get('transactionId'),
-                        description=description,
-                        amount=amount,
-                        currency=trans_data.get('amount', {}).get('currency', 'SAR'),
-                        credit_debit=trans_data.get('creditDebitIndicator'),
-                        transaction_date=datetime.fromisoformat(
-                            trans_data.get('transactionDateTime', '').replace('Z', '+00:00')
-                        ),
-                        category=category_result.get('category'),
-                        merchant=category_result.get('merchant'),
-                        confidence_score=category_result.get('confidence', 0.0)
-                    )
-                    db.session.add(transaction)
-        
-        db.session.commit()
+        job = job_queue.enqueue(
+            'sync_account', {'account_db_id': account.id, 'full': full_sync},
+            user_id=account.user_id, dedup_key=f"sync_account:{account.id}", priority=PRIORITY_USER
+        )
         return jsonify({
             'success': True,
             'account': account.to_dict(),
-            'message': 'Account synced successfully'
-        })
+            'jobId': job.id,
+            'jobStatus': job.status,
+            'message': 'Account sync queued'
+        }), 202
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@accounts_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_sync_job(job_id):
+    """Poll a background sync job"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
 # Transaction Routes
 @transactions_bp.route('/account/<int:account_db_id>', methods=['GET'])
 def get_account_transactions(account_db_id):
-    """Get transactions for an account"""
+    """Get a page of an account's transactions, newest first.
+
+    ``?cursor=`` continues from the ``next_cursor`` of the previous page.
+    ``?estimate_total=true`` adds an approximate count from the spending
+    rollup (whole days), and ``?totals=true`` adds the debit totals per
+    category; neither is computed otherwise.
+    """
     try:
         account = Account.query.get_or_404(account_db_id)
         
         # Get query parameters
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 50, type=int)
+        per_page = max(1, min(request.args.get('per_page', 50, type=int), 200))
+        cursor = request.args.get('cursor')
         category = request.args.get('category')
         from_date = request.args.get('from_date')
         to_date = request.args.get('to_date')
+        from_date = datetime.fromisoformat(from_date) if from_date else None
+        to_date = datetime.fromisoformat(to_date) if to_date else None
         
-        # Build query
-        query = Transaction.query.filter_by(account_id=account.id)
+        # Build query over column tuples; rows are serialised without ORM objects
+        query = db.session.query(*columns(Transaction, Transaction.JSON_FIELDS)).filter_by(account_id=account.id)
         
         if category:
             query = query.filter(Transaction.category == category)
         
         if from_date:
-            query = query.filter(Transaction.transaction_date >= datetime.fromisoformat(from_date))
+            query = query.filter(Transaction.transaction_date >= from_date)
         
         if to_date:
-            query = query.filter(Transaction.transaction_date <= datetime.fromisoformat(to_date))
-        
-        # Order by date descending
-        query = query.order_by(Transaction.transaction_date.desc())
+            query = query.filter(Transaction.transaction_date <= to_date)
         
-        # Paginate
-        transactions = query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Seek past the cursor on the (account_id, transaction_date) index
+        try:
+            transactions, next_cursor = keyset_page(
+                query, Transaction.transaction_date, Transaction.id, cursor=cursor, limit=per_page
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Calculate category totals for the filtered period
-        category_totals = {}
-        spending_by_category = db.session.query(
-            Transaction.category,
-            db.func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.account_id == account.id,
-            Transaction.credit_debit == 'Debit'
-        )
+        result = {
+            'transactions': list(row_dicts(transactions, Transaction.JSON_FIELDS)),
+            'pagination': {
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
+            }
+        }
         
-        if from_date:
-            spending_by_category = spending_by_category.filter(
-                Transaction.transaction_date >= datetime.fromisoformat(from_date)
-            )
-        if to_date:
-            spending_by_category = spending_by_category.filter(
-                Transaction.transaction_date <= datetime.fromisoformat(to_date)
+        if _flag('estimate_total'):
+            result['pagination']['estimated_total'] = spending_rollups.count(
+                account.user_id, since=from_date, until=to_date, category=category, account_id=account.id
             )
-            
-        spending_by_category = spending_by_category.group_by(Transaction.category).all()
         
-        for cat, total in spending_by_category:
-            if cat:
-                category_totals[cat] = float(total)
+        # Category totals for the filtered period come from the spending rollup
+        if _flag('totals'):
+            category_totals = {
+                cat: total for cat, total, _ in spending_rollups.by_category(
+                    account.user_id, from_date, account_id=account.id, until=to_date
+                )
+            }
+            result['categoryTotals'] = category_totals
+            result['topCategories'] = sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:5]
         
-        return jsonify({
-            'transactions': [trans.to_dict() for trans in transactions.items],
-            'pagination': {
-                'page': transactions.page,
-                'pages': transactions.pages,
-                'per_page': transactions.per_page,
-                'total': transactions.total,
-                'has_next': transactions.has_next,
-                'has_prev': transactions.has_prev
-            },
-            'categoryTotals': category_totals,
-            'topCategories': sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:5]
-        })
+        return json_response(result)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@transactions_bp.route('/account/<int:account_db_id>/export', methods=['GET'])
+def export_account_transactions(account_db_id):
+    """Every transaction of an account (optionally ``from_date``/``to_date``), newest first.
+
+    The array is streamed in chunks while rows are read in batches, so an
+    export of any size is never built or encoded as one response.
+    """
+    try:
+        account = Account.query.get_or_404(account_db_id)
+        from_date = request.args.get('from_date')
+        to_date = request.args.get('to_date')
+        
+        statement = select(*columns(Transaction, Transaction.JSON_FIELDS)).where(Transaction.account_id == account.id)
+        if from_date:
+            statement = statement.where(Transaction.transaction_date >= datetime.fromisoformat(from_date))
+        if to_date:
+            statement = statement.where(Transaction.transaction_date <= datetime.fromisoformat(to_date))
+        statement = statement.order_by(Transaction.transaction_date.desc(), Transaction.id.desc())
+        
+        # A Core result: plain rows, read in batches, with no ORM loading step
+        rows = db.session.connection().execute(statement.execution_options(yield_per=STREAM_BATCH_ROWS))
+        return stream_json(
+            {'account_id': account.id, 'currency': account.currency},
+            'transactions', row_dicts(rows, Transaction.JSON_FIELDS)
+        )
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _flag(name):
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
 @transactions_bp.route('/categorize', methods=['POST'])
 def categorize_transactions():
     """Manually categorize transactions"""
@@ -282,14 +406,22 @@ def categorize_transactions():
         if not transaction_ids or not new_category:
             return jsonify({'error': 'Missing required fields'}), 400
         
+        affected_days = db.session.query(Transaction.account_id, Transaction.transaction_date).filter(
+            Transaction.id.in_(transaction_ids)
+        ).all()
+        
         # Update transactions
         updated = Transaction.query.filter(
             Transaction.id.in_(transaction_ids)
         ).update(
-            {'category': new_category, 'updated_at': datetime.utcnow()},
+            # Manual corrections are the strongest training labels for the local model
+            {'category': new_category, 'confidence_score': 1.0, 'updated_at': datetime.utcnow()},
             synchronize_session='fetch'
         )
         
+        # Correct the spending rollup for the re-labelled days in the same commit
+        spending_rollups.refresh_days(affected_days)
+        financial_context.invalidate_accounts(account_id for account_id, _ in affected_days)
         db.session.commit()
         
         return jsonify({
@@ -303,6 +435,96 @@ def categorize_transactions():
         return jsonify({'error': str(e)}), 500
 
 # Chat Routes
+def _prepare_chat(user_id, message, session_id):
+    """Get or create the chat session and build the advisor's prompt for one turn.
+    
+    Returns ``(chat_session, user_profile, messages, summarize_through)``;
+    the last is the seq to fold into the running summary after this turn, or None.
+    """
+    user = User.query.get_or_404(user_id)
+    
+    # Get or create chat session
+    chat_session = ChatSession.query.filter_by(
+        user_id=user_id,
+        session_id=session_id
+    ).first()
+    
+    if not chat_session:
+        chat_session = ChatSession(
+            user_id=user_id,
+            session_id=session_id,
+            title=message[:50] + '...' if len(message) > 50 else message
+        )
+        db.session.add(chat_session)
+    
+    # Cached financial snapshot, rebuilt only after a sync or re-categorization
+    user_profile = financial_context.get(user_id)
+    
+    # Recent messages not yet covered by the running summary
+    message_history = chat_session.get_messages(limit=HISTORY_WINDOW, after_seq=chat_session.summary_seq or 0)
+    messages, first_seq = ai_advisor.build_advice_messages(
+        user_profile, message_history, message, summary=chat_session.summary
+    )
+    
+    summarize_through = summary_due(chat_session.summary_seq, first_seq, chat_session.total_messages)
+    return chat_session, user_profile, messages, summarize_through
+
+def _save_turn(chat_session, message, ai_response):
+    """Append and commit the user message and reply, renumbering if a concurrent turn took their seqs"""
+    for attempt in range(CHAT_SAVE_ATTEMPTS):
+        try:
+            chat_session.add_message('user', message)
+            chat_session.add_message('assistant', ai_response)
+            db.session.commit()
+            return
+        except IntegrityError:
+            # SQLite has no row locks: two turns can read the same last seq
+            db.session.rollback()
+            if attempt == CHAT_SAVE_ATTEMPTS - 1:
+                raise
+
+def _learn_answer(message):
+    """Teach the semantic cache a template answer for ``message`` if it is generic"""
+    semantic_cache.learn(message, lambda question: answer_template(ai_advisor.client, question))
+
+def _queue_summary(chat_session, through_seq):
+    """Queue a refresh of the session's running summary (after the turn is committed)"""
+    if not through_seq:
+        return
+    try:
+        job_queue.enqueue(
+            'summarize_chat', {'chat_session_id': chat_session.id, 'through_seq': through_seq},
+            user_id=chat_session.user_id, dedup_key=f"summarize_chat:{chat_session.id}"
+        )
+    except Exception as e:
+        db.session.rollback()
+        print(f"Failed to queue chat summary: {e}")
+
+@job_queue.handler('summarize_chat')
+def summarize_chat_session(chat_session_id, through_seq, batch_size=40):
+    """Fold messages up to ``through_seq`` into the session's running summary"""
+    chat_session = ChatSession.query.get(chat_session_id)
+    if not chat_session or (chat_session.summary_seq or 0) >= through_seq:
+        return {'summarized': 0}
+    
+    # Oldest first, a batch at a time; a later turn queues the rest
+    pending = chat_session.chat_messages.filter(
+        ChatMessage.seq > (chat_session.summary_seq or 0), ChatMessage.seq <= through_seq
+    ).limit(batch_size).all()
+    if not pending:
+        return {'summarized': 0}
+    
+    summary = ai_advisor.summarize_conversation(
+        chat_session.summary, [message.to_dict() for message in pending]
+    )
+    if summary is None:
+        raise RuntimeError('Conversation summary failed')
+    
+    chat_session.summary = summary
+    chat_session.summary_seq = pending[-1].seq
+    db.session.commit()
+    return {'summarized': len(pending), 'summarySeq': chat_session.summary_seq}
+
 @chat_bp.route('/send', methods=['POST'])
 def send_message():
     """Send message to AI financial advisor"""
@@ -315,78 +537,18 @@ def send_message():
         if not user_id or not message:
             return jsonify({'error': 'Missing required fields'}), 400
         
-        user = User.query.get_or_404(user_id)
-        
-        # Get or create chat session
-        chat_session = ChatSession.query.filter_by(
-            user_id=user_id,
-            session_id=session_id
-        ).first()
-        
-        if not chat_session:
-            chat_session = ChatSession(
-                user_id=user_id,
-                session_id=session_id,
-                title=message[:50] + '...' if len(message) > 50 else message
-            )
-            db.session.add(chat_session)
-        
-        # Build user financial profile
-        accounts = Account.query.filter_by(user_id=user_id).all()
-        total_balance = sum(acc.balance for acc in accounts)
-        
-        # Get recent transactions for context
-        recent_transactions = []
-        for account in accounts:
-            transactions = Transaction.query.filter_by(account_id=account.id)\
-                .order_by(Transaction.transaction_date.desc())\
-                .limit(10).all()
-            
-            for trans in transactions:
-                recent_transactions.append(trans.to_dict())
-        
-        # Calculate monthly spending
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        monthly_spending = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.credit_debit == 'Debit',
-            Transaction.transaction_date >= thirty_days_ago
-        ).scalar() or 0
-        
-        # Get spending by category
-        category_spending = db.session.query(
-            Transaction.category,
-            db.func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.credit_debit == 'Debit',
-            Transaction.transaction_date >= thirty_days_ago
-        ).group_by(Transaction.category).all()
-        
-        top_categories = [(cat, float(total)) for cat, total in category_spending]
-        
-        user_profile = {
-            'total_balance': total_balance,
-            'monthly_spending': float(monthly_spending),
-            'accounts_count': len(accounts),
-            'recent_transactions': recent_transactions[:5],
-            'top_categories': top_categories[:5],
-            'savings_rate': max(0, (total_balance - monthly_spending) / total_balance * 100) if total_balance > 0 else 0
-        }
-        
-        # Get conversation history
-        message_history = chat_session.get_messages()
-        
-        # Add user message
-        chat_session.add_message('user', message)
-        
-        # Generate AI response
-        ai_response = ai_advisor.generate_financial_advice(
-            user_profile, message_history, message
-        )
+        chat_session, user_profile, messages, summarize_through = _prepare_chat(user_id, message, session_id)
+        # Don't hold the DB transaction (and the session row lock) open during the LLM call
+        db.session.commit()
         
-        # Add AI response
-        chat_session.add_message('assistant', ai_response)
+        # Generic questions may be answered from the semantic cache with this user's figures
+        ai_response = semantic_cache.answer(message, user_profile)
+        if ai_response is None:
+            ai_response = ai_advisor.complete_chat(messages)
+            _learn_answer(message)
         
-        db.session.commit()
+        _save_turn(chat_session, message, ai_response)
+        _queue_summary(chat_session, summarize_through)
         
         return jsonify({
             'response': ai_response,
@@ -398,9 +560,56 @@ def send_message():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@chat_bp.route('/stream', methods=['POST'])
+def stream_message():
+    """Send message to AI financial advisor and stream the reply as Server-Sent Events.
+    
+    Emits ``delta`` events as tokens arrive, then a ``done`` event with the
+    full response; the turn is stored when the stream ends.
+    """
+    started = time.perf_counter()
+    try:
+        data = request.get_json()
+        user_id = data.get('userId')
+        message = data.get('message')
+        session_id = data.get('sessionId', str(uuid.uuid4()))
+        
+        if not user_id or not message:
+            return jsonify({'error': 'Missing required fields'}), 400
+        
+        chat_session, user_profile, messages, summarize_through = _prepare_chat(user_id, message, session_id)
+        cached = semantic_cache.answer(message, user_profile)
+        if cached is not None:
+            deltas = iter([cached])
+        else:
+            deltas = ai_advisor.stream_chat(messages)
+            _learn_answer(message)
+        
+        # Don't hold the DB transaction open for the seconds the reply streams
+        db.session.commit()
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    def save_turn(ai_response):
+        try:
+            _save_turn(chat_session, message, ai_response)
+        except Exception:
+            db.session.rollback()
+            raise
+        _queue_summary(chat_session, summarize_through)
+        return {'sessionId': session_id, 'messageCount': chat_session.total_messages}
+    
+    return Response(
+        stream_with_context(stream_reply(deltas, save_turn, started=started)),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
 @chat_bp.route('/sessions/<int:user_id>', methods=['GET'])
 def get_chat_sessions(user_id):
-    """Get user's chat sessions"""
+    """Get summaries of the user's chat sessions (without message bodies)"""
     try:
         sessions = ChatSession.query.filter_by(
             user_id=user_id,
@@ -414,6 +623,31 @@ def get_chat_sessions(user_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@chat_bp.route('/sessions/<int:user_id>/<session_id>/messages', methods=['GET'])
+def get_chat_messages(user_id, session_id):
+    """Get a page of a session's messages, newest page first (?limit=50&before_seq=...)"""
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        before_seq = request.args.get('before_seq', type=int)
+        
+        chat_session = ChatSession.query.filter_by(
+            user_id=user_id,
+            session_id=session_id
+        ).first_or_404()
+        
+        messages = chat_session.get_messages(limit=limit, before_seq=before_seq)
+        db.session.commit()  # persists a first-access migration from the legacy JSON column
+        
+        return jsonify({
+            'session': chat_session.to_dict(),
+            'messages': messages,
+            'hasMore': bool(messages) and messages[0]['seq'] > 1
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @chat_bp.route('/investment-advice', methods=['POST'])
 def get_investment_advice():
     """Get personalized investment advice"""
@@ -425,28 +659,19 @@ def get_investment_advice():
         
         user = User.query.get_or_404(user_id)
         
-        # Build user profile
-        accounts = Account.query.filter_by(user_id=user_id).all()
-        total_balance = sum(acc.balance for acc in accounts)
-        
-        # Calculate monthly spending
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        monthly_spending = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.credit_debit == 'Debit',
-            Transaction.transaction_date >= thirty_days_ago
-        ).scalar() or 0
-        
+        # Build user profile from the cached financial snapshot
+        context = financial_context.get(user_id)
         user_profile = {
-            'total_balance': total_balance,
-            'monthly_spending': float(monthly_spending),
-            'accounts_count': len(accounts),
+            'total_balance': context['total_balance'],
+            'monthly_spending': context['monthly_spending'],
+            'accounts_count': context['accounts_count'],
             'age_group': 'adult'  # Could be derived from date_of_birth
         }
         
         # Generate investment advice
-        advice = ai_advisor.generate_investment_advice(
+        advice = run_async(async_advisor.generate_investment_advice(
             user_profile, investment_amount, risk_tolerance
-        )
+        ))
         
         return jsonify({
             'investmentAdvice': advice,
@@ -467,33 +692,20 @@ def get_dashboard_insights(user_id):
         
         # Get accounts
         accounts = Account.query.filter_by(user_id=user_id).all()
-        total_balance = sum(acc.balance for acc in accounts)
+        total_balance = db.session.query(money_sum(Account.balance)).filter(Account.user_id == user_id).scalar()
         
         # Get spending by category (last 30 days)
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        
-        category_spending = db.session.query(
-            Transaction.category,
-            db.func.sum(Transaction.amount).label('total'),
-            db.func.count(Transaction.id).label('count')
-        ).filter(
-            Transaction.credit_debit == 'Debit',
-            Transaction.transaction_date >= thirty_days_ago
-        ).group_by(Transaction.category).all()
+        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+        category_spending = spending_rollups.by_category(user_id, thirty_days_ago)
         
         # Get recent transactions
-        recent_transactions = Transaction.query\
-            .order_by(Transaction.transaction_date.desc())\
-            .limit(10).all()
+        recent_transactions = recent_transactions_query(Transaction, user_id, 10).all()
         
         # Get monthly income (credit transactions)
-        monthly_income = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.credit_debit == 'Credit',
-            Transaction.transaction_date >= thirty_days_ago
-        ).scalar() or 0
+        monthly_income = spending_rollups.total(user_id, thirty_days_ago, credit_debit='Credit')
         
         # Calculate savings rate
-        monthly_spending = sum(float(amount) for _, amount, _ in category_spending)
+        monthly_spending = spending_rollups.total(user_id, thirty_days_ago)
         savings_rate = ((monthly_income - monthly_spending) / monthly_income * 100) if monthly_income > 0 else 0
         
         # Get financial goals
@@ -504,15 +716,15 @@ def get_dashboard_insights(user_id):
             'totalBalance': total_balance,
             'accountsCount': len(accounts),
             'accounts': [acc.to_dict() for acc in accounts],
-            'monthlyIncome': float(monthly_income),
+            'monthlyIncome': monthly_income,
             'monthlySpending': monthly_spending,
             'savingsRate': savings_rate,
             'categorySpending': [
                 {
                     'category': cat,
-                    'amount': float(amount),
+                    'amount': amount,
                     'count': count,
-                    'percentage': (float(amount) / monthly_spending * 100) if monthly_spending > 0 else 0
+                    'percentage': (amount / monthly_spending * 100) if monthly_spending > 0 else 0
                 }
                 for cat, amount, count in category_spending
             ],
@@ -524,31 +736,56 @@ def get_dashboard_insights(user_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@insights_bp.route('/dashboard/<int:user_id>/summary', methods=['GET'])
+def get_dashboard_summary(user_id):
+    """All dashboard widgets from one aggregate query, revalidated with an ETag"""
+    try:
+        since = dashboard_since()
+        etag = dashboard_etag(user_id, financial_context.version(user_id), since)
+        if request.if_none_match.contains(etag):
+            # Nothing changed since the client's copy: one primary-key lookup, no aggregation
+            metrics.incr('dashboard.not_modified')
+            response = Response(status=304, headers=DASHBOARD_HEADERS)
+            response.set_etag(etag)
+            return response
+        
+        dashboard = build_dashboard(db, User, Account, Transaction, SpendingRollup, user_id, since)
+        if dashboard is None:
+            return jsonify({'error': 'User not found'}), 404
+        
+        response = json_response(dashboard, headers=DASHBOARD_HEADERS)
+        response.set_etag(etag)
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @insights_bp.route('/alternatives/<category>', methods=['GET'])
 def get_spending_alternatives(category):
     """Get spending alternatives for a category"""
     try:
         # Get spending amount for this category
-        user_id = request.args.get('user_id')
+        user_id = request.args.get('user_id', type=int)
         if not user_id:
             return jsonify({'error': 'user_id parameter required'}), 400
         
         # Calculate category spending
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        category_spending = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.category == category,
-            Transaction.credit_debit == 'Debit',
-            Transaction.transaction_date >= thirty_days_ago
-        ).scalar() or 0
-        
-        # Generate alternatives using AI
-        alternatives = ai_advisor.suggest_spending_alternatives(
-            category, float(category_spending)
+        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+        category_spending = spending_rollups.total(user_id, thirty_days_ago, category=category)
+        
+        # Alternatives depend only on the category, spending band and language,
+        # so one generation is shared by every user in the band
+        band = spending_band(category_spending)
+        language = normalize_language(request.args.get('lang') or request.headers.get('Accept-Language'))
+        alternatives = content_cache.get_or_generate(
+            content_key(ALTERNATIVES_TEMPLATE_VERSION, category, band, language),
+            lambda: ai_advisor.suggest_spending_alternatives(category, band, language=language)
         )
         
         return jsonify({
             'category': category,
             'currentSpending': float(category_spending),
+            'spendingBand': band,
             'alternatives': alternatives
         })
         
@@ -595,4 +832,19 @@ def register_blueprints(app):
     app.register_blueprint(accounts_bp)
     app.register_blueprint(transactions_bp)
     app.register_blueprint(chat_bp)
-    app.register_blueprint(insights_bp)
\ No newline at end of file
+    app.register_blueprint(insights_bp)
+
+def prepare_database(app):
+    """Bring an existing database up to the current schema and backfill derived tables. Safe to run on every start"""
+    with app.app_context():
+        db.create_all()
+        # Before the money conversion: on SQLite it rebuilds tables and their indexes
+        remove_duplicate_transactions(db, Transaction)
+        ensure_minor_units(db, *MONEY_MODELS)
+        require_minor_units(db, *MONEY_MODELS)
+        ensure_user_column(db, Transaction, Account)
+        ensure_unique_index(db, Transaction)
+        ensure_indexes(db, Account, Transaction)
+        ensure_columns(db, Account, 'sync_cursor_date', 'last_synced_at')
+        ensure_columns(db, ChatSession, 'summary', 'summary_seq')
+        spending_rollups.ensure_built()
\ No newline at end of file
@@ -0,0 +1,433 @@
+import re
+from collections import deque
+
+import metrics
+from categorization_cache import ARABIC_LETTER_MAP
+
+# Known merchants: pattern -> (merchant, category). Patterns may be Latin or Arabic.
+MERCHANT_DICTIONARY = {
+    # Food & Dining
+    'jahez': ('Jahez', 'Food & Dining'),
+    'جاهز': ('Jahez', 'Food & Dining'),
+    'hungerstation': ('HungerStation', 'Food & Dining'),
+    'hunger station': ('HungerStation', 'Food & Dining'),
+    'هنقرستيشن': ('HungerStation', 'Food & Dining'),
+    'mrsool': ('Mrsool', 'Food & Dining'),
+    'marsool': ('Mrsool', 'Food & Dining'),
+    'مرسول': ('Mrsool', 'Food & Dining'),
+    'the chefz': ('The Chefz', 'Food & Dining'),
+    'toyou': ('ToYou', 'Food & Dining'),
+    'albaik': ('Al Baik', 'Food & Dining'),
+    'al baik': ('Al Baik', 'Food & Dining'),
+    'البيك': ('Al Baik', 'Food & Dining'),
+    'kudu': ('Kudu', 'Food & Dining'),
+    'كودو': ('Kudu', 'Food & Dining'),
+    'herfy': ('Herfy', 'Food & Dining'),
+    'هرفي': ('Herfy', 'Food & Dining'),
+    'mcdonalds': ("McDonald's", 'Food & Dining'),
+    'mcdonald s': ("McDonald's", 'Food & Dining'),
+    'kfc': ('KFC', 'Food & Dining'),
+    'burger king': ('Burger King', 'Food & Dining'),
+    'starbucks': ('Starbucks', 'Food & Dining'),
+    'ستاربكس': ('Starbucks', 'Food & Dining'),
+    'dunkin': ('Dunkin', 'Food & Dining'),
+    'tim hortons': ('Tim Hortons', 'Food & Dining'),
+    'barns': ("Barn's", 'Food & Dining'),
+    'dr cafe': ('Dr. Cafe', 'Food & Dining'),
+    'half million': ('Half Million', 'Food & Dining'),
+    'shawarmer': ('Shawarmer', 'Food & Dining'),
+    'maestro pizza': ('Maestro Pizza', 'Food & Dining'),
+    'dominos': ("Domino's", 'Food & Dining'),
+    'pizza hut': ('Pizza Hut', 'Food & Dining'),
+
+    # Groceries & Supermarkets
+    'panda': ('Panda', 'Groceries & Supermarkets'),
+    'hyperpanda': ('Panda', 'Groceries & Supermarkets'),
+    'بنده': ('Panda', 'Groceries & Supermarkets'),
+    'danube': ('Danube', 'Groceries & Supermarkets'),
+    'الدانوب': ('Danube', 'Groceries & Supermarkets'),
+    'tamimi': ('Tamimi Markets', 'Groceries & Supermarkets'),
+    'التميمي': ('Tamimi Markets', 'Groceries & Supermarkets'),
+    'othaim': ('Othaim Markets', 'Groceries & Supermarkets'),
+    'العثيم': ('Othaim Markets', 'Groceries & Supermarkets'),
+    'lulu': ('LuLu', 'Groceries & Supermarkets'),
+    'لولو': ('LuLu', 'Groceries & Supermarkets'),
+    'carrefour': ('Carrefour', 'Groceries & Supermarkets'),
+    'كارفور': ('Carrefour', 'Groceries & Supermarkets'),
+    'bindawood': ('BinDawood', 'Groceries & Supermarkets'),
+    'bin dawood': ('BinDawood', 'Groceries & Supermarkets'),
+    'nesto': ('Nesto', 'Groceries & Supermarkets'),
+    'farm superstores': ('Farm Superstores', 'Groceries & Supermarkets'),
+    'manuel market': ('Manuel Market', 'Groceries & Supermarkets'),
+
+    # Shopping & Retail
+    'jarir': ('Jarir Bookstore', 'Shopping & Retail'),
+    'جرير': ('Jarir Bookstore', 'Shopping & Retail'),
+    'extra stores': ('eXtra', 'Shopping & Retail'),
+    'united electronics': ('eXtra', 'Shopping & Retail'),
+    'noon com': ('noon', 'Shopping & Retail'),
+    'noon': ('noon', 'Shopping & Retail'),
+    'amazon': ('Amazon', 'Shopping & Retail'),
+    'امازون': ('Amazon', 'Shopping & Retail'),
+    'namshi': ('Namshi', 'Shopping & Retail'),
+    'shein': ('SHEIN', 'Shopping & Retail'),
+    'ikea': ('IKEA', 'Shopping & Retail'),
+    'centrepoint': ('Centrepoint', 'Shopping & Retail'),
+    'max fashion': ('Max Fashion', 'Shopping & Retail'),
+    'zara': ('Zara', 'Shopping & Retail'),
+    'saco': ('SACO', 'Shopping & Retail'),
+    'nice one': ('Nice One', 'Shopping & Retail'),
+
+    # Transportation
+    'uber': ('Uber', 'Transportation'),
+    'اوبر': ('Uber', 'Transportation'),
+    'careem': ('Careem', 'Transportation'),
+    'bolt eu': ('Bolt', 'Transportation'),
+    'jeeny': ('Jeeny', 'Transportation'),
+    'aldrees': ('Aldrees', 'Transportation'),
+    'الدريس': ('Aldrees', 'Transportation'),
+    'petromin': ('Petromin', 'Transportation'),
+    'sasco': ('SASCO', 'Transportation'),
+    'saptco': ('SAPTCO', 'Transportation'),
+    'riyadh metro': ('Riyadh Metro', 'Transportation'),
+    'mawgif': ('Mawgif', 'Transportation'),
+
+    # Entertainment
+    'netflix': ('Netflix', 'Entertainment'),
+    'نتفليكس': ('Netflix', 'Entertainment'),
+    'shahid net': ('Shahid', 'Entertainment'),
+    'mbc shahid': ('Shahid', 'Entertainment'),
+    'spotify': ('Spotify', 'Entertainment'),
+    'anghami': ('Anghami', 'Entertainment'),
+    'osn': ('OSN+', 'Entertainment'),
+    'vox cinemas': ('VOX Cinemas', 'Entertainment'),
+    'muvi': ('Muvi Cinemas', 'Entertainment'),
+    'amc cinemas': ('AMC Cinemas', 'Entertainment'),
+    'playstation': ('PlayStation', 'Entertainment'),
+    'steampowered': ('Steam', 'Entertainment'),
+    'steam games': ('Steam', 'Entertainment'),
+    'xbox': ('Xbox', 'Entertainment'),
+
+    # Bills & Utilities
+    'stc': ('stc', 'Bills & Utilities'),
+    'mobily': ('Mobily', 'Bills & Utilities'),
+    'موبايلي': ('Mobily', 'Bills & Utilities'),
+    'zain ksa': ('Zain', 'Bills & Utilities'),
+    'zain sa': ('Zain', 'Bills & Utilities'),
+    'زين السعوديه': ('Zain', 'Bills & Utilities'),
+    'virgin mobile': ('Virgin Mobile', 'Bills & Utilities'),
+    'saudi electricity': ('Saudi Electricity Company', 'Bills & Utilities'),
+    'الكهرباء': ('Saudi Electricity Company', 'Bills & Utilities'),
+    'national water': ('National Water Company', 'Bills & Utilities'),
+    'المياه': ('National Water Company', 'Bills & Utilities'),
+
+    # Healthcare & Medical
+    'nahdi': ('Al Nahdi Pharmacy', 'Healthcare & Medical'),
+    'النهدي': ('Al Nahdi Pharmacy', 'Healthcare & Medical'),
+    'al dawaa': ('Al Dawaa Pharmacy', 'Healthcare & Medical'),
+    'aldawaa': ('Al Dawaa Pharmacy', 'Healthcare & Medical'),
+    'الدواء': ('Al Dawaa Pharmacy', 'Healthcare & Medical'),
+    'whites pharmacy': ('Whites Pharmacy', 'Healthcare & Medical'),
+    'sulaiman al habib': ('Dr. Sulaiman Al Habib', 'Healthcare & Medical'),
+    'habib medical': ('Dr. Sulaiman Al Habib', 'Healthcare & Medical'),
+    'mouwasat': ('Mouwasat', 'Healthcare & Medical'),
+    'dallah hospital': ('Dallah Hospital', 'Healthcare & Medical'),
+
+    # Education
+    'udemy': ('Udemy', 'Education'),
+    'coursera': ('Coursera', 'Education'),
+
+    # Travel & Hotels
+    'saudia': ('Saudia', 'Travel & Hotels'),
+    'الخطوط السعوديه': ('Saudia', 'Travel & Hotels'),
+    'flynas': ('flynas', 'Travel & Hotels'),
+    'طيران ناس': ('flynas', 'Travel & Hotels'),
+    'flyadeal': ('flyadeal', 'Travel & Hotels'),
+    'almosafer': ('Almosafer', 'Travel & Hotels'),
+    'المسافر': ('Almosafer', 'Travel & Hotels'),
+    'booking com': ('Booking.com', 'Travel & Hotels'),
+    'agoda': ('Agoda', 'Travel & Hotels'),
+    'airbnb': ('Airbnb', 'Travel & Hotels'),
+    'marriott': ('Marriott', 'Travel & Hotels'),
+    'hilton': ('Hilton', 'Travel & Hotels'),
+    'emirates airlines': ('Emirates', 'Travel & Hotels'),
+
+    # Banking & Finance
+    'stc pay': ('stc pay', 'Banking & Finance'),
+    'urpay': ('urpay', 'Banking & Finance'),
+    'tamara': ('Tamara', 'Banking & Finance'),
+    'tabby': ('Tabby', 'Banking & Finance'),
+
+    # Government & Services
+    'absher': ('Absher', 'Government & Services'),
+    'ابشر': ('Absher', 'Government & Services'),
+    'muqeem': ('Muqeem', 'Government & Services'),
+    'najiz': ('Najiz', 'Government & Services'),
+    'balady gov': ('Balady', 'Government & Services'),
+}
+
+# Merchant names that are also common words or given names ("Karim", "Zain",
+# "shahid" = witness, "baladi" in restaurant names). They score below
+# min_confidence, so on their own they only pass the transaction on
+AMBIGUOUS_MERCHANTS = {
+    'كريم': ('Careem', 'Transportation'),
+    'bolt': ('Bolt', 'Transportation'),
+    'shahid': ('Shahid', 'Entertainment'),
+    'شاهد': ('Shahid', 'Entertainment'),
+    'steam': ('Steam', 'Entertainment'),
+    'zain': ('Zain', 'Bills & Utilities'),
+    'زين': ('Zain', 'Bills & Utilities'),
+    'balady': ('Balady', 'Government & Services'),
+    'بلدي': ('Balady', 'Government & Services'),
+}
+
+# Generic keywords: pattern -> (category, confidence, transaction_type)
+KEYWORD_RULES = {
+    'restaurant': ('Food & Dining', 0.85, 'purchase'),
+    'مطعم': ('Food & Dining', 0.85, 'purchase'),
+    'cafe': ('Food & Dining', 0.85, 'purchase'),
+    'coffee': ('Food & Dining', 0.85, 'purchase'),
+    'مقهى': ('Food & Dining', 0.85, 'purchase'),
+    'كافيه': ('Food & Dining', 0.85, 'purchase'),
+    'bakery': ('Food & Dining', 0.8, 'purchase'),
+    'supermarket': ('Groceries & Supermarkets', 0.85, 'purchase'),
+    'hypermarket': ('Groceries & Supermarkets', 0.85, 'purchase'),
+    'grocery': ('Groceries & Supermarkets', 0.85, 'purchase'),
+    'بقاله': ('Groceries & Supermarkets', 0.85, 'purchase'),
+    'تموينات': ('Groceries & Supermarkets', 0.85, 'purchase'),
+    'market': ('Groceries & Supermarkets', 0.6, 'purchase'),
+    'petrol': ('Transportation', 0.85, 'purchase'),
+    'fuel': ('Transportation', 0.85, 'purchase'),
+    'gas station': ('Transportation', 0.85, 'purchase'),
+    'محطه': ('Transportation', 0.75, 'purchase'),
+    'بنزين': ('Transportation', 0.85, 'purchase'),
+    'parking': ('Transportation', 0.85, 'purchase'),
+    'taxi': ('Transportation', 0.85, 'purchase'),
+    'cinema': ('Entertainment', 0.85, 'purchase'),
+    'pharmacy': ('Healthcare & Medical', 0.9, 'purchase'),
+    'صيدليه': ('Healthcare & Medical', 0.9, 'purchase'),
+    'hospital': ('Healthcare & Medical', 0.9, 'purchase'),
+    'مستشفى': ('Healthcare & Medical', 0.9, 'purchase'),
+    'clinic': ('Healthcare & Medical', 0.85, 'purchase'),
+    'عياده': ('Healthcare & Medical', 0.85, 'purchase'),
+    'dental': ('Healthcare & Medical', 0.85, 'purchase'),
+    'medical': ('Healthcare & Medical', 0.8, 'purchase'),
+    'school': ('Education', 0.85, 'purchase'),
+    'مدرسه': ('Education', 0.85, 'purchase'),
+    'university': ('Education', 0.85, 'purchase'),
+    'جامعه': ('Education', 0.85, 'purchase'),
+    'academy': ('Education', 0.75, 'purchase'),
+    'tuition': ('Education', 0.85, 'purchase'),
+    'bookstore': ('Education', 0.7, 'purchase'),
+    'hotel': ('Travel & Hotels', 0.85, 'purchase'),
+    'فندق': ('Travel & Hotels', 0.85, 'purchase'),
+    'airlines': ('Travel & Hotels', 0.85, 'purchase'),
+    'airways': ('Travel & Hotels', 0.85, 'purchase'),
+    'طيران': ('Travel & Hotels', 0.8, 'purchase'),
+    'atm': ('Banking & Finance', 0.9, 'withdrawal'),
+    'cash withdrawal': ('Banking & Finance', 0.9, 'withdrawal'),
+    'سحب نقدي': ('Banking & Finance', 0.9, 'withdrawal'),
+    'transfer': ('Banking & Finance', 0.85, 'transfer'),
+    'تحويل': ('Banking & Finance', 0.85, 'transfer'),
+    'sarie': ('Banking & Finance', 0.85, 'transfer'),
+    'fee': ('Banking & Finance', 0.8, 'fee'),
+    'fees': ('Banking & Finance', 0.8, 'fee'),
+    'رسوم': ('Banking & Finance', 0.8, 'fee'),
+    'ministry': ('Government & Services', 0.85, 'payment'),
+    'وزاره': ('Government & Services', 0.85, 'payment'),
+    'traffic violation': ('Government & Services', 0.9, 'payment'),
+    'مخالفه': ('Government & Services', 0.85, 'payment'),
+    'iqama': ('Government & Services', 0.9, 'payment'),
+    'passport': ('Government & Services', 0.85, 'payment'),
+    'electricity': ('Bills & Utilities', 0.9, 'payment'),
+    'water bill': ('Bills & Utilities', 0.9, 'payment'),
+    'internet': ('Bills & Utilities', 0.8, 'payment'),
+    'sadad': ('Bills & Utilities', 0.7, 'payment'),
+    'سداد': ('Bills & Utilities', 0.7, 'payment'),
+}
+
+# Merchant category codes (ISO 18245) that show up in card descriptions
+MCC_RULES = {
+    range(5811, 5815): 'Food & Dining',
+    range(5411, 5412): 'Groceries & Supermarkets',
+    range(5422, 5500): 'Groceries & Supermarkets',
+    range(5541, 5543): 'Transportation',
+    range(4111, 4122): 'Transportation',
+    range(7523, 7524): 'Transportation',
+    range(7832, 7833): 'Entertainment',
+    range(7841, 7842): 'Entertainment',
+    range(7991, 7997): 'Entertainment',
+    range(4812, 4815): 'Bills & Utilities',
+    range(4899, 4901): 'Bills & Utilities',
+    range(5912, 5913): 'Healthcare & Medical',
+    range(8011, 8100): 'Healthcare & Medical',
+    range(8211, 8300): 'Education',
+    range(3000, 3351): 'Travel & Hotels',
+    range(3501, 3999): 'Travel & Hotels',
+    range(4511, 4512): 'Travel & Hotels',
+    range(4722, 4723): 'Travel & Hotels',
+    range(7011, 7012): 'Travel & Hotels',
+    range(6010, 6013): 'Banking & Finance',
+    range(9211, 9403): 'Government & Services',
+    range(5200, 5400): 'Shopping & Retail',
+    range(5600, 5700): 'Shopping & Retail',
+    range(5732, 5736): 'Shopping & Retail',
+    range(5940, 5950): 'Shopping & Retail',
+}
+
+MERCHANT_CONFIDENCE = 0.95
+AMBIGUOUS_MERCHANT_CONFIDENCE = 0.6
+MCC_CONFIDENCE = 0.9
+MCC_PATTERN = re.compile(r'\bmcc\W{0,3}(\d{4})\b')
+SEPARATORS = re.compile(r'[\W\d_]+')
+
+def _prepare(text):
+    """Lower-case, fold Arabic letter variants, and pad every word with spaces.
+
+    Padding lets a plain substring automaton enforce word boundaries:
+    " stc " never matches inside "postcard".
+    """
+    text = text.casefold().translate(ARABIC_LETTER_MAP)
+    return ' ' + ' '.join(SEPARATORS.sub(' ', text).split()) + ' '
+
+class AhoCorasick:
+    """Multi-pattern substring matcher: one pass over the text finds every pattern"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                next_node = self.goto[node].get(ch)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][ch] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = next_node
+            self.output[node].append(index)
+
+        # Breadth-first pass to build failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(ch, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text):
+        """Return the indexes of all patterns that occur in ``text``"""
+        goto, fail, output = self.goto, self.fail, self.output
+        found = []
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node]:
+                found.extend(output[node])
+        return found
+
+class RuleClassifier:
+    """Deterministic categorizer built from merchant, keyword and MCC rules.
+
+    ``category_aliases`` maps the built-in category names onto a caller's own
+    category list. Results below ``min_confidence`` are left to the next tier.
+    """
+
+    def __init__(self, category_aliases=None, min_confidence=0.8):
+        self.category_aliases = category_aliases or {}
+        self.min_confidence = min_confidence
+
+        self._rules = []
+        for merchant, category in MERCHANT_DICTIONARY.values():
+            self._rules.append((merchant, category, MERCHANT_CONFIDENCE, 'purchase'))
+        for merchant, category in AMBIGUOUS_MERCHANTS.values():
+            self._rules.append((merchant, category, AMBIGUOUS_MERCHANT_CONFIDENCE, 'purchase'))
+        for category, confidence, transaction_type in KEYWORD_RULES.values():
+            self._rules.append((None, category, confidence, transaction_type))
+
+        patterns = [
+            _prepare(pattern)
+            for pattern in list(MERCHANT_DICTIONARY) + list(AMBIGUOUS_MERCHANTS) + list(KEYWORD_RULES)
+        ]
+        self._lengths = [len(pattern) for pattern in patterns]
+        self._matcher = AhoCorasick(patterns)
+
+    def classify(self, description):
+        """Classify one description; returns a result dict or None if no rule matched"""
+        if not description:
+            return None
+
+        best = None
+        best_rank = None
+        keyword_type = None
+        for index in self._matcher.find(_prepare(description)):
+            merchant, category, confidence, transaction_type = self._rules[index]
+            # Prefer confident merchant hits, then higher confidence, then longer
+            # patterns: "مطعم بلدي" is a restaurant, not the Balady portal
+            rank = (merchant is not None and confidence >= self.min_confidence, confidence, self._lengths[index])
+            if best_rank is None or rank > best_rank:
+                best, best_rank = self._rules[index], rank
+            if merchant is None and transaction_type != 'purchase':
+                keyword_type = transaction_type
+
+        # Dictionary merchants outrank an MCC; keywords and ambiguous names do not
+        if best is None or best[2] < MCC_CONFIDENCE:
+            mcc_category = self._mcc_category(description)
+            if mcc_category:
+                best = (None, mcc_category, MCC_CONFIDENCE, 'purchase')
+
+        if best is None:
+            return None
+
+        merchant, category, confidence, transaction_type = best
+        if merchant and keyword_type:
+            # e.g. "STC PAY TRANSFER": merchant from the dictionary, type from the keyword
+            transaction_type = keyword_type
+        return {
+            'category': self.category_aliases.get(category, category),
+            'merchant': merchant or 'Unknown',
+            'transaction_type': transaction_type,
+            'confidence': confidence
+        }
+
+    @staticmethod
+    def _mcc_category(description):
+        match = MCC_PATTERN.search(description.casefold())
+        if not match:
+            return None
+        code = int(match.group(1))
+        for codes, category in MCC_RULES.items():
+            if code in codes:
+                return category
+        return None
+
+    def categorize(self, transactions, fallback=None):
+        """Classify transactions locally; pass the low-confidence rest to ``fallback``.
+
+        Returns results keyed by ``str(id)`` like the other categorization tiers.
+        """
+        results = {}
+        remaining = []
+        for trans in transactions:
+            result = self.classify(trans.get('description'))
+            if result and result['confidence'] >= self.min_confidence:
+                results[str(trans['id'])] = result
+            else:
+                remaining.append(trans)
+
+        metrics.incr('rules.classified', len(results))
+        metrics.incr('rules.passed_on', len(remaining))
+
+        if remaining and fallback:
+            results.update(fallback(remaining))
+        return results
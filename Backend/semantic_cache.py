@@ -0,0 +1,239 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from categorization_cache import ARABIC_LETTER_MAP
+from ml_categorizer import ngram_indices
+
+# Off unless enabled; setting it to 0 is the kill switch
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', '0') == '1'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.88'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '2000'))
+EMBEDDING_DIM = 4096
+MAX_QUESTION_WORDS = 25
+# Characters a content word is compared on: a crude stem ("grocery"/"groceries")
+STEM_LENGTH = 6
+
+# Words that carry no topic; every other word of 3+ letters is compared between questions
+STOPWORDS = frozenset('''
+    how what which when where why who can could should would will does are the and for with from
+    that any some about into your you best way ways tips please there their than more most much
+    كيف ماذا متى اين لماذا هل التي الذي على الى عن من في مع يمكن يمكنني افضل طريقه طرق بعض
+'''.split())
+WORD = re.compile(r'\w{3,}')
+
+# Questions about the user's own records, or follow-ups to earlier turns, need the full prompt
+PERSONAL = re.compile(
+    r'\d|\b(my|mine)\s+(spending|transactions?|balance|accounts?|salary|income|expenses?|'
+    r'budget|bills?|purchases?|payments?|card|loan|debt)\b|\banaly[sz]e\b|\b(last|this)\s+(week|month)\b|'
+    r'\b(it|that|this|those|these|above|previous|second|first)\b|'
+    r'حلل|إنفاقي|انفاقي|حسابي|رصيدي|راتبي|دخلي|مصاريفي|معاملاتي|فواتيري|قرضي|بطاقتي|هذا|ذلك|السابق',
+    re.IGNORECASE
+)
+
+# Placeholders an answer template may use, filled from the financial context snapshot
+FIGURES = ('total_balance', 'monthly_spending', 'monthly_income', 'savings_rate', 'top_category', 'currency')
+PLACEHOLDER = re.compile(r'\{(' + '|'.join(FIGURES) + r')\}')
+
+TEMPLATE_PROMPT = """
+You are Nama'aAI (نماء), a bilingual (Arabic/English) financial advisor for Saudi Arabia.
+Answer the user's question as a reusable template for any user.
+Where the user's own figures belong, write these placeholders exactly:
+{total_balance}, {monthly_spending}, {monthly_income}, {savings_rate} (a percentage),
+{top_category} (their largest spending category) and {currency}.
+Never invent figures. Be concise and actionable; answer in the language of the question.
+"""
+
+def embed(text, dim=EMBEDDING_DIM):
+    """Unit-length hashed character n-gram vector of ``text`` (no model, no network)"""
+    counts = np.bincount(ngram_indices(text, dim), minlength=dim).astype(np.float32)
+    np.sqrt(counts, out=counts)
+    norm = np.linalg.norm(counts)
+    return counts / norm if norm else counts
+
+def content_words(text):
+    """Stems of the topic words of ``text``: what two similar questions must agree on"""
+    text = text.casefold().translate(ARABIC_LETTER_MAP)
+    return frozenset(word[:STEM_LENGTH] for word in WORD.findall(text) if word not in STOPWORDS)
+
+def substituted(words, other):
+    """True if each question has a topic word the other lacks, e.g. "in Riyadh" vs "in Jeddah".
+
+    Character n-grams score such pairs as near-identical; a question that
+    only adds or drops words ("... quickly?") is still a match.
+    """
+    return bool(words - other) and bool(other - words)
+
+def question_key(message):
+    return ' '.join(WORD.findall(message.casefold()))
+
+def is_generic(message):
+    """True for short standalone questions that do not refer to the user's own records"""
+    return bool(message) and len(message.split()) <= MAX_QUESTION_WORDS and not PERSONAL.search(message)
+
+def answer_template(client, question):
+    """Ask the LLM for a placeholder answer to a generic question; returns None on failure"""
+    try:
+        response = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": TEMPLATE_PROMPT.strip()},
+                {"role": "user", "content": question}
+            ],
+            temperature=0.3,
+            max_tokens=500
+        )
+        return response.choices[0].message.content
+    except Exception as e:
+        print(f"Answer template error: {e}")
+        return None
+
+def template_figures(context):
+    """Placeholder values from a financial context snapshot (see financial_context.build_snapshot)"""
+    top_categories = context.get('top_categories') or []
+    return {
+        'total_balance': f"{context.get('total_balance', 0):,.0f}",
+        'monthly_spending': f"{context.get('monthly_spending', 0):,.0f}",
+        'monthly_income': f"{context.get('monthly_income', 0):,.0f}",
+        'savings_rate': f"{context.get('savings_rate', 0):.0f}%",
+        'top_category': top_categories[0][0] if top_categories else 'Other',
+        'currency': context.get('currency', 'SAR')
+    }
+
+class SemanticCache:
+    """Nearest-neighbour cache of answer templates for generic chat questions.
+
+    Questions are embedded locally and kept in an in-memory matrix, so a
+    lookup is one matrix-vector product. A hit must also agree on topic
+    words (``substituted``), so a question about another city or category
+    is a miss however similar it reads. A hit returns the stored template
+    filled with the current user's figures. A generic miss is answered as
+    usual; once the same question has missed twice, ``learn`` generates a
+    template for it in a background thread, so one-off questions never
+    cost a second LLM call. Personal questions and follow-ups always
+    bypass the cache.
+    """
+
+    def __init__(self, enabled=SEMANTIC_CACHE_ENABLED, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, dim=EMBEDDING_DIM):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dim = dim
+
+        self._vectors = None  # allocated on the first add
+        self._templates = [None] * max_entries
+        self._words = [None] * max_entries
+        self._size = 0
+        self._next = 0
+        self._pending = set()
+        self._seen = OrderedDict()  # questions that missed once, most recent last
+        self._lock = threading.Lock()
+        self._learner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='semantic-cache')
+
+        metrics.register_gauge('semantic_cache.hit_rate', self.hit_rate)
+        metrics.register_gauge('semantic_cache.entries', lambda: self._size if self.enabled else 'disabled')
+
+    def answer(self, message, context):
+        """Return a cached answer filled from ``context``, or None to ask the LLM"""
+        if not self.enabled:
+            return None
+        if not is_generic(message):
+            metrics.incr('semantic_cache.bypassed')
+            return None
+
+        with metrics.timed('semantic_cache.lookup'):
+            template, similarity = self.lookup(message)
+        if template is None:
+            metrics.incr('semantic_cache.misses')
+            return None
+        metrics.incr('semantic_cache.hits')
+        metrics.observe('semantic_cache.similarity', similarity)
+        figures = template_figures(context)
+        return PLACEHOLDER.sub(lambda match: figures[match.group(1)], template)
+
+    def lookup(self, message):
+        """Return ``(template, similarity)`` of the nearest question above the threshold"""
+        vector = embed(message, self.dim)
+        with self._lock:
+            if not self._size:
+                return None, 0.0
+            similarities = self._vectors[:self._size] @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            template, words = self._templates[best], self._words[best]
+        if similarity < self.threshold:
+            return None, similarity
+        if substituted(content_words(message), words):
+            metrics.incr('semantic_cache.topic_mismatches')
+            return None, similarity
+        return template, similarity
+
+    def learn(self, message, generate_template):
+        """Store a template for a generic question that missed before (no-op if disabled).
+
+        The first miss of a question is only remembered; on the second,
+        ``generate_template(message)`` is called in the background and
+        returns the placeholder answer or None.
+        """
+        if not self.enabled or not is_generic(message):
+            return
+        key = question_key(message)
+        with self._lock:
+            if self._seen.pop(key, None) is None:
+                self._seen[key] = True
+                if len(self._seen) > self.max_entries:
+                    self._seen.popitem(last=False)
+                return
+            if key in self._pending:
+                return
+            self._pending.add(key)
+
+        def run():
+            try:
+                # Another request may have taught a near-duplicate meanwhile
+                if self.lookup(message)[0] is not None:
+                    return
+                template = generate_template(message)
+                if template:
+                    self.add(message, template)
+            except Exception as e:
+                print(f"Semantic cache learn error: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+        self._learner.submit(run)
+
+    def add(self, message, template):
+        """Index ``template`` under ``message``, replacing the oldest entry when full"""
+        vector = embed(message, self.dim)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, self.dim), dtype=np.float32)
+            slot = self._next
+            self._vectors[slot] = vector
+            self._templates[slot] = template
+            self._words[slot] = content_words(message)
+            self._next = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+        metrics.incr('semantic_cache.learned')
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._next = 0
+            self._templates = [None] * self.max_entries
+            self._words = [None] * self.max_entries
+            self._seen.clear()
+
+    @staticmethod
+    def hit_rate():
+        hits = metrics.get_counter('semantic_cache.hits')
+        total = hits + metrics.get_counter('semantic_cache.misses')
+        return hits / total if total else 0.0
@@ -0,0 +1,76 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Response, stream_with_context
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder is used instead
+    orjson = None
+
+STREAM_BATCH_ROWS = 1000
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(data):
+    """Encode ``data`` as compact UTF-8 JSON bytes.
+
+    Uses orjson when installed, else the stdlib encoder. Either way
+    datetimes and dates become ISO 8601 strings, as ``isoformat()`` writes
+    them, so rows can be encoded straight from column values.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_default).encode()
+
+def json_value(value):
+    """A column value as ``to_dict`` returns it: datetimes as ISO 8601 strings"""
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+def columns(model, fields):
+    """The model columns named by ``fields``, for selecting rows as tuples"""
+    return [getattr(model, name) for name in fields]
+
+def row_dicts(rows, fields):
+    """Dicts keyed by ``fields`` from column tuples, lazily; no ORM objects are built"""
+    return (dict(zip(fields, row)) for row in rows)
+
+def json_response(data, status=200, headers=None):
+    """A JSON response encoded with ``dumps`` (in place of ``jsonify``)"""
+    return Response(dumps(data), status=status, headers=headers, mimetype='application/json')
+
+def iter_json_array(rows, batch_size=STREAM_BATCH_ROWS):
+    """Yield a JSON array of ``rows`` in chunks of ``batch_size`` encoded rows"""
+    yield b'['
+    separator = b''
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield separator + dumps(batch)[1:-1]
+            separator = b','
+            batch = []
+    if batch:
+        yield separator + dumps(batch)[1:-1]
+    yield b']'
+
+def stream_json(data, key, rows, status=200, headers=None):
+    """Respond with the object ``data`` plus ``rows`` under ``key``, sent as a chunked body.
+
+    ``rows`` may be lazy (e.g. ``row_dicts`` over a ``yield_per`` result):
+    it is consumed while the response is written, inside the request
+    context, so the whole list is never held in memory or encoded at once.
+    """
+    head = dumps(data)[:-1] + (b',' if data else b'') + dumps(key) + b':'
+
+    def generate():
+        yield head
+        yield from iter_json_array(rows)
+        yield b'}'
+    return Response(stream_with_context(generate()), status=status, headers=headers, mimetype='application/json')
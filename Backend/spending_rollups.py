@@ -0,0 +1,238 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, inspect, tuple_
+
+import metrics
+from money import from_minor, to_minor
+
+KEY_COLUMNS = ('user_id', 'account_id', 'day', 'category', 'credit_debit')
+
+class SpendingRollups:
+    """Daily spending totals per (user, account, day, category, credit/debit).
+
+    ``model`` has the key columns plus ``total``, ``count``, ``min_amount``,
+    ``max_amount`` and ``updated_at``; the amounts are Money columns, so
+    upserts add integer halalas in SQL. Rows are added in the session that
+    ingests transactions, so the rollup commits or rolls back with them;
+    re-labelled days are recomputed from the raw transactions. Days are UTC
+    dates, so "last 30 days" reads cover whole days.
+    """
+
+    def __init__(self, db, model, transaction_model, account_model):
+        self.db = db
+        self.model = model
+        self.transaction_model = transaction_model
+        self.account_model = account_model
+
+    def add(self, user_id, account_id, rows):
+        """Fold newly stored transactions (dicts or Transaction objects) into the rollup"""
+        groups = self._aggregate(
+            (user_id, account_id, _get(row, 'transaction_date'), _get(row, 'category'),
+             _get(row, 'credit_debit'), _get(row, 'amount'))
+            for row in rows
+        )
+        if groups:
+            self._upsert(groups)
+            metrics.incr('rollups.updated', len(groups))
+
+    def refresh_days(self, account_days):
+        """Recompute the rollup for ``(account_id, day or datetime)`` pairs from raw transactions.
+
+        Used after transactions are re-categorized, since a category's
+        min and max cannot be adjusted incrementally. The caller commits.
+        """
+        Transaction, Account, Rollup = self.transaction_model, self.account_model, self.model
+        days_by_account = defaultdict(set)
+        for account_id, day in account_days:
+            if day is not None:
+                days_by_account[account_id].add(_day(day))
+        if not days_by_account:
+            return
+
+        users = dict(
+            self.db.session.query(Account.id, Account.user_id)
+            .filter(Account.id.in_(days_by_account.keys())).all()
+        )
+
+        for account_id, days in days_by_account.items():
+            start = datetime.combine(min(days), datetime.min.time())
+            end = datetime.combine(max(days), datetime.min.time()) + timedelta(days=1)
+            rows = self.db.session.query(
+                Transaction.transaction_date, Transaction.category,
+                Transaction.credit_debit, Transaction.amount
+            ).filter(
+                Transaction.account_id == account_id,
+                Transaction.transaction_date >= start,
+                Transaction.transaction_date < end
+            )
+
+            groups = self._aggregate(
+                (users.get(account_id), account_id, date, category, credit_debit, amount)
+                for date, category, credit_debit, amount in rows
+                if _day(date) in days
+            )
+            Rollup.query.filter(
+                Rollup.account_id == account_id, Rollup.day.in_(days)
+            ).delete(synchronize_session=False)
+            if groups:
+                self._upsert(groups)
+
+        metrics.incr('rollups.refreshed_days', sum(len(days) for days in days_by_account.values()))
+
+    def rebuild(self, user_id=None):
+        """Rebuild the rollup from all raw transactions (for backfills); the caller commits"""
+        Transaction, Account, Rollup = self.transaction_model, self.account_model, self.model
+        accounts = Account.query
+        if user_id is not None:
+            accounts = accounts.filter_by(user_id=user_id)
+
+        for account in accounts.all():
+            Rollup.query.filter_by(account_id=account.id).delete(synchronize_session=False)
+            rows = self.db.session.query(
+                Transaction.transaction_date, Transaction.category,
+                Transaction.credit_debit, Transaction.amount
+            ).filter(Transaction.account_id == account.id).yield_per(1000)
+
+            groups = self._aggregate(
+                (account.user_id, account.id, date, category, credit_debit, amount)
+                for date, category, credit_debit, amount in rows
+            )
+            if groups:
+                self._upsert(groups)
+
+    def ensure_built(self):
+        """Backfill the rollup once for databases that predate it; commits"""
+        if self.model.query.first() is None and self.transaction_model.query.first() is not None:
+            self.rebuild()
+            self.db.session.commit()
+            print("Built spending rollups from existing transactions")
+
+    def by_category(self, user_id, since, credit_debit='Debit', account_id=None, until=None):
+        """Return ``[(category, total, count)]`` from ``since`` (a datetime or date) onwards.
+
+        ``since`` may be None for all history; ``until`` includes its whole day.
+        """
+        Rollup = self.model
+        return [
+            (category, float(total or 0), int(count or 0))
+            for category, total, count in self._filtered(
+                self.db.session.query(Rollup.category, func.sum(Rollup.total), func.sum(Rollup.count)),
+                user_id, since, credit_debit, account_id, until
+            ).group_by(Rollup.category).all()
+        ]
+
+    def total(self, user_id, since, credit_debit='Debit', category=None, account_id=None):
+        """Sum of amounts from ``since`` onwards, optionally for one category"""
+        Rollup = self.model
+        query = self._filtered(
+            self.db.session.query(func.sum(Rollup.total)), user_id, since, credit_debit, account_id
+        )
+        if category is not None:
+            query = query.filter(Rollup.category == category)
+        return float(query.scalar() or 0)
+
+    def count(self, user_id, since=None, until=None, credit_debit=None, category=None, account_id=None):
+        """Number of transactions on the days from ``since`` to ``until`` (both optional, whole days)"""
+        Rollup = self.model
+        query = self._filtered(
+            self.db.session.query(func.sum(Rollup.count)), user_id, since, credit_debit, account_id, until
+        )
+        if category is not None:
+            query = query.filter(Rollup.category == category)
+        return int(query.scalar() or 0)
+
+    def _filtered(self, query, user_id, since, credit_debit, account_id, until=None):
+        Rollup = self.model
+        query = query.filter(Rollup.user_id == user_id)
+        if since is not None:
+            query = query.filter(Rollup.day >= _day(since))
+        if until is not None:
+            query = query.filter(Rollup.day <= _day(until))
+        if credit_debit is not None:
+            query = query.filter(Rollup.credit_debit == credit_debit)
+        if account_id is not None:
+            query = query.filter(Rollup.account_id == account_id)
+        return query
+
+    @staticmethod
+    def _aggregate(entries):
+        """Group entries by rollup key; totals are kept in integer halalas"""
+        groups = {}
+        for user_id, account_id, date, category, credit_debit, amount in entries:
+            day = _day(date)
+            if day is None or amount is None:
+                continue
+            key = (user_id, account_id, day, category or 'Other', credit_debit or 'Debit')
+            amount = to_minor(amount)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [amount, 1, amount, amount]
+            else:
+                group[0] += amount
+                group[1] += 1
+                group[2] = min(group[2], amount)
+                group[3] = max(group[3], amount)
+        return groups
+
+    def _upsert(self, groups):
+        Rollup = self.model
+        now = datetime.utcnow()
+        values = [
+            {
+                **dict(zip(KEY_COLUMNS, key)),
+                'total': from_minor(total), 'count': count,
+                'min_amount': from_minor(low), 'max_amount': from_minor(high),
+                'updated_at': now
+            }
+            for key, (total, count, low, high) in groups.items()
+        ]
+
+        dialect = self.db.session.get_bind(mapper=inspect(Rollup)).dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+                least, greatest = func.min, func.max
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+                least, greatest = func.least, func.greatest
+            statement = insert(Rollup)
+            statement = statement.on_conflict_do_update(
+                index_elements=list(KEY_COLUMNS),
+                set_={
+                    'total': Rollup.total + statement.excluded.total,
+                    'count': Rollup.count + statement.excluded.count,
+                    'min_amount': least(Rollup.min_amount, statement.excluded.min_amount),
+                    'max_amount': greatest(Rollup.max_amount, statement.excluded.max_amount),
+                    'updated_at': statement.excluded.updated_at
+                }
+            )
+            self.db.session.execute(statement, values)
+            return
+
+        # Other databases: read the existing rows for these keys and update them
+        key_columns = [getattr(Rollup, column) for column in KEY_COLUMNS]
+        existing = {
+            tuple(getattr(row, column) for column in KEY_COLUMNS): row
+            for row in Rollup.query.filter(tuple_(*key_columns).in_(list(groups.keys()))).all()
+        }
+        for value in values:
+            row = existing.get(tuple(value[column] for column in KEY_COLUMNS))
+            if row is None:
+                self.db.session.add(Rollup(**value))
+            else:
+                row.total += value['total']
+                row.count += value['count']
+                row.min_amount = min(row.min_amount, value['min_amount'])
+                row.max_amount = max(row.max_amount, value['max_amount'])
+                row.updated_at = now
+
+def _get(row, name):
+    return row.get(name) if isinstance(row, dict) else getattr(row, name)
+
+def _day(value):
+    if not isinstance(value, datetime):
+        return value
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Background Sync Worker
+Runs queued sync jobs (Tarabut fetches and AI categorization) in a pool of
+worker processes, and periodically queues refreshes of stale accounts.
+
+Usage:
+    python sync_worker.py
+    python sync_worker.py --processes 8 --schedule-interval 120
+    python sync_worker.py --no-schedule
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+
+WORKER_PROCESSES = int(os.getenv('SYNC_WORKER_PROCESSES', '4'))
+SCHEDULE_INTERVAL = int(os.getenv('SYNC_SCHEDULE_INTERVAL', '300'))
+
+def _stop_on_signals():
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    return stop
+
+def worker_main(index):
+    """Entry point of one worker process"""
+    from app import app, job_queue, require_schema
+
+    stop = _stop_on_signals()
+    with app.app_context():
+        require_schema()
+        job_queue.work(worker_id=f"{socket.gethostname()}:{os.getpid()}:{index}", stop=stop)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background sync workers")
+    parser.add_argument('--processes', type=int, default=WORKER_PROCESSES)
+    parser.add_argument('--schedule-interval', type=int, default=SCHEDULE_INTERVAL,
+                        help='Seconds between scans for stale accounts')
+    parser.add_argument('--no-schedule', action='store_true', help='Only run queued jobs')
+    args = parser.parse_args()
+
+    # Jobs write money amounts: never run them against an unconverted database
+    from app import app, require_schema
+    with app.app_context():
+        try:
+            require_schema()
+        except RuntimeError as e:
+            raise SystemExit(f"{e} (python app.py or flask --app app migrate)")
+
+    # Spawned workers start clean: no inherited DB connections or token refresh timers
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=worker_main, args=(i,), daemon=True) for i in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    print(f"Started {len(workers)} sync workers")
+
+    stop = _stop_on_signals()
+    if args.no_schedule:
+        stop.wait()
+    else:
+        from app import job_queue, find_stale_accounts
+        from job_queue import schedule_stale
+
+        with app.app_context():
+            schedule_stale(job_queue, find_stale_accounts, 'sync_transactions', args.schedule_interval, stop)
+
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
+    print("Sync workers stopped")
+
+if __name__ == '__main__':
+    main()
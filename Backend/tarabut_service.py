@@ -1,7 +1,11 @@
-import requests
+import asyncio
 import os
 from datetime import datetime, timedelta
 import json
+from fanout import async_fan_out, fan_out
+from pagination import aiter_items, iter_items
+from http_transport import get_async_transport, get_transport
+from token_manager import get_token_manager
 
 class TarabutService:
     def __init__(self):
@@ -9,51 +13,89 @@ class TarabutService:
         self.token_url = "https://oauth.tarabutgateway.io/sandbox/token"
         self.client_id = os.getenv('TARABUT_CLIENT_ID')
         self.client_secret = os.getenv('TARABUT_CLIENT_SECRET')
-        self.access_token = None
-        
+        self.transport = get_transport('tarabut')
+        self.token_manager = get_token_manager(self.client_id, self.client_secret, self.token_url)
+
     def get_access_token(self):
-        """Get access token from Tarabut API"""
-        try:
-            payload = {
-                "clientId": self.client_id,
-                "clientSecret": self.client_secret,
-                "grantType": "client_credentials"
-            }
-            
-            headers = {
-                'Content-Type': 'application/json',
-                'X-TG-CustomerUserId': 'namaai-system'
-            }
-            
-            response = requests.post(self.token_url, json=payload, headers=headers)
-            
-            if response.status_code == 200:
-                token_data = response.json()
-                self.access_token = token_data.get('access_token')
-                return self.access_token
-            else:
-                print(f"Token error: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            print(f"Error getting token: {e}")
-            return None
+        """Get access token from Tarabut API (cached until shortly before expiry)"""
+        return self.token_manager.get_token()
+    
+    def _auth_headers(self, token):
+        return {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json'
+        }
     
     def get_headers(self):
         """Get headers with authorization token"""
-        if not self.access_token:
-            self.get_access_token()
-            
+        return self._auth_headers(self.get_access_token())
+    
+    @staticmethod
+    def _user_payload(user_data):
+        """Intent / consent dashboard payload for a user"""
         return {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
+            "user": {
+                "customerUserId": user_data['customerUserId'],
+                "firstName": user_data['firstName'],
+                "lastName": user_data['lastName'],
+                "email": user_data['email']
+            },
+            "redirectUrl": user_data.get('redirectUrl', 'https://namaai.app/callback')
         }
     
+    @staticmethod
+    def _booking_window(from_date=None, to_date=None):
+        """Booking date params, defaulting to the last 3 months"""
+        if not from_date:
+            from_date = datetime.now() - timedelta(days=90)
+        if not to_date:
+            to_date = datetime.now()
+        
+        return {
+            'fromBookingDateTime': from_date.isoformat() + 'Z',
+            'toBookingDateTime': to_date.isoformat() + 'Z'
+        }
+    
+    @staticmethod
+    def _categorization_payload(transactions, account_id, provider_id):
+        """Convert transactions to the format expected by Tarabut's categorization API"""
+        formatted_transactions = []
+        for trans in transactions:
+            formatted_trans = {
+                "transactionId": trans.get('transactionId', str(len(formatted_transactions) + 1)),
+                "transactionDescription": trans.get('description', ''),
+                "amount": {
+                    "value": trans.get('amount', 0),
+                    "currency": trans.get('currency', 'SAR')
+                },
+                "creditDebitIndicator": trans.get('creditDebitIndicator', 'Debit'),
+                "transactionDateTime": trans.get('transactionDateTime', datetime.now().isoformat() + 'Z')
+            }
+            formatted_transactions.append(formatted_trans)
+        
+        return {
+            "transactions": formatted_transactions,
+            "accountId": account_id,
+            "accountProductType": "account",
+            "providerId": provider_id
+        }
+    
+    def _request(self, method, path, **kwargs):
+        """Send an authorized request, retrying once with a new token on 401"""
+        url = f"{self.base_url}{path}"
+        token = self.get_access_token()
+        response = self.transport.request(method, url, headers=self._auth_headers(token), **kwargs)
+        
+        if response.status_code == 401:
+            self.token_manager.invalidate(token)
+            response = self.transport.request(method, url, headers=self.get_headers(), **kwargs)
+        
+        return response
+    
     def get_providers(self):
         """Get list of available bank providers"""
         try:
-            headers = self.get_headers()
-            response = requests.get(f"{self.base_url}/v1/providers", headers=headers)
+            response = self._request('GET', "/v1/providers")
             
             if response.status_code == 200:
                 return response.json()
@@ -68,22 +110,10 @@ class TarabutService:
     def create_intent(self, user_data):
         """Create intent for bank connection"""
         try:
-            headers = self.get_headers()
-            
-            payload = {
-                "user": {
-                    "customerUserId": user_data['customerUserId'],
-                    "firstName": user_data['firstName'],
-                    "lastName": user_data['lastName'],
-                    "email": user_data['email']
-                },
-                "redirectUrl": user_data.get('redirectUrl', 'https://namaai.app/callback')
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/accountInformation/v1/intent",
-                json=payload,
-                headers=headers
+            response = self._request(
+                'POST',
+                "/accountInformation/v1/intent",
+                json=self._user_payload(user_data)
             )
             
             if response.status_code == 200:
@@ -99,8 +129,7 @@ class TarabutService:
     def get_intent(self, intent_id):
         """Get intent details"""
         try:
-            headers = self.get_headers()
-            response = requests.get(f"{self.base_url}/accountInformation/v1/intent/{intent_id}", headers=headers)
+            response = self._request('GET', f"/accountInformation/v1/intent/{intent_id}")
             
             if response.status_code == 200:
                 return response.json()
@@ -115,8 +144,7 @@ class TarabutService:
     def get_accounts(self):
         """Get user accounts"""
         try:
-            headers = self.get_headers()
-            response = requests.get(f"{self.base_url}/accountInformation/v2/accounts", headers=headers)
+            response = self._request('GET', "/accountInformation/v2/accounts")
             
             if response.status_code == 200:
                 return response.json()
@@ -131,10 +159,9 @@ class TarabutService:
     def get_account_balance(self, account_id):
         """Get balance for specific account"""
         try:
-            headers = self.get_headers()
-            response = requests.get(
-                f"{self.base_url}/accountInformation/v2/accounts/{account_id}/balances",
-                headers=headers
+            response = self._request(
+                'GET',
+                f"/accountInformation/v2/accounts/{account_id}/balances"
             )
             
             if response.status_code == 200:
@@ -147,13 +174,26 @@ class TarabutService:
             print(f"Error getting balance: {e}")
             return None
     
+    def get_account_balances(self, account_ids, user_key=None):
+        """Fetch balances for several accounts concurrently.
+
+        Returns ``(balances, errors)`` keyed by account id; an account whose
+        balance could not be fetched appears only in ``errors``.
+        """
+        def fetch(account_id):
+            balance_data = self.get_account_balance(account_id)
+            if not balance_data:
+                raise RuntimeError('Failed to fetch balance')
+            return balance_data
+        
+        return fan_out(fetch, account_ids, user_key=user_key)
+    
     def refresh_account_balance(self, account_id):
         """Refresh balance for specific account"""
         try:
-            headers = self.get_headers()
-            response = requests.get(
-                f"{self.base_url}/accountInformation/v2/accounts/{account_id}/balances/refresh",
-                headers=headers
+            response = self._request(
+                'GET',
+                f"/accountInformation/v2/accounts/{account_id}/balances/refresh"
             )
             
             if response.status_code == 200:
@@ -169,23 +209,11 @@ class TarabutService:
     def get_account_transactions(self, account_id, from_date=None, to_date=None, page=1):
         """Get transactions for specific account"""
         try:
-            headers = self.get_headers()
-            
-            # Default to last 3 months if no dates provided
-            if not from_date:
-                from_date = datetime.now() - timedelta(days=90)
-            if not to_date:
-                to_date = datetime.now()
+            params = {**self._booking_window(from_date, to_date), 'page': page}
             
-            params = {
-                'fromBookingDateTime': from_date.isoformat() + 'Z',
-                'toBookingDateTime': to_date.isoformat() + 'Z',
-                'page': page
-            }
-            
-            response = requests.get(
-                f"{self.base_url}/accountInformation/v2/accounts/{account_id}/transactions",
-                headers=headers,
+            response = self._request(
+                'GET',
+                f"/accountInformation/v2/accounts/{account_id}/transactions",
                 params=params
             )
             
@@ -199,25 +227,25 @@ class TarabutService:
             print(f"Error getting transactions: {e}")
             return None
     
+    def iter_account_transactions(self, account_id, from_date=None, to_date=None, prefetch=True):
+        """Yield an account's transactions across all pages, prefetching the next page"""
+        # Fix the window once so every page is cut from the same range
+        from_date = from_date or datetime.now() - timedelta(days=90)
+        to_date = to_date or datetime.now()
+        
+        def fetch_page(page):
+            return self.get_account_transactions(account_id, from_date, to_date, page=page)
+        
+        return iter_items(fetch_page, prefetch=prefetch)
+    
     def get_account_raw_transactions(self, account_id, from_date=None, to_date=None):
         """Get raw transactions for specific account"""
         try:
-            headers = self.get_headers()
-            
-            # Default to last 3 months if no dates provided
-            if not from_date:
-                from_date = datetime.now() - timedelta(days=90)
-            if not to_date:
-                to_date = datetime.now()
-            
-            params = {
-                'fromBookingDateTime': from_date.isoformat() + 'Z',
-                'toBookingDateTime': to_date.isoformat() + 'Z'
-            }
+            params = self._booking_window(from_date, to_date)
             
-            response = requests.get(
-                f"{self.base_url}/accountInformation/v2/accounts/{account_id}/rawtransactions",
-                headers=headers,
+            response = self._request(
+                'GET',
+                f"/accountInformation/v2/accounts/{account_id}/rawtransactions",
                 params=params
             )
             
@@ -234,10 +262,9 @@ class TarabutService:
     def refresh_account_transactions(self, account_id):
         """Refresh transactions for specific account"""
         try:
-            headers = self.get_headers()
-            response = requests.get(
-                f"{self.base_url}/accountInformation/v2/accounts/{account_id}/rawtransactions/refresh",
-                headers=headers
+            response = self._request(
+                'GET',
+                f"/accountInformation/v2/accounts/{account_id}/rawtransactions/refresh"
             )
             
             if response.status_code == 200:
@@ -253,34 +280,10 @@ class TarabutService:
     def categorize_transactions(self, transactions, account_id, provider_id):
         """Categorize transactions using Tarabut's categorization API"""
         try:
-            headers = self.get_headers()
-            
-            # Convert transactions to the format expected by Tarabut API
-            formatted_transactions = []
-            for trans in transactions:
-                formatted_trans = {
-                    "transactionId": trans.get('transactionId', str(len(formatted_transactions) + 1)),
-                    "transactionDescription": trans.get('description', ''),
-                    "amount": {
-                        "value": trans.get('amount', 0),
-                        "currency": trans.get('currency', 'SAR')
-                    },
-                    "creditDebitIndicator": trans.get('creditDebitIndicator', 'Debit'),
-                    "transactionDateTime": trans.get('transactionDateTime', datetime.now().isoformat() + 'Z')
-                }
-                formatted_transactions.append(formatted_trans)
-            
-            payload = {
-                "transactions": formatted_transactions,
-                "accountId": account_id,
-                "accountProductType": "account",
-                "providerId": provider_id
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/ingest/v1/categorise-transactions",
-                json=payload,
-                headers=headers
+            response = self._request(
+                'POST',
+                "/ingest/v1/categorise-transactions",
+                json=self._categorization_payload(transactions, account_id, provider_id)
             )
             
             if response.status_code == 200:
@@ -296,12 +299,11 @@ class TarabutService:
     def get_salary_insights(self, months=3):
         """Get salary insights"""
         try:
-            headers = self.get_headers()
             params = {'months': months}
             
-            response = requests.get(
-                f"{self.base_url}/insights/v1/salary",
-                headers=headers,
+            response = self._request(
+                'GET',
+                "/insights/v1/salary",
                 params=params
             )
             
@@ -318,15 +320,14 @@ class TarabutService:
     def get_income_insights(self, months=3, detailed=False):
         """Get income insights"""
         try:
-            headers = self.get_headers()
             params = {'months': months}
             
             # For KSA, the endpoint is different from Bahrain
             endpoint = "/insights/v1/income/details" if detailed else "/insights/v1/income"
             
-            response = requests.get(
-                f"{self.base_url}{endpoint}",
-                headers=headers,
+            response = self._request(
+                'GET',
+                f"{endpoint}",
                 params=params
             )
             
@@ -343,17 +344,15 @@ class TarabutService:
     def verify_account(self, iban, identifier):
         """Verify account with IBAN and identifier (KSA specific)"""
         try:
-            headers = self.get_headers()
-            
             payload = {
                 "iban": iban,
                 "identifier": identifier
             }
             
-            response = requests.post(
-                f"{self.base_url}/accountverification/v1/verify",
-                json=payload,
-                headers=headers
+            response = self._request(
+                'POST',
+                "/accountverification/v1/verify",
+                json=payload
             )
             
             if response.status_code == 200:
@@ -369,16 +368,14 @@ class TarabutService:
     def match_identifier(self, identifier):
         """Match IBAN identifier"""
         try:
-            headers = self.get_headers()
-            
             payload = {
                 "identifier": identifier
             }
             
-            response = requests.post(
-                f"{self.base_url}/accountVerification/v1/matchIdentifier",
-                json=payload,
-                headers=headers
+            response = self._request(
+                'POST',
+                "/accountVerification/v1/matchIdentifier",
+                json=payload
             )
             
             if response.status_code == 200:
@@ -394,22 +391,10 @@ class TarabutService:
     def create_consent_dashboard(self, user_data):
         """Create consent dashboard"""
         try:
-            headers = self.get_headers()
-            
-            payload = {
-                "user": {
-                    "customerUserId": user_data['customerUserId'],
-                    "firstName": user_data['firstName'],
-                    "lastName": user_data['lastName'],
-                    "email": user_data['email']
-                },
-                "redirectUrl": user_data.get('redirectUrl', 'https://namaai.app/callback')
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/consentInformation/v1/dashboard",
-                json=payload,
-                headers=headers
+            response = self._request(
+                'POST',
+                "/consentInformation/v1/dashboard",
+                json=self._user_payload(user_data)
             )
             
             if response.status_code == 200:
@@ -425,8 +410,7 @@ class TarabutService:
     def get_all_consents(self):
         """Get all consents"""
         try:
-            headers = self.get_headers()
-            response = requests.get(f"{self.base_url}/consentInformation/v1/consents", headers=headers)
+            response = self._request('GET', "/consentInformation/v1/consents")
             
             if response.status_code == 200:
                 return response.json()
@@ -441,8 +425,7 @@ class TarabutService:
     def get_consent_details(self, consent_id):
         """Get consent details"""
         try:
-            headers = self.get_headers()
-            response = requests.get(f"{self.base_url}/consentInformation/v1/consents/{consent_id}", headers=headers)
+            response = self._request('GET', f"/consentInformation/v1/consents/{consent_id}")
             
             if response.status_code == 200:
                 return response.json()
@@ -457,8 +440,7 @@ class TarabutService:
     def revoke_consent(self, consent_id):
         """Revoke consent"""
         try:
-            headers = self.get_headers()
-            response = requests.delete(f"{self.base_url}/consentInformation/v1/consents/{consent_id}", headers=headers)
+            response = self._request('DELETE', f"/consentInformation/v1/consents/{consent_id}")
             
             if response.status_code == 200:
                 return response.json()
@@ -468,4 +450,202 @@ class TarabutService:
                 
         except Exception as e:
             print(f"Error revoking consent: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+class AsyncTarabutService(TarabutService):
+    """TarabutService with coroutine methods, for the service loop.
+
+    Same method names, arguments and return values, awaited instead of
+    called. Requests go through the event loop's AsyncHTTPTransport, so
+    concurrent calls need no threads; the token is shared with the sync
+    service.
+    """
+    
+    @property
+    def async_transport(self):
+        return get_async_transport('tarabut')
+    
+    async def get_access_token(self):
+        """Get access token (a fresh one is served from memory; only a refresh uses a thread)"""
+        return self.token_manager.peek() or await asyncio.to_thread(self.token_manager.get_token)
+    
+    async def get_headers(self):
+        """Get headers with authorization token"""
+        return self._auth_headers(await self.get_access_token())
+    
+    async def _request(self, method, path, **kwargs):
+        """Send an authorized request, retrying once with a new token on 401"""
+        url = f"{self.base_url}{path}"
+        token = await self.get_access_token()
+        response = await self.async_transport.request(method, url, headers=self._auth_headers(token), **kwargs)
+        
+        if response.status_code == 401:
+            self.token_manager.invalidate(token)
+            response = await self.async_transport.request(method, url, headers=await self.get_headers(), **kwargs)
+        
+        return response
+    
+    async def _fetch_json(self, error_label, action, method, path, **kwargs):
+        """Return the decoded 200 response, or None after logging the failure"""
+        try:
+            response = await self._request(method, path, **kwargs)
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                print(f"{error_label} error: {response.status_code} - {response.text}")
+                return None
+                
+        except Exception as e:
+            print(f"Error {action}: {e}")
+            return None
+    
+    async def get_providers(self):
+        """Get list of available bank providers"""
+        return await self._fetch_json('Providers', 'getting providers', 'GET', "/v1/providers")
+    
+    async def create_intent(self, user_data):
+        """Create intent for bank connection"""
+        try:
+            payload = self._user_payload(user_data)
+        except Exception as e:
+            print(f"Error creating intent: {e}")
+            return None
+        return await self._fetch_json(
+            'Intent creation', 'creating intent', 'POST', "/accountInformation/v1/intent", json=payload
+        )
+    
+    async def get_intent(self, intent_id):
+        """Get intent details"""
+        return await self._fetch_json(
+            'Get intent', 'getting intent', 'GET', f"/accountInformation/v1/intent/{intent_id}"
+        )
+    
+    async def get_accounts(self):
+        """Get user accounts"""
+        return await self._fetch_json('Accounts', 'getting accounts', 'GET', "/accountInformation/v2/accounts")
+    
+    async def get_account_balance(self, account_id):
+        """Get balance for specific account"""
+        return await self._fetch_json(
+            'Balance', 'getting balance', 'GET', f"/accountInformation/v2/accounts/{account_id}/balances"
+        )
+    
+    async def get_account_balances(self, account_ids, user_key=None):
+        """Fetch balances for several accounts concurrently; returns ``(balances, errors)``"""
+        async def fetch(account_id):
+            balance_data = await self.get_account_balance(account_id)
+            if not balance_data:
+                raise RuntimeError('Failed to fetch balance')
+            return balance_data
+        
+        return await async_fan_out(fetch, account_ids, user_key=user_key)
+    
+    async def refresh_account_balance(self, account_id):
+        """Refresh balance for specific account"""
+        return await self._fetch_json(
+            'Refresh balance', 'refreshing balance',
+            'GET', f"/accountInformation/v2/accounts/{account_id}/balances/refresh"
+        )
+    
+    async def get_account_transactions(self, account_id, from_date=None, to_date=None, page=1):
+        """Get transactions for specific account"""
+        params = {**self._booking_window(from_date, to_date), 'page': page}
+        return await self._fetch_json(
+            'Transactions', 'getting transactions',
+            'GET', f"/accountInformation/v2/accounts/{account_id}/transactions", params=params
+        )
+    
+    def iter_account_transactions(self, account_id, from_date=None, to_date=None, prefetch=True):
+        """Async iterator over an account's transactions across all pages, prefetching the next page"""
+        from_date = from_date or datetime.now() - timedelta(days=90)
+        to_date = to_date or datetime.now()
+        
+        def fetch_page(page):
+            return self.get_account_transactions(account_id, from_date, to_date, page=page)
+        
+        return aiter_items(fetch_page, prefetch=prefetch)
+    
+    async def get_account_raw_transactions(self, account_id, from_date=None, to_date=None):
+        """Get raw transactions for specific account"""
+        return await self._fetch_json(
+            'Raw transactions', 'getting raw transactions',
+            'GET', f"/accountInformation/v2/accounts/{account_id}/rawtransactions",
+            params=self._booking_window(from_date, to_date)
+        )
+    
+    async def refresh_account_transactions(self, account_id):
+        """Refresh transactions for specific account"""
+        return await self._fetch_json(
+            'Refresh transactions', 'refreshing transactions',
+            'GET', f"/accountInformation/v2/accounts/{account_id}/rawtransactions/refresh"
+        )
+    
+    async def categorize_transactions(self, transactions, account_id, provider_id):
+        """Categorize transactions using Tarabut's categorization API"""
+        try:
+            payload = self._categorization_payload(transactions, account_id, provider_id)
+        except Exception as e:
+            print(f"Error categorizing transactions: {e}")
+            return None
+        return await self._fetch_json(
+            'Categorization', 'categorizing transactions',
+            'POST', "/ingest/v1/categorise-transactions", json=payload
+        )
+    
+    async def get_salary_insights(self, months=3):
+        """Get salary insights"""
+        return await self._fetch_json(
+            'Salary insights', 'getting salary insights', 'GET', "/insights/v1/salary", params={'months': months}
+        )
+    
+    async def get_income_insights(self, months=3, detailed=False):
+        """Get income insights"""
+        endpoint = "/insights/v1/income/details" if detailed else "/insights/v1/income"
+        return await self._fetch_json(
+            'Income insights', 'getting income insights', 'GET', endpoint, params={'months': months}
+        )
+    
+    async def verify_account(self, iban, identifier):
+        """Verify account with IBAN and identifier (KSA specific)"""
+        return await self._fetch_json(
+            'Account verification', 'verifying account',
+            'POST', "/accountverification/v1/verify", json={"iban": iban, "identifier": identifier}
+        )
+    
+    async def match_identifier(self, identifier):
+        """Match IBAN identifier"""
+        return await self._fetch_json(
+            'IBAN match', 'matching identifier',
+            'POST', "/accountVerification/v1/matchIdentifier", json={"identifier": identifier}
+        )
+    
+    async def create_consent_dashboard(self, user_data):
+        """Create consent dashboard"""
+        try:
+            payload = self._user_payload(user_data)
+        except Exception as e:
+            print(f"Error creating consent dashboard: {e}")
+            return None
+        return await self._fetch_json(
+            'Consent dashboard', 'creating consent dashboard',
+            'POST', "/consentInformation/v1/dashboard", json=payload
+        )
+    
+    async def get_all_consents(self):
+        """Get all consents"""
+        return await self._fetch_json('Get consents', 'getting consents', 'GET', "/consentInformation/v1/consents")
+    
+    async def get_consent_details(self, consent_id):
+        """Get consent details"""
+        return await self._fetch_json(
+            'Get consent details', 'getting consent details',
+            'GET', f"/consentInformation/v1/consents/{consent_id}"
+        )
+    
+    async def revoke_consent(self, consent_id):
+        """Revoke consent"""
+        return await self._fetch_json(
+            'Revoke consent', 'revoking consent', 'DELETE', f"/consentInformation/v1/consents/{consent_id}"
+        )
@@ -0,0 +1,141 @@
+import threading
+import time
+from http_transport import get_transport
+
+# Refresh this many seconds before the token actually expires
+DEFAULT_REFRESH_MARGIN = 60
+# ...but never earlier than this share of a short-lived token's lifetime
+MAX_MARGIN_FRACTION = 0.5
+# Used when the token endpoint does not return expires_in
+DEFAULT_EXPIRES_IN = 3600
+# Wait before retrying a failed background refresh
+FAILED_REFRESH_RETRY = 15
+
+class TarabutTokenManager:
+    """Caches a Tarabut client-credentials token and refreshes it ahead of expiry.
+
+    Only one refresh runs at a time; concurrent callers wait for it and reuse
+    the result instead of each POSTing to the token endpoint.
+    """
+
+    def __init__(self, client_id, client_secret, token_url,
+                 customer_user_id='namaai-system', refresh_margin=DEFAULT_REFRESH_MARGIN,
+                 background_refresh=True):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.customer_user_id = customer_user_id
+        self.refresh_margin = refresh_margin
+        self.background_refresh = background_refresh
+
+        self._lock = threading.Lock()
+        self._token = None
+        self._refresh_at = 0.0
+        self._timer = None
+
+    def _is_fresh(self):
+        return self._token is not None and time.monotonic() < self._refresh_at
+
+    def get_token(self):
+        """Return a valid access token, fetching a new one only when needed"""
+        if self._is_fresh():
+            return self._token
+
+        with self._lock:
+            # Another thread may have refreshed while we were waiting
+            if self._is_fresh():
+                return self._token
+            return self._refresh_locked()
+
+    def peek(self):
+        """Return the cached token if it is fresh, else None; never blocks or fetches"""
+        return self._token if self._is_fresh() else None
+
+    def invalidate(self, token=None):
+        """Drop the cached token, e.g. after the API answered 401.
+
+        If ``token`` is given, only invalidate when it is still the cached one,
+        so a token refreshed by another thread is not thrown away.
+        """
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._refresh_at = 0.0
+
+    def _refresh_locked(self):
+        """Fetch a new token. Caller must hold ``self._lock``."""
+        token, expires_in = self._fetch_token()
+        if not token:
+            return None
+
+        # A token living no longer than the margin would never count as fresh
+        margin = min(self.refresh_margin, expires_in * MAX_MARGIN_FRACTION)
+        self._token = token
+        self._refresh_at = time.monotonic() + expires_in - margin
+        self._schedule_refresh(expires_in - margin)
+        return token
+
+    def _fetch_token(self):
+        if not self.client_id or not self.client_secret:
+            print("Missing Tarabut credentials in environment variables")
+            return None, 0
+
+        try:
+            payload = {
+                "clientId": self.client_id,
+                "clientSecret": self.client_secret,
+                "grantType": "client_credentials"
+            }
+
+            headers = {
+                'Content-Type': 'application/json',
+                'X-TG-CustomerUserId': self.customer_user_id
+            }
+
+            response = get_transport('tarabut').post(self.token_url, json=payload, headers=headers)
+
+            if response.status_code == 200:
+                token_data = response.json()
+                expires_in = token_data.get('expires_in') or DEFAULT_EXPIRES_IN
+                return token_data.get('access_token'), float(expires_in)
+            else:
+                print(f"Token error: {response.status_code} - {response.text}")
+                return None, 0
+
+        except Exception as e:
+            print(f"Error getting token: {e}")
+            return None, 0
+
+    def _schedule_refresh(self, delay):
+        if not self.background_refresh:
+            return
+
+        if self._timer:
+            self._timer.cancel()
+
+        self._timer = threading.Timer(max(delay, 1), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        with self._lock:
+            if self._refresh_locked() is None and self._token is not None:
+                # Keep serving the old token while it lasts and try again soon
+                self._schedule_refresh(FAILED_REFRESH_RETRY)
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_token_manager(client_id, client_secret, token_url, customer_user_id='namaai-system'):
+    """Return the process-wide token manager for these credentials"""
+    key = (token_url, client_id, customer_user_id)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = TarabutTokenManager(
+                client_id, client_secret, token_url,
+                customer_user_id=customer_user_id
+            )
+            _managers[key] = manager
+        return manager
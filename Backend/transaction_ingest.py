@@ -0,0 +1,288 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from itertools import islice
+
+from sqlalchemy import func, inspect, select, text
+
+import metrics
+
+CHUNK_SIZE = 500
+FULL_SYNC_DAYS = 90
+# Re-fetch this far behind the cursor to pick up late-posted bookings
+SYNC_OVERLAP = timedelta(hours=float(os.getenv('SYNC_OVERLAP_HOURS', '72')))
+
+def parse_transaction(trans_data):
+    """Map a Tarabut transaction to Transaction column values"""
+    amount = trans_data.get('amount', {})
+    return {
+        'transaction_id': trans_data.get('transactionId'),
+        'description': trans_data.get('transactionDescription', ''),
+        'amount': float(amount.get('value', 0)),
+        'currency': amount.get('currency', 'SAR'),
+        'credit_debit': trans_data.get('creditDebitIndicator'),
+        'transaction_date': datetime.fromisoformat(
+            trans_data.get('transactionDateTime', '').replace('Z', '+00:00')
+        )
+    }
+
+def existing_transactions(db, model, account_id, transaction_ids, chunk_size=CHUNK_SIZE):
+    """Return ``{transaction_id: (category, merchant)}`` for ids already stored.
+
+    One query per ``chunk_size`` ids, instead of one per transaction.
+    """
+    transaction_ids = list({tid for tid in transaction_ids if tid})
+    found = {}
+    for start in range(0, len(transaction_ids), chunk_size):
+        rows = db.session.execute(
+            select(model.transaction_id, model.category, model.merchant).where(
+                model.account_id == account_id,
+                model.transaction_id.in_(transaction_ids[start:start + chunk_size])
+            )
+        )
+        for transaction_id, category, merchant in rows:
+            found[transaction_id] = (category, merchant)
+    return found
+
+def ingest_transactions(db, model, account_id, transactions, categorize=None,
+                        existing=None, chunk_size=CHUNK_SIZE, user_id=None):
+    """Insert the transactions not yet stored for an account.
+
+    ``transactions`` are Tarabut transaction dicts. ``user_id`` is the
+    account owner, stored on each row for per-user reads. Only new ones are passed
+    to ``categorize`` (items with id, description, amount and currency;
+    results keyed by ``str(id)``). Rows are inserted in chunks with an
+    executemany that skips (account_id, transaction_id) conflicts, so
+    concurrent or repeated syncs are idempotent. The caller commits once.
+
+    Returns the inserted rows as dicts.
+    """
+    if existing is None:
+        existing = existing_transactions(
+            db, model, account_id, (t.get('transactionId') for t in transactions), chunk_size
+        )
+
+    rows = []
+    seen = set(existing)
+    for trans_data in transactions:
+        transaction_id = trans_data.get('transactionId')
+        if not transaction_id or transaction_id in seen:
+            continue
+        seen.add(transaction_id)
+        rows.append(parse_transaction(trans_data))
+
+    metrics.incr('ingest.skipped', len(transactions) - len(rows))
+    if not rows:
+        return []
+
+    categories = categorize([
+        {
+            'id': index,
+            'description': row['description'],
+            'amount': row['amount'],
+            'currency': row['currency']
+        }
+        for index, row in enumerate(rows)
+    ]) if categorize else {}
+
+    columns = set(model.__table__.columns.keys())
+    for index, row in enumerate(rows):
+        result = categories.get(str(index), {})
+        row['account_id'] = account_id
+        if 'user_id' in columns:
+            row['user_id'] = user_id
+        row['category'] = result.get('category')
+        row['merchant'] = result.get('merchant')
+        if 'confidence_score' in columns:
+            row['confidence_score'] = result.get('confidence', 0.0)
+
+    statement = _insert_ignoring_conflicts(db, model)
+    with metrics.timed('ingest.insert'):
+        if statement is not None:
+            # RETURNING reports only the rows actually inserted, so a concurrent
+            # sync that stored some of them first is not counted twice
+            inserted_ids = set()
+            for start in range(0, len(rows), chunk_size):
+                inserted_ids.update(db.session.scalars(
+                    statement.returning(model.transaction_id), rows[start:start + chunk_size]
+                ))
+            rows = [row for row in rows if row['transaction_id'] in inserted_ids]
+        else:
+            for start in range(0, len(rows), chunk_size):
+                db.session.bulk_insert_mappings(model, rows[start:start + chunk_size])
+
+    metrics.incr('ingest.inserted', len(rows))
+    return rows
+
+def ingest_stream(db, model, account_id, transactions, categorize=None,
+                  chunk_size=CHUNK_SIZE, on_chunk=None, user_id=None):
+    """Ingest an iterable of transactions in fixed-size chunks.
+
+    Only ``chunk_size`` transactions are held at a time, however long the
+    history. ``on_chunk(rows)`` is called with each chunk's new rows.
+    Returns the number of new rows; the caller commits once.
+    """
+    transactions = iter(transactions)
+    inserted = 0
+    while True:
+        chunk = list(islice(transactions, chunk_size))
+        if not chunk:
+            return inserted
+        rows = ingest_transactions(
+            db, model, account_id, chunk, categorize=categorize, chunk_size=chunk_size, user_id=user_id
+        )
+        inserted += len(rows)
+        if on_chunk:
+            on_chunk(rows)
+
+def sync_window(account, full=False, now=None):
+    """Return the ``(from_date, to_date)`` booking window to fetch for an account.
+
+    Incremental syncs start ``SYNC_OVERLAP`` before the account's cursor;
+    a full sync (or an account that was never synced) fetches the last
+    ``FULL_SYNC_DAYS`` days. Dates are naive UTC.
+    """
+    now = now or datetime.utcnow()
+    if full or account.sync_cursor_date is None:
+        return now - timedelta(days=FULL_SYNC_DAYS), now
+    return min(account.sync_cursor_date - SYNC_OVERLAP, now), now
+
+def advance_cursor(account, rows, synced_at=None):
+    """Move the account's cursor to the latest booking among ``rows``"""
+    account.last_synced_at = synced_at or datetime.utcnow()
+
+    dates = [_as_utc(row['transaction_date']) for row in rows if row.get('transaction_date')]
+    if not dates:
+        return
+    latest_date = max(dates)
+    if account.sync_cursor_date is None or latest_date > account.sync_cursor_date:
+        account.sync_cursor_date = latest_date
+
+def remove_duplicate_transactions(db, model):
+    """Delete all but the oldest row of each (account_id, transaction_id) pair.
+
+    Earlier versions could store the same transaction twice. Only runs while
+    the table lacks its unique index, so it must come before anything that
+    recreates indexes (e.g. ``ensure_minor_units`` on SQLite). Returns the
+    number of rows removed.
+    """
+    index = _account_transaction_index(model)
+    if index is None or not inspect(db.engine).has_table(model.__tablename__):
+        return 0
+    existing = {i['name'] for i in inspect(db.engine).get_indexes(model.__tablename__)}
+    if index.name in existing:
+        return 0
+
+    table = model.__table__
+    keep = select(func.min(table.c.id)).group_by(table.c.account_id, table.c.transaction_id)
+    with db.engine.begin() as connection:
+        removed = connection.execute(table.delete().where(table.c.id.not_in(keep))).rowcount
+
+    if removed:
+        print(f"Removed {removed} duplicate transactions from {model.__tablename__}")
+    return removed
+
+def ensure_unique_index(db, model):
+    """Add the (account_id, transaction_id) unique index to an existing table.
+
+    ``create_all`` does not alter tables that already exist; duplicates are
+    removed with ``remove_duplicate_transactions`` before the index is created.
+    """
+    index = _account_transaction_index(model)
+    if index is None:
+        return
+
+    existing = {i['name'] for i in inspect(db.engine).get_indexes(model.__tablename__)}
+    if index.name in existing:
+        return
+
+    remove_duplicate_transactions(db, model)
+    index.create(db.engine)
+
+def ensure_user_column(db, model, account_model):
+    """Add and backfill the denormalised ``user_id`` on an existing transactions table.
+
+    Rows stored before the column existed, or by an older process, get the
+    owner of their account. Safe to run on every start.
+    """
+    engine = db.engine
+    table, accounts = model.__table__, account_model.__table__
+    columns = {column['name'] for column in inspect(engine).get_columns(table.name)}
+    preparer = engine.dialect.identifier_preparer
+    quoted, owners = preparer.format_table(table), preparer.format_table(accounts)
+    with engine.begin() as connection:
+        if 'user_id' not in columns:
+            connection.execute(text(f'ALTER TABLE {quoted} ADD COLUMN user_id INTEGER'))
+        # Plain SQL: an ORM update would also fire onupdate columns
+        backfilled = connection.execute(text(
+            f'UPDATE {quoted} SET user_id = (SELECT {owners}.user_id FROM {owners} '
+            f'WHERE {owners}.id = {quoted}.account_id) WHERE user_id IS NULL'
+        )).rowcount
+
+    if backfilled:
+        print(f"Set user_id on {backfilled} transactions in {table.name}")
+
+def ensure_columns(db, model, *names):
+    """Add the declared columns ``names`` that an existing table of ``model`` lacks.
+
+    ``create_all`` does not alter tables that already exist. Each missing
+    column is added nullable, and existing rows get its scalar default, if it
+    has one. Safe to run on every start.
+    """
+    engine = db.engine
+    table = model.__table__
+    existing = {column['name'] for column in inspect(engine).get_columns(table.name)}
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        for name in names:
+            if name in existing:
+                continue
+            column = table.c[name]
+            connection.execute(text(
+                f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.quote(name)} '
+                f'{column.type.compile(dialect=engine.dialect)}'
+            ))
+            if column.default is not None and column.default.is_scalar:
+                # Plain SQL: an ORM update would also fire onupdate columns
+                connection.execute(
+                    text(f'UPDATE {preparer.format_table(table)} SET {preparer.quote(name)} = :value'),
+                    {'value': column.default.arg}
+                )
+            print(f"Added column {name} to {table.name}")
+
+def ensure_indexes(db, *models):
+    """Create declared non-unique indexes missing from existing tables.
+
+    ``create_all`` only creates indexes along with new tables. Unique
+    indexes are left to ``ensure_unique_index``, which removes duplicates first.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    for model in models:
+        existing = {index['name'] for index in inspector.get_indexes(model.__tablename__)}
+        for index in model.__table__.indexes:
+            if not index.unique and index.name not in existing:
+                index.create(engine)
+                print(f"Created index {index.name}")
+
+def _account_transaction_index(model):
+    return next(
+        (index for index in model.__table__.indexes
+         if index.unique and [c.name for c in index.columns] == ['account_id', 'transaction_id']),
+        None
+    )
+
+def _as_utc(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _insert_ignoring_conflicts(db, model):
+    dialect = db.session.get_bind(mapper=inspect(model)).dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model).on_conflict_do_nothing(index_elements=['account_id', 'transaction_id'])
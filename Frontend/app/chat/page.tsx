@@ -2,7 +2,6 @@
 
 import { useState, useEffect, useRef } from 'react'
 import { useRouter } from 'next/navigation'
-import axios from 'axios'
 import Cookies from 'js-cookie'
 import { Send, ArrowLeft, Bot, User, TrendingUp, PieChart, DollarSign } from 'lucide-react'
 import Link from 'next/link'
@@ -70,19 +69,63 @@ export default function ChatPage() {
     setIsLoading(true)
 
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/chat/send`, {
-        userId,
-        message: userMessage.content,
-        sessionId
+      const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          userId,
+          message: userMessage.content,
+          sessionId
+        })
       })
+      if (!response.ok || !response.body) {
+        throw new Error(`Chat request failed: ${response.status}`)
+      }
 
-      const aiMessage: Message = {
-        role: 'assistant',
-        content: response.data.response,
-        timestamp: new Date().toISOString()
+      // Render the reply as it streams in: each SSE event is separated by a blank line
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      let started = false
+
+      const appendToReply = (text: string) => {
+        if (!started) {
+          started = true
+          setIsLoading(false)
+          setMessages(prev => [...prev, { role: 'assistant', content: text, timestamp: new Date().toISOString() }])
+          return
+        }
+        setMessages(prev => {
+          const last = prev[prev.length - 1]
+          return [...prev.slice(0, -1), { ...last, content: last.content + text }]
+        })
+      }
+
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        let boundary
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const rawEvent = buffer.slice(0, boundary)
+          buffer = buffer.slice(boundary + 2)
+
+          let event = 'message'
+          let data = ''
+          for (const line of rawEvent.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7)
+            else if (line.startsWith('data: ')) data += line.slice(6)
+          }
+          if (!data) continue
+
+          const payload = JSON.parse(data)
+          if (event === 'error') throw new Error(payload.error)
+          if (event === 'message' && payload.delta) appendToReply(payload.delta)
+        }
       }
 
-      setMessages(prev => [...prev, aiMessage])
+      if (!started) throw new Error('Empty response')
     } catch (error: any) {
       const errorMessage: Message = {
         role: 'assistant',
@@ -67,7 +67,7 @@ export default function HomePage() {
   const loadDashboardData = async (userId: string) => {
     try {
       setIsLoading(true)
-      const response = await axios.get(`${API_BASE_URL}/api/insights/dashboard/${userId}`)
+      const response = await axios.get(`${API_BASE_URL}/api/insights/dashboard/${userId}/summary`)
       setDashboardData(response.data)
       
       if (response.data.accounts.length > 0 && !selectedAccount) {
@@ -58,7 +58,7 @@ export default function ProfilePage() {
   const loadUserData = async (userId: string) => {
     try {
       setIsLoading(true)
-      const response = await axios.get(`${API_BASE_URL}/api/insights/dashboard/${userId}`)
+      const response = await axios.get(`${API_BASE_URL}/api/insights/dashboard/${userId}/summary`)
       setUserData(response.data)
     } catch (error) {
       console.error('Failed to load user data:', error)